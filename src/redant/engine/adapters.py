@@ -2,7 +2,7 @@
 
 from abc import abstractproperty, abstractmethod
 from redant.engine import EngineBase
-from redant.models.channels import ChannelEntity
+from redant.models.channels import channel_registry
 
 class MessageConverter(EngineBase):
     #
@@ -42,8 +42,8 @@ class MessagePublisher(EngineBase):
     #
     #
     def _load_channels(self, channel_type=None):
-        channels = ChannelEntity.find_all(channel_type=channel_type)
-        return channels
+        # the enabled channels (Channel records) of the in-process registry
+        return channel_registry.find_all(channel_type=channel_type)
     #
     #
     @abstractmethod
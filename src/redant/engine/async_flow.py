@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import asyncio
+import inspect
+
+from functools import partial
+from redant.engine.flow import Conversation, SILENT_MESSAGE
+from redant.utils.database import sqldb as db
+from redant.utils.logging import getLogger, LogLevel as LL
+
+LOG = getLogger(__name__)
+
+
+class AsyncConversation(Conversation):
+    #
+    # the asyncio variant of Conversation: it uses the same Descriptor, the reply/help handlers,
+    # the transition callbacks and the _help/_force_quit/_cancellation_* hooks may be coroutines.
+    # The database is only touched by open() and at the end of a turn, both run in an executor
+    # with their own session, so the event loop never blocks on it and the persist object stays
+    # detached (and fully loaded) while the handlers are awaited.
+    #
+    __flow = None
+    __executor = None
+    #
+    def __init__(self, channel_code, chatter_code, phone_number, descriptor=None, executor=None, **kwargs):
+        self.__executor = executor
+        super(AsyncConversation, self).__init__(channel_code, chatter_code, phone_number, descriptor=descriptor, **kwargs)
+    #
+    #
+    def _open_flow(self):
+        # deferred to open(), a constructor cannot be awaited
+        return None
+    #
+    @property
+    def _compiled_machine(self):
+        if self.descriptor is None:
+            return None
+        return self.descriptor.async_machine
+    #
+    #
+    async def open(self):
+        if self.__flow is None:
+            self.__flow = await self.run_sync(self.__load)
+            if LOG.isEnabledFor(LL.DEBUG):
+                LOG.log(LL.DEBUG, 'The conversation [%s -> %s] has been opened with state [%s]' %
+                        (self.chatter_code, self.channel_code, str(self.state)))
+        return self
+    #
+    def __load(self):
+        flow = Conversation._open_flow(self)
+        # loaded now, the relationship cannot be loaded lazily once the persist object is detached
+        self._chatter
+        return flow
+    #
+    #
+    async def run_sync(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, partial(self.__run_in_app_context, func, *args, **kwargs))
+    #
+    @staticmethod
+    def __run_in_app_context(func, *args, **kwargs):
+        with db.app.app_context():
+            # the session is removed on the teardown of the context, keep the objects loaded
+            db.session().expire_on_commit = False
+            return func(*args, **kwargs)
+    #
+    @staticmethod
+    async def __resolve(value):
+        if inspect.isawaitable(value):
+            return await value
+        return value
+    #
+    #
+    async def _count_cancellations(self, range_size=1, range_unit='hours'):
+        return await self.run_sync(Conversation._count_cancellations, self, range_size=range_size, range_unit=range_unit)
+    #
+    #
+    async def next_action(self):
+        await self.open()
+        opened = self._begin_turn()
+        try:
+            reply = await self.__next_action()
+        except BaseException:
+            await self.run_sync(self._abort_turn, opened)
+            raise
+        await self.run_sync(self._end_turn, opened)
+        return reply
+    #
+    async def __next_action(self):
+        #
+        ## force quit
+        #
+        force_quit, reply_on_quit = await self.__resolve(self._force_quit)
+        if force_quit:
+            self.goodbye()
+            return reply_on_quit
+        #
+        ## Cancellation
+        #
+        if self._is_cancellation_confirming:
+            #
+            matched, msgs = await self.__resolve(self._cancellation_accepted)
+            if LOG.isEnabledFor(LL.DEBUG):
+                LOG.log(LL.DEBUG, '_cancellation_accepted -> [%s]: %s', str(matched), str(msgs))
+            if matched:
+                # the cancellation counter may reload itself from the database
+                await self.run_sync(self._on_cancellation_accepted)
+                return msgs
+            #
+            matched, msgs = await self.__resolve(self._cancellation_rejected)
+            if LOG.isEnabledFor(LL.DEBUG):
+                LOG.log(LL.DEBUG, '_cancellation_rejected -> [%s]: %s', str(matched), str(msgs))
+            if matched:
+                self._on_cancellation_rejected()
+                return msgs
+            #
+            return await self.__resolve(self._cancellation_prompt)
+        #
+        canreq, reply_on_canreq = await self.__resolve(self._cancellation_requested)
+        if canreq:
+            self._on_cancellation_requested()
+            return reply_on_canreq
+        #
+        ##
+        #
+        if self.state in self._internal_states:
+            return await self.__resolve(self._in_progress_prompt)
+        #
+        ##
+        #
+        guide_matched, guide_content = await self.__resolve(self._help)
+        if guide_matched:
+            guide_func = self._dispatcher.help_of(self.state)
+            if guide_func is not None:
+                return await self.__resolve(self._dispatcher.call(guide_func, self))
+            return guide_content
+        #
+        ## normal flow
+        #
+        return await self.__next_prompt()
+    #
+    #
+    async def next_prompt(self):
+        await self.open()
+        opened = self._begin_turn()
+        try:
+            reply = await self.__next_prompt()
+        except BaseException:
+            await self.run_sync(self._abort_turn, opened)
+            raise
+        await self.run_sync(self._end_turn, opened)
+        return reply
+    #
+    async def __next_prompt(self):
+        #
+        ## normal flow
+        #
+        from_state = self.state
+        await self._next()
+        to_state = self.state
+        #
+        reply_func = self._dispatcher.reply_of(from_state, to_state)
+        if reply_func is not None:
+            return await self.__resolve(self._dispatcher.call(reply_func, self, from_state=from_state))
+        #
+        return SILENT_MESSAGE
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import queue
+import threading
+import time
+import zlib
+
+from concurrent.futures import Future
+from redant.utils.logging import getLogger, copyRequestScope, LogLevel as LL
+from redant.utils.monitoring import gauge, histogram
+
+LOG = getLogger(__name__)
+
+QUEUE_DEPTH = gauge('redant_sharded_executor_queue_depth',
+        'Number of tasks waiting in a shard of the executor', labelnames=('executor', 'shard'))
+
+WAIT_SECONDS = histogram('redant_sharded_executor_wait_seconds',
+        'Time spent by a task in the queue before being run', labelnames=('executor',))
+
+_STOP = object()
+
+
+class ShardedExecutor(object):
+    #
+    # runs the tasks of one key (e.g. a (channel_code, chatter_code) pair) strictly in the
+    # submission order, on the single worker thread of the shard the key is hashed to, while
+    # the tasks of the other keys run in parallel on the other shards. The request id and the
+    # deadline of the submitter follow the task. It is opt-in, the flow does not use it by itself:
+    # the application submits its conversation turns to it, keyed by conversation_key().
+    #
+    def __init__(self, max_workers=8, name='conversations', app=None):
+        assert isinstance(max_workers, int) and max_workers > 0, 'max_workers must be a positive integer'
+        self.__name = name
+        self.__app = app
+        self.__queues = [queue.Queue() for i in range(max_workers)]
+        self.__threads = [None] * max_workers
+        self.__lock = threading.Lock()
+        self.__shutdown = False
+    #
+    #
+    @property
+    def max_workers(self):
+        return len(self.__queues)
+    #
+    #
+    @staticmethod
+    def conversation_key(channel_code, chatter_code):
+        return '%s:%s' % (channel_code, chatter_code)
+    #
+    #
+    def shard_of(self, key):
+        # stable across the processes, unlike hash() of a str
+        return zlib.crc32(str(key).encode('utf-8')) % len(self.__queues)
+    #
+    #
+    def submit(self, key, func, *args, **kwargs):
+        shard = self.shard_of(key)
+        future = Future()
+        func = copyRequestScope(func)
+        with self.__lock:
+            if self.__shutdown:
+                raise RuntimeError('cannot submit a task after shutdown')
+            self.__start_worker(shard)
+            # counted before the worker can take it, the gauge never goes below zero
+            QUEUE_DEPTH.labels(self.__name, shard).inc()
+            self.__queues[shard].put((future, time.monotonic(), func, args, kwargs))
+        return future
+    #
+    #
+    def shutdown(self, wait=True):
+        with self.__lock:
+            self.__shutdown = True
+            threads = [t for t in self.__threads if t is not None]
+            for shard, t in enumerate(self.__threads):
+                if t is not None:
+                    self.__queues[shard].put(_STOP)
+        if wait:
+            for t in threads:
+                t.join()
+        if LOG.isEnabledFor(LL.DEBUG):
+            LOG.log(LL.DEBUG, 'ShardedExecutor[%s].shutdown() finished', self.__name)
+    #
+    #
+    def __start_worker(self, shard):
+        if self.__threads[shard] is None:
+            t = threading.Thread(target=self.__work, args=(shard,),
+                    name='%s-shard-%d' % (self.__name, shard), daemon=True)
+            t.start()
+            self.__threads[shard] = t
+    #
+    #
+    def __work(self, shard):
+        tasks = self.__queues[shard]
+        while True:
+            task = tasks.get()
+            if task is _STOP:
+                return
+            future, submitted_at, func, args, kwargs = task
+            QUEUE_DEPTH.labels(self.__name, shard).dec()
+            WAIT_SECONDS.labels(self.__name).observe(time.monotonic() - submitted_at)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.__run(func, *args, **kwargs))
+            except BaseException as exception:
+                future.set_exception(exception)
+    #
+    #
+    def __run(self, func, *args, **kwargs):
+        if self.__app is None:
+            return func(*args, **kwargs)
+        # the scoped session is removed on the teardown of the context
+        with self.__app.app_context():
+            return func(*args, **kwargs)
@@ -1,20 +1,36 @@
 #!/usr/bin/env python
 
+import json
 import pytz
+import threading
+import time
 
 from abc import abstractproperty, abstractmethod
 from datetime import datetime, timedelta
+from functools import partial
+from redant import errors
 from redant.engine import EngineBase
 from redant.engine.adapters import MessageConverter, MessagePublisher
-from redant.utils.function_util import is_callable, call_function
+from redant.utils.cache_util import LRUCache
+from redant.utils.counter_util import SlidingWindowCounter
+from redant.utils.database import sqldb as db
 from redant.utils.logging import getLogger, LogLevel as LL
-from redant.utils.object_util import json_dumps, json_loads
+from redant.utils.monitoring import counter, histogram
+from redant.utils.object_util import json_converter, json_dumps, json_loads
 from redant.models.conversations import ConversationEntity, ConversationSchema
+from redant.models.stories import StoryDeltaEntity
+from sqlalchemy import exc
 from transitions import Machine
 
 LOG = getLogger(__name__)
 SILENT_MESSAGE = (None, None)
 
+STORY_WRITTEN_BYTES = histogram('redant_conversation_story_written_bytes',
+        'Bytes of the story written per conversation turn', ['mode'],
+        buckets=(64, 256, 1024, 4096, 16384, 65536, 262144, 1048576))
+CONVERSATION_CACHE_REQUESTS = counter('redant_conversation_cache_requests_total',
+        'Lookups of the conversation cache by result (hit, miss, stale)', ['result'])
+
 
 class Controller(EngineBase):
     #
@@ -84,7 +100,10 @@ class Conversation(EngineBase):
     __persist = None
     __timezone = None
     __descriptor = None
+    __dispatcher = None
     __flow = None
+    __journal = None
+    __unit_of_work = None
     #
     #
     def __init__(self, channel_code, chatter_code, phone_number, descriptor=None, **kwargs):
@@ -92,15 +111,31 @@ class Conversation(EngineBase):
         self.__channel_code = channel_code
         self.__chatter_code = chatter_code
         self.__phone_number = phone_number
+        self.__context = dict()
         #
         assert isinstance(descriptor, Descriptor), 'descriptor argument must be a Descriptor'
         self.__descriptor = descriptor
+        self.__dispatcher = descriptor.dispatcher(type(self))
         #
-        self.__flow = _Flow(conversation = self)
+        self.__flow = self._open_flow()
         #
         super(Conversation, self).__init__(**kwargs)
     #
     #
+    def _open_flow(self):
+        return _Flow(conversation = self)
+    #
+    #
+    def __getattr__(self, name):
+        machine = self._compiled_machine
+        if machine is not None:
+            func = machine.resolve(self, name)
+            if func is not None:
+                setattr(self, name, func)
+                return func
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+    #
+    #
     @property
     def _context(self):
         return self.__context
@@ -123,6 +158,22 @@ class Conversation(EngineBase):
     def descriptor(self):
         return self.__descriptor
     #
+    @property
+    def _dispatcher(self):
+        return self.__dispatcher
+    #
+    @property
+    def _compiled_machine(self):
+        if self.__descriptor is None:
+            return None
+        return self.__descriptor.machine
+    #
+    @property
+    def _chatter(self):
+        if self.__persist is None:
+            return None
+        return self.__persist.chatter
+    #
     #
     @property
     def persist(self):
@@ -130,10 +181,24 @@ class Conversation(EngineBase):
     #
     @persist.setter
     def persist(self, ref):
+        self._attach(ref)
+        return ref
+    #
+    def _attach(self, ref, context=None, journal_count=None):
         #
         assert isinstance(ref, ConversationEntity), 'object must be a ConversationEntity'
         self.__persist = ref
         #
+        compaction_interval = self.__descriptor.story_compaction_interval
+        #
+        # the context has been checked out from the conversation cache
+        if context is not None:
+            self.__context = context
+            if compaction_interval is not None:
+                self.__journal = _StoryJournal(ref, compaction_interval)
+                self.__journal.restore(context, journal_count)
+            return ref
+        #
         story = self.__persist.story
         if story is not None and len(story) > 0:
             story_dict, err = json_loads(story)
@@ -145,6 +210,10 @@ class Conversation(EngineBase):
                 if LOG.isEnabledFor(LL.DEBUG):
                     LOG.log(LL.DEBUG, 'error on loading the context: %s' % str(err))
         #
+        if compaction_interval is not None:
+            self.__journal = _StoryJournal(ref, compaction_interval)
+            self.__context = self.__journal.load(self.__context)
+        #
         return ref
     #
     #
@@ -203,12 +272,17 @@ class Conversation(EngineBase):
         tdargs = dict()
         tdargs[range_unit] = range_size
         #
-        latest_creation_time = datetime.utcnow() - timedelta(**tdargs)
-        r = ConversationEntity.count_by__channel__chatter(
+        cancellations = self.descriptor.cancellation_counter
+        if cancellations is not None:
+            r = cancellations.count(self.channel_code, self.chatter_code, timedelta(**tdargs).total_seconds())
+            if r is not None:
+                return r
+        #
+        # counted by the time of the cancellation, as the cancellation counter does
+        r = ConversationEntity.count_cancellations_by__channel__chatter(
             channel_code=self.channel_code,
             chatter_code=self.chatter_code,
-            overall_status=-2,
-            latest_creation_time=latest_creation_time
+            since=datetime.utcnow() - timedelta(**tdargs)
         )
         #
         return r
@@ -222,15 +296,10 @@ class Conversation(EngineBase):
             return self
         #
         try:
-            self.__persist.state = self.state
-            #
-            story_json = json_dumps(self.__context)
-            self.__persist.story = story_json
-            #
-            self.__persist.save()
+            self.__stage(story=True, state=self.state)
             #
             if LOG.isEnabledFor(LL.DEBUG):
-                LOG.log(LL.DEBUG, 'Logging current dialog successfully: %s', story_json)
+                LOG.log(LL.DEBUG, 'Logging current dialog successfully: state [%s]', self.state)
             return self
         except Exception as err:
             if LOG.isEnabledFor(LL.DEBUG):
@@ -243,15 +312,10 @@ class Conversation(EngineBase):
         if self._isInitialState() or self._isFinalState():
             return self
         try:
-            self.__persist.state = self._quit_state
-            #
-            story_json = json_dumps(self.__context)
-            self.__persist.story = story_json
-            #
-            self.__persist.save()
+            self.__stage(story=True, state=self._quit_state)
             #
             if LOG.isEnabledFor(LL.DEBUG):
-                LOG.log(LL.DEBUG, 'Logging stop event successfully: %s', story_json)
+                LOG.log(LL.DEBUG, 'Logging stop event successfully: state [%s]', self._quit_state)
             return self
         except Exception as err:
             if LOG.isEnabledFor(LL.DEBUG):
@@ -259,7 +323,66 @@ class Conversation(EngineBase):
             raise err
     #
     #
+    def __stage(self, story=False, **changes):
+        #
+        # inside a turn the changes are collected by the unit of work and committed at the end,
+        # outside of a turn (e.g. a trigger fired by a job) they are written through
+        #
+        unit_of_work = self.__unit_of_work
+        if unit_of_work is None:
+            unit_of_work = _UnitOfWork(self.__persist, self.__journal)
+        #
+        for name, value in changes.items():
+            unit_of_work.stage(name, value)
+        if story:
+            unit_of_work.stage_story(self.__context)
+        #
+        if self.__unit_of_work is None:
+            unit_of_work.commit()
+        return self
+    #
+    def _begin_turn(self):
+        if self.__unit_of_work is not None or self.__persist is None:
+            return False
+        self.__unit_of_work = _UnitOfWork(self.__persist, self.__journal)
+        return True
+    #
+    def _end_turn(self, opened):
+        if not opened:
+            return False
+        unit_of_work, self.__unit_of_work = self.__unit_of_work, None
+        committed = unit_of_work.commit()
+        if LOG.isEnabledFor(LL.DEBUG):
+            LOG.log(LL.DEBUG, 'The turn has ended, changes committed: %s', str(committed))
+        #
+        cache = self.__descriptor.conversation_cache
+        if cache is not None:
+            journal_count = self.__journal.count if self.__journal is not None else None
+            cache.checkin(unit_of_work.snapshot, self.__context, journal_count)
+        return committed
+    #
+    def _abort_turn(self, opened):
+        # the changes staged by a failed turn are dropped, the cached copy is not checked in again
+        if not opened:
+            return False
+        self.__unit_of_work = None
+        db.session.rollback()
+        if LOG.isEnabledFor(LL.DEBUG):
+            LOG.log(LL.DEBUG, 'The turn has failed, changes rolled back')
+        return True
+    #
+    #
     def next_action(self):
+        opened = self._begin_turn()
+        try:
+            reply = self.__next_action()
+        except BaseException:
+            self._abort_turn(opened)
+            raise
+        self._end_turn(opened)
+        return reply
+    #
+    def __next_action(self):
         #
         ## force quit
         #
@@ -270,27 +393,27 @@ class Conversation(EngineBase):
         #
         ## Cancellation
         #
-        if self.__is_cancellation_confirming:
+        if self._is_cancellation_confirming:
             #
             matched, msgs = self._cancellation_accepted
             if LOG.isEnabledFor(LL.DEBUG):
                 LOG.log(LL.DEBUG, '_cancellation_accepted -> [%s]: %s', str(matched), str(msgs))
             if matched:
-                self.__on_cancellation_accepted()
+                self._on_cancellation_accepted()
                 return msgs
             #
             matched, msgs = self._cancellation_rejected
             if LOG.isEnabledFor(LL.DEBUG):
                 LOG.log(LL.DEBUG, '_cancellation_rejected -> [%s]: %s', str(matched), str(msgs))
             if matched:
-                self.__on_cancellation_rejected()
+                self._on_cancellation_rejected()
                 return msgs
             #
             return self._cancellation_prompt
         #
         canreq, reply_on_canreq = self._cancellation_requested
         if canreq:
-            self.__on_cancellation_requested()
+            self._on_cancellation_requested()
             return reply_on_canreq
         #
         ##
@@ -302,37 +425,27 @@ class Conversation(EngineBase):
         #
         guide_matched, guide_content = self._help
         if guide_matched:
-            guide_func = 'help__' + self.state
-            if is_callable(guide_func, self):
-                return call_function(guide_func, self)
+            guide_func = self.__dispatcher.help_of(self.state)
+            if guide_func is not None:
+                return self.__dispatcher.call(guide_func, self)
             return guide_content
         #
         ## normal flow
         #
-        from_state = self.state
-        self._next()
-        to_state = self.state
-        #
-        kwargs = dict(from_state=from_state)
-        #
-        replies = self.__descriptor.replies
-        reply_name = from_state + '__' + to_state
-        if reply_name in replies and isinstance(replies[reply_name], str):
-            reply_func = replies[reply_name]
-            return call_function(reply_func, self, **kwargs)
-        #
-        reply_func = 'reply__' + reply_name
-        if is_callable(reply_func, self):
-            return call_function(reply_func, self, **kwargs)
-        #
-        reply_func = 'reply__' + self.state
-        if is_callable(reply_func, self):
-            return call_function(reply_func, self, **kwargs)
-        #
-        return SILENT_MESSAGE
+        return self.__next_prompt()
     #
     #
     def next_prompt(self):
+        opened = self._begin_turn()
+        try:
+            reply = self.__next_prompt()
+        except BaseException:
+            self._abort_turn(opened)
+            raise
+        self._end_turn(opened)
+        return reply
+    #
+    def __next_prompt(self):
         #
         ## normal flow
         #
@@ -340,21 +453,9 @@ class Conversation(EngineBase):
         self._next()
         to_state = self.state
         #
-        kwargs = dict(from_state=from_state)
-        #
-        replies = self.__descriptor.replies
-        reply_name = from_state + '__' + to_state
-        if reply_name in replies and isinstance(replies[reply_name], str):
-            reply_func = replies[reply_name]
-            return call_function(reply_func, self, **kwargs)
-        #
-        reply_func = 'reply__' + reply_name
-        if is_callable(reply_func, self):
-            return call_function(reply_func, self, **kwargs)
-        #
-        reply_func = 'reply__' + self.state
-        if is_callable(reply_func, self):
-            return call_function(reply_func, self, **kwargs)
+        reply_func = self.__dispatcher.reply_of(from_state, to_state)
+        if reply_func is not None:
+            return self.__dispatcher.call(reply_func, self, from_state=from_state)
         #
         return SILENT_MESSAGE
     #
@@ -403,25 +504,28 @@ class Conversation(EngineBase):
     def _cancellation_requested(self):
         return False, SILENT_MESSAGE
     #
-    def __on_cancellation_requested(self):
+    def _on_cancellation_requested(self):
         return self.__switch_cancellation_status(-1)
     #
     @property
-    def __is_cancellation_confirming(self):
+    def _is_cancellation_confirming(self):
         return self.__persist.overall_status == -1
     #
     @property
     def _cancellation_accepted(self):
         return False, SILENT_MESSAGE
     #
-    def __on_cancellation_accepted(self):
+    def _on_cancellation_accepted(self):
+        cancellations = self.descriptor.cancellation_counter
+        if cancellations is not None:
+            cancellations.add(self.channel_code, self.chatter_code)
         return self.__switch_cancellation_status(-2)
     #
     @property
     def _cancellation_rejected(self):
         return False, SILENT_MESSAGE
     #
-    def __on_cancellation_rejected(self):
+    def _on_cancellation_rejected(self):
         return self.__switch_cancellation_status(0)
     #
     @property
@@ -430,9 +534,7 @@ class Conversation(EngineBase):
     #
     def __switch_cancellation_status(self, status):
         try:
-            self.__persist.overall_status = status
-            #
-            self.__persist.save()
+            self.__stage(overall_status=status)
             #
             if LOG.isEnabledFor(LL.DEBUG):
                 LOG.log(LL.DEBUG, '__switch_cancellation_status(%s) action has done successfully' % str(status))
@@ -461,6 +563,12 @@ class Descriptor(EngineBase):
     #
     __rules = None
     __replies = None
+    __machine = None
+    __async_machine = None
+    __dispatchers = None
+    __lock = None
+    __conversation_cache = None
+    __cancellation_counter = None
     #
     def __init__(self, *args, **kwargs):
         #
@@ -469,6 +577,19 @@ class Descriptor(EngineBase):
         #
         self.__rules, self.__replies = self.enhanceRules(self.transitions)
         #
+        self.__machine = _CompiledMachine(descriptor=self)
+        #
+        self.__dispatchers = dict()
+        self.__lock = threading.Lock()
+        #
+        cache_options = self.conversation_cache_options
+        if cache_options is not None:
+            self.__conversation_cache = _ConversationCache(**cache_options)
+        #
+        counter_options = self.cancellation_counter_options
+        if counter_options is not None:
+            self.__cancellation_counter = _CancellationCounter(**counter_options)
+        #
         super(Descriptor, self).__init__(*args, **kwargs)
     #
     @abstractproperty
@@ -495,6 +616,32 @@ class Descriptor(EngineBase):
     def transitions(self):
         pass
     #
+    @property
+    def story_compaction_interval(self):
+        # None rewrites the whole story on every turn, a number switches to the delta mode
+        # and compacts the story after that many deltas; the deltas of a conversation which
+        # stops before its compaction are only folded into its story when the ConversationSweeper
+        # runs and closes it (idle, done or cancelled)
+        return None
+    #
+    @property
+    def conversation_cache_options(self):
+        # None disables the cache of the live conversations, otherwise the arguments
+        # of the cache, e.g. dict(max_size=10000, ttl=300)
+        return None
+    #
+    @property
+    def cancellation_counter_options(self):
+        # None counts the cancellations with a query, otherwise the arguments of the in-memory
+        # sliding window counters, e.g. dict(window=3600*24, resolution=60, max_keys=100000),
+        # they are rebuilt from the database every [sync_interval] seconds ([resolution] by default)
+        return None
+    #
+    @property
+    def idle_timeout(self):
+        # seconds without any write after which a conversation is expired, None keeps it open
+        return 3600*10
+    #
     ##
     @property
     def rules(self):
@@ -506,6 +653,54 @@ class Descriptor(EngineBase):
         return self.__replies
     #
     ##
+    @property
+    def machine(self):
+        return self.__machine
+    #
+    @property
+    def async_machine(self):
+        # compiled on demand, only the AsyncConversation flows need it
+        if self.__async_machine is None:
+            with self.__lock:
+                if self.__async_machine is None:
+                    from transitions.extensions.asyncio import AsyncMachine
+                    self.__async_machine = _CompiledMachine(descriptor=self, machine_class=AsyncMachine)
+        return self.__async_machine
+    #
+    ##
+    @property
+    def conversation_cache(self):
+        return self.__conversation_cache
+    #
+    @property
+    def cancellation_counter(self):
+        return self.__cancellation_counter
+    #
+    ##
+    def validate(self, *conversation_classes):
+        #
+        # resolves the handlers and the state callbacks of [conversation_classes] now rather
+        # than on their first message: a misnamed handler raises HandlerNotFoundError
+        #
+        for conversation_class in conversation_classes:
+            self.dispatcher(conversation_class)
+            self.machine.machine_of(conversation_class)
+        return self
+    #
+    def dispatcher(self, conversation_class):
+        #
+        # the reply/help tables of a Conversation class are resolved once, see validate()
+        #
+        dispatcher = self.__dispatchers.get(conversation_class)
+        if dispatcher is None:
+            with self.__lock:
+                dispatcher = self.__dispatchers.get(conversation_class)
+                if dispatcher is None:
+                    dispatcher = _Dispatcher(descriptor=self, conversation_class=conversation_class)
+                    self.__dispatchers[conversation_class] = dispatcher
+        return dispatcher
+    #
+    ##
     @classmethod
     def enhanceRules(cls, transitions):
         if not isinstance(transitions, list):
@@ -558,6 +753,13 @@ class Descriptor(EngineBase):
             return NotImplemented
 
 
+def flow_hook(app, descriptor, *conversation_classes):
+    # validates the conversation classes of [descriptor] at the startup of [app]
+    descriptor.validate(*conversation_classes)
+    app.extensions.setdefault('redant_flows', []).append(descriptor)
+    return descriptor
+
+
 class _Flow(object):
     #
     __conversation = None
@@ -570,8 +772,13 @@ class _Flow(object):
         self.__conversation = conversation
         self.__descriptor = self.__conversation.descriptor
         #
-        # load the latest conversation
-        current = ConversationEntity.find_by__channel__chatter(conversation.channel_code, conversation.chatter_code)
+        # load the latest conversation, from the cache if it is enabled and up to date
+        current, context, journal_count = None, None, None
+        cache = self.__descriptor.conversation_cache
+        if cache is not None:
+            current, context, journal_count = cache.checkout(conversation.channel_code, conversation.chatter_code)
+        if current is None:
+            current = ConversationEntity.find_by__channel__chatter(conversation.channel_code, conversation.chatter_code)
         #
         # create one if not found
         kwargs = dict(
@@ -591,31 +798,33 @@ class _Flow(object):
             if self.hasExpired(current, self.__descriptor):
                 if LOG.isEnabledFor(LL.DEBUG):
                     LOG.log(LL.DEBUG, 'The conversation[%s] has expired, create another' % conver_label)
-                current = ConversationEntity(**kwargs).create()
+                current, context = ConversationEntity(**kwargs).create(), None
             else:
                 if LOG.isEnabledFor(LL.DEBUG):
                     LOG.log(LL.DEBUG, 'The conversation[%s] is ok, continue ...' % conver_label)
             pass
         #
         #
-        self.__conversation.persist = current
+        self.__conversation._attach(current, context, journal_count)
         #
-        # create the conversation transition
-        self.machine = Machine(
-            model=conversation,
-            states=self.__descriptor.states,
-            transitions=self.__descriptor.rules,
-            initial=current.state)
+        # bind the conversation to the compiled machine of the descriptor
+        conversation._compiled_machine.bind(conversation, current.state)
         #
         if LOG.isEnabledFor(LL.DEBUG):
-            LOG.log(LL.DEBUG, 'A machine for [%s] has been created with state [%s]' % (conver_label, str(conversation.state)))
+            LOG.log(LL.DEBUG, 'The conversation [%s] has been bound with state [%s]' % (conver_label, str(conversation.state)))
         #
         pass
     #
-    def __has_cancelled(self, persist):
+    @property
+    def machine(self):
+        conversation = self.__conversation
+        return conversation._compiled_machine.machine_of(type(conversation))
+    #
+    def __has_closed(self, persist):
+        # cancelled by the user (-2) or closed by the ConversationSweeper (-3)
         if persist.overall_status <= -2:
             if LOG.isEnabledFor(LL.DEBUG):
-                LOG.log(LL.DEBUG, 'The user has cancelled the task')
+                LOG.log(LL.DEBUG, 'The conversation has been cancelled or closed [%s]' % str(persist.overall_status))
             return True
         return False
     #
@@ -641,10 +850,444 @@ class _Flow(object):
             return True
         return False
     #
-    def hasExpired(self, persist, descriptor, timeout=3600*10):
+    def __is_idle(self, persist, timeout):
+        if timeout is None:
+            return False
+        # a conversation without update_time has not been backfilled by the sweeper yet, it is not idle
+        last_written = persist.update_time
+        if last_written is None:
+            return False
+        if last_written.tzinfo is not None:
+            last_written = last_written.astimezone(pytz.utc).replace(tzinfo=None)
+        if last_written < datetime.utcnow() - timedelta(seconds=timeout):
+            if LOG.isEnabledFor(LL.DEBUG):
+                LOG.log(LL.DEBUG, 'The conversation has been idle since [%s]' % str(last_written))
+            return True
+        return False
+    #
+    def hasExpired(self, persist, descriptor, timeout=None):
+        # the status is set by the ConversationSweeper, the other checks only
+        # cover the conversations which have not been swept yet
+        if self.__has_closed(persist):
+            return True
+        if timeout is None:
+            timeout = descriptor.idle_timeout
         return any([
-            self.__has_cancelled(persist),
             self.__has_done(persist),
             self.__has_quit(persist),
-            self.__is_invalid_state(persist)
+            self.__is_invalid_state(persist),
+            self.__is_idle(persist, timeout)
         ])
+
+
+class _UnitOfWork(object):
+    #
+    # collects the changes of the persist object during a turn, the story is serialized once
+    # and the row is committed once at the end, nothing is written if nothing has changed
+    #
+    def __init__(self, persist, journal=None):
+        self.__persist = persist
+        self.__journal = journal
+        self.__context = None
+        self.__dirty = False
+        self.__snapshot = None
+    #
+    @property
+    def snapshot(self):
+        # the column values as committed, captured before the commit expires the attributes
+        if self.__snapshot is None:
+            self.__snapshot = self.__persist.snapshot()
+        return self.__snapshot
+    #
+    def stage(self, name, value):
+        if getattr(self.__persist, name) != value:
+            setattr(self.__persist, name, value)
+            self.__dirty = True
+            self.__snapshot = None
+        return self
+    #
+    def stage_story(self, context):
+        self.__context = context
+        return self
+    #
+    def commit(self):
+        if self.__context is not None:
+            if self.__journal is not None:
+                written, mode = self.__journal.write(self.__context)
+                self.__dirty = self.__dirty or written > 0
+            else:
+                story_json = json_dumps(self.__context)
+                written, mode = 0, 'full'
+                if story_json != self.__persist.story:
+                    written = len(story_json.encode('utf-8'))
+                self.stage('story', story_json)
+            if written > 0:
+                STORY_WRITTEN_BYTES.labels(mode).observe(written)
+            self.__context = None
+        #
+        if not self.__dirty:
+            return False
+        self.__dirty = False
+        #
+        self.__persist.touch()
+        self.__snapshot = self.__persist.snapshot()
+        _, err = self.__persist.save()
+        if err is not None:
+            self.__snapshot = None
+            if isinstance(err, exc.IntegrityError) and self.__journal is not None:
+                # another process has appended the same delta of the story meanwhile
+                raise errors.ConversationConflictError('the story of the conversation [%s] has been written concurrently: %s' %
+                        (str(self.__persist.id), str(err)))
+            raise err
+        return True
+
+
+class _ConversationCache(object):
+    #
+    # the live conversation rows and their parsed contexts; an entry is checked out (removed)
+    # for the duration of a turn and checked in again when the turn ends, the version column
+    # is compared with the database so the writes of other processes invalidate the entry
+    #
+    def __init__(self, max_size=1024, ttl=300):
+        self.__entries = LRUCache(max_size=max_size, ttl=ttl)
+    #
+    def checkout(self, channel_code, chatter_code):
+        entry = self.__entries.pop((channel_code, chatter_code))
+        if entry is None:
+            CONVERSATION_CACHE_REQUESTS.labels('miss').inc()
+            return None, None, None
+        #
+        values = entry['values']
+        latest = ConversationEntity.find_version_by__channel__chatter(channel_code, chatter_code)
+        if latest is None or latest.id != values['id'] or latest.version != values['version']:
+            CONVERSATION_CACHE_REQUESTS.labels('stale').inc()
+            return None, None, None
+        #
+        CONVERSATION_CACHE_REQUESTS.labels('hit').inc()
+        return ConversationEntity.restore(values), entry['context'], entry['journal_count']
+    #
+    def checkin(self, values, context, journal_count=None):
+        key = (values['channel_code'], values['chatter_code'])
+        self.__entries.put(key, dict(values=values, context=context, journal_count=journal_count))
+    #
+    def invalidate(self, channel_code, chatter_code):
+        return self.__entries.pop((channel_code, chatter_code))
+    #
+    def clear(self):
+        self.__entries.clear()
+
+
+class _CancellationCounter(object):
+    #
+    # the cancellations of every chatter over a sliding window, rebuilt from the database every
+    # [sync_interval] seconds (a bucket by default) so that the cancellations of the other
+    # processes are seen, the ones of this process are counted at once; a chatter costs about
+    # 0.5 KB, i.e. about 50 MB for the default [max_keys]
+    #
+    def __init__(self, window=3600*24, resolution=60, max_keys=100000, sync_interval=None):
+        self.__options = dict(window=window, resolution=resolution, max_keys=max_keys)
+        self.__window = window
+        self.__sync_interval = resolution if sync_interval is None else sync_interval
+        self.__counter = None
+        self.__synced_at = None
+        self.__lock = threading.Lock()
+    #
+    def count(self, channel_code, chatter_code, seconds):
+        if seconds > self.__window:
+            return None
+        return self.__sync().count((channel_code, chatter_code), seconds)
+    #
+    def add(self, channel_code, chatter_code):
+        self.__sync().add((channel_code, chatter_code))
+    #
+    def reload(self):
+        since = datetime.utcnow() - timedelta(seconds=self.__window)
+        counter = SlidingWindowCounter(**self.__options).rebuild(((channel_code, chatter_code), self.__timestamp(when))
+                for channel_code, chatter_code, when in ConversationEntity.find_all_cancellations_since(since))
+        # swapped once complete, the readers never see a partial counter
+        self.__counter, self.__synced_at = counter, time.monotonic()
+        return self
+    #
+    @staticmethod
+    def __timestamp(when):
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=pytz.utc)
+        return when.timestamp()
+    #
+    def __sync(self):
+        counter = self.__counter
+        if counter is None:
+            with self.__lock:
+                if self.__counter is None:
+                    self.reload()
+            return self.__counter
+        if time.monotonic() - self.__synced_at >= self.__sync_interval:
+            # a single thread reloads it, the others go on with the previous one meanwhile
+            if self.__lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self.__synced_at >= self.__sync_interval:
+                        self.reload()
+                finally:
+                    self.__lock.release()
+        return self.__counter
+
+
+def compact_story(persist):
+    # the story of [persist] with its deltas applied, e.g. for a conversation closed before its compaction
+    context = dict()
+    if persist.story is not None and len(persist.story) > 0:
+        story_dict, err = json_loads(persist.story)
+        if isinstance(story_dict, dict):
+            context = story_dict
+    return json_dumps(_StoryJournal(persist, None).load(context))
+
+
+class _StoryJournal(object):
+    #
+    # the delta mode of the story: each turn appends the changed/removed top-level keys of the
+    # context as a StoryDeltaEntity and, every [compaction_interval] deltas, the whole context
+    # is written back into the story column and the deltas are deleted
+    #
+    def __init__(self, persist, compaction_interval):
+        self.__persist = persist
+        self.__compaction_interval = compaction_interval
+        self.__snapshot = dict()
+        self.__count = 0
+    #
+    def load(self, context):
+        context = dict(context)
+        if self.__persist.id is not None:
+            for delta in StoryDeltaEntity.find_all_by__conversation(self.__persist.id):
+                patch, err = json_loads(delta.patch)
+                if patch is None:
+                    if LOG.isEnabledFor(LL.DEBUG):
+                        LOG.log(LL.DEBUG, 'error on loading the story delta[%s]: %s' % (str(delta.seq), str(err)))
+                    continue
+                context.update(patch.get('set', {}))
+                for key in patch.get('unset', []):
+                    context.pop(key, None)
+                self.__count = max(self.__count, delta.seq)
+        self.__snapshot = {key: self.__serialize(value) for key, value in context.items()}
+        return context
+    #
+    def restore(self, context, count):
+        self.__snapshot = {key: self.__serialize(value) for key, value in context.items()}
+        self.__count = count or 0
+        return context
+    #
+    @property
+    def count(self):
+        return self.__count
+    #
+    def write(self, context):
+        values = {key: self.__serialize(value) for key, value in context.items()}
+        changed = [key for key, value in values.items() if self.__snapshot.get(key) != value]
+        removed = [key for key in self.__snapshot.keys() if key not in values]
+        if len(changed) == 0 and len(removed) == 0:
+            return 0, None
+        #
+        self.__snapshot = values
+        self.__count = self.__count + 1
+        if self.__count >= self.__compaction_interval:
+            self.__count = 0
+            story_json = json_dumps(context)
+            self.__persist.story = story_json
+            StoryDeltaEntity.delete_by__conversation(self.__persist.id)
+            return len(story_json.encode('utf-8')), 'compaction'
+        #
+        patch = dict()
+        if len(changed) > 0:
+            patch['set'] = {key: context[key] for key in changed}
+        if len(removed) > 0:
+            patch['unset'] = removed
+        patch_json = json_dumps(patch)
+        StoryDeltaEntity(conversation_id=self.__persist.id, seq=self.__count, patch=patch_json).stage()
+        return len(patch_json.encode('utf-8')), 'delta'
+    #
+    @staticmethod
+    def __serialize(value):
+        return json.dumps(value, default=json_converter, ensure_ascii=False, sort_keys=True)
+
+
+class _CompiledMachine(object):
+    #
+    # the transitions.Machine is built once per Descriptor; a conversation is bound by setting
+    # its state, the triggers are resolved lazily (see Conversation.__getattr__) and the models
+    # are never registered into the machine, so the shared objects stay read-only. The states
+    # of a model class defining on_enter_<state>/on_exit_<state> callbacks get their own copy,
+    # built once for that class, the other classes of the descriptor do not see its callbacks
+    #
+    #
+    def __init__(self, descriptor, machine_class=Machine):
+        self.__descriptor = descriptor
+        self.__machine_class = machine_class
+        self.__machine = self.__build()
+        self.__machines = dict()
+        self.__lock = threading.Lock()
+    #
+    @property
+    def machine(self):
+        return self.__machine
+    #
+    def machine_of(self, model_type):
+        machine = self.__machines.get(model_type)
+        if machine is None:
+            with self.__lock:
+                machine = self.__machines.get(model_type)
+                if machine is None:
+                    machine = self.__machines[model_type] = self.__compile(model_type)
+        return machine
+    #
+    def bind(self, model, state):
+        self.machine_of(type(model)).set_state(state, model=model)
+        return model
+    #
+    def resolve(self, model, name):
+        machine = self.machine_of(type(model))
+        if name in machine.events:
+            return partial(machine.events[name].trigger, model)
+        if name == 'trigger':
+            return partial(machine._get_trigger, model)
+        if name == 'may_trigger':
+            return partial(machine._can_trigger, model)
+        if name.startswith('may_') and name[4:] in machine.events:
+            return partial(machine._can_trigger, model, name[4:])
+        if name.startswith('is_') and name[3:] in machine.states:
+            return partial(machine.is_state, machine.states[name[3:]].value, model)
+        return None
+    #
+    def __build(self):
+        descriptor = self.__descriptor
+        return self.__machine_class(
+            model=[],
+            states=descriptor.states,
+            transitions=descriptor.rules,
+            initial=descriptor.initial_state)
+    #
+    def __compile(self, model_type):
+        callbacks = []
+        for state in self.__machine.states.values():
+            for callback in self.__machine.state_cls.dynamic_methods:
+                method = '%s_%s' % (callback, state.name)
+                if callable(getattr(model_type, method, None)) and method not in getattr(state, callback):
+                    callbacks.append((state.name, callback, method))
+        if not callbacks:
+            return self.__machine
+        machine = self.__build()
+        for state_name, callback, method in callbacks:
+            machine.states[state_name].add_callback(callback[3:], method)
+        return machine
+
+
+class _Dispatcher(object):
+    #
+    # resolves the reply/help handlers of a (Descriptor, Conversation class) pair into tables:
+    #   - (from_state, to_state) -> handler, from the descriptor replies, then reply__<from>__<to>,
+    #     then reply__<to>
+    #   - to_state -> reply__<to>, for the transitions which are not declared in the rules
+    #   - state -> help__<state>
+    #
+    def __init__(self, descriptor, conversation_class):
+        #
+        states = list(descriptor.machine.machine.states.keys())
+        handlers = self.__collect(conversation_class)
+        unknown = []
+        #
+        self.__helps = dict()
+        self.__state_replies = dict()
+        pair_replies = dict()
+        #
+        for name, handler in handlers.items():
+            if name.startswith('help__'):
+                if name[6:] in states:
+                    self.__helps[name[6:]] = handler
+                else:
+                    unknown.append(name)
+                continue
+            if name[7:] in states:
+                self.__state_replies[name[7:]] = handler
+                continue
+            pair = self.__split(name[7:], states)
+            if pair is not None:
+                pair_replies[pair] = handler
+            else:
+                unknown.append(name)
+        #
+        named_replies = dict()
+        for reply_name, func_name in descriptor.replies.items():
+            if not isinstance(func_name, str):
+                continue
+            handler = self.__lookup(conversation_class, func_name)
+            if handler is None:
+                unknown.append(func_name)
+                continue
+            pair = self.__split(reply_name, states)
+            if pair is not None:
+                named_replies[pair] = handler
+        #
+        if len(unknown) > 0:
+            raise errors.HandlerNotFoundError('%s has invalid handlers for %s: %s' % (conversation_class.__name__,
+                    type(descriptor).__name__, ', '.join(sorted(unknown))))
+        #
+        self.__replies = dict()
+        for rule in descriptor.rules:
+            dest = rule.get('dest')
+            if dest is None:
+                continue
+            sources = rule.get('source')
+            if sources == '*':
+                sources = states
+            if not isinstance(sources, list):
+                sources = [sources]
+            for source in sources:
+                pair = (source, dest)
+                handler = named_replies.get(pair, pair_replies.get(pair, self.__state_replies.get(dest)))
+                if handler is not None:
+                    self.__replies[pair] = handler
+        for pair, handler in pair_replies.items():
+            self.__replies.setdefault(pair, handler)
+        for pair, handler in named_replies.items():
+            self.__replies[pair] = handler
+    #
+    def reply_of(self, from_state, to_state):
+        handler = self.__replies.get((from_state, to_state))
+        if handler is None:
+            handler = self.__state_replies.get(to_state)
+        return handler
+    #
+    def help_of(self, state):
+        return self.__helps.get(state)
+    #
+    @staticmethod
+    def call(handler, conversation, **kwargs):
+        return handler.__get__(conversation, type(conversation))(**kwargs)
+    #
+    @classmethod
+    def __collect(cls, conversation_class):
+        handlers = dict()
+        for klass in reversed(conversation_class.__mro__):
+            for name in vars(klass).keys():
+                if name.startswith('reply__') or name.startswith('help__'):
+                    handler = cls.__lookup(conversation_class, name)
+                    if handler is not None:
+                        handlers[name] = handler
+        return handlers
+    #
+    @staticmethod
+    def __lookup(conversation_class, name):
+        for klass in conversation_class.__mro__:
+            if name in vars(klass):
+                handler = vars(klass)[name]
+                if hasattr(handler, '__get__') and callable(handler.__get__(None, conversation_class)):
+                    return handler
+                return None
+        return None
+    #
+    @staticmethod
+    def __split(name, states):
+        pos = name.find('__')
+        while pos > 0:
+            if name[:pos] in states and name[pos + 2:] in states:
+                return name[:pos], name[pos + 2:]
+            pos = name.find('__', pos + 1)
+        return None
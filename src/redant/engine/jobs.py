@@ -3,12 +3,16 @@
 import atexit
 import threading
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from pytz import utc
 
 from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
+from redant.engine.flow import compact_story
+from redant.models.conversations import ConversationEntity
+from redant.models.stories import StoryDeltaEntity
 from redant.utils.database import sqldb
 from redant.utils.logging import getLogger, LogLevel as LL
 
@@ -17,6 +21,8 @@ LOG = getLogger(__name__)
 
 
 class JobScheduler():
+    #
+    __job_ids = None
     #
     def __init__(self, listener, *args, **kwargs):
         #
@@ -31,7 +37,9 @@ class JobScheduler():
         }
         #
         jobstores = {
-            'default': SQLAlchemyJobStore(url=APSCHEDULER_CFG['SQLALCHEMY_DATABASE_URI'])
+            'default': SQLAlchemyJobStore(url=APSCHEDULER_CFG['SQLALCHEMY_DATABASE_URI']),
+            # the jobs of this process only, their callables need not be serializable
+            'memory': MemoryJobStore()
         }
         #
         job_defaults = {
@@ -41,11 +49,21 @@ class JobScheduler():
         #
         self.__scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults, timezone=utc)
         #
-        self.__job = self.__scheduler.add_job(listener, 'interval', seconds=7, id='engagement_checking_job', replace_existing=True)
+        self.__job_ids = []
+        if listener is not None:
+            self.__job = self.__scheduler.add_job(listener, 'interval', seconds=7, id='engagement_checking_job', replace_existing=True)
+            self.__job_ids.append('engagement_checking_job')
         #
         atexit.register(self.shutdown)
     #
     #
+    def add_interval_job(self, func, seconds, job_id):
+        job = self.__scheduler.add_job(func, 'interval', seconds=seconds, id=job_id, jobstore='memory',
+                max_instances=1, coalesce=True, replace_existing=True)
+        self.__job_ids.append(job_id)
+        return job
+    #
+    #
     def start(self):
         if self.__scheduler is not None and not self.__scheduler.running:
             self.__scheduler.start()
@@ -57,9 +75,74 @@ class JobScheduler():
     #
     def shutdown(self):
         if self.__scheduler is not None and self.__scheduler.running:
-            if self.__scheduler.get_job('engagement_checking_job') is not None:
-                self.__scheduler.remove_job(job_id='engagement_checking_job')
+            for job_id in self.__job_ids:
+                if self.__scheduler.get_job(job_id) is not None:
+                    self.__scheduler.remove_job(job_id=job_id)
             self.__scheduler.shutdown()
         if LOG.isEnabledFor(LL.DEBUG):
             LOG.log(LL.DEBUG, 'ConversationScanner.shutdown() finished')
         return self
+
+
+class ConversationSweeper():
+    #
+    # closes the expired conversations of a descriptor in bulk: the ones in a final, quit
+    # or unknown state and the ones idle for longer than descriptor.idle_timeout, so that
+    # the incoming messages only check the overall_status of the loaded conversation;
+    # [channel_codes] are the channels served by the descriptor, the conversations of the
+    # other flows are in states it does not know. The open conversations without update_time
+    # (written before it existed) are given the time of the sweep, see backfill_update_time().
+    # The story deltas of the conversations closed before their compaction are folded into
+    # their story, [compaction_limit] of them per sweep
+    #
+    def __init__(self, descriptor, channel_codes, app=None, compaction_limit=500):
+        assert isinstance(channel_codes, (list, tuple, set)) and len(channel_codes) > 0,\
+                'channel_codes must be a non-empty list of the channels served by the descriptor'
+        self.__descriptor = descriptor
+        self.__app = app
+        self.__channel_codes = channel_codes
+        self.__compaction_limit = compaction_limit
+    #
+    #
+    def schedule(self, scheduler, seconds=60, job_id='conversation_sweeping_job'):
+        return scheduler.add_interval_job(self.sweep, seconds=seconds, job_id=job_id)
+    #
+    #
+    def sweep(self):
+        app = self.__app if self.__app is not None else sqldb.app
+        with app.app_context():
+            return self.__sweep()
+    #
+    def __sweep(self):
+        descriptor = self.__descriptor
+        #
+        states = list(descriptor.final_states) + [descriptor.quit_state]
+        #
+        idle_before = None
+        if descriptor.idle_timeout is not None:
+            ConversationEntity.backfill_update_time(list(self.__channel_codes))
+            idle_before = datetime.utcnow() - timedelta(seconds=descriptor.idle_timeout)
+        #
+        count = ConversationEntity.expire_all_by(states=states,
+                excluded_states=descriptor.states,
+                idle_before=idle_before,
+                channel_codes=list(self.__channel_codes))
+        #
+        compacted = self.__compact()
+        #
+        if LOG.isEnabledFor(LL.DEBUG):
+            LOG.log(LL.DEBUG, 'ConversationSweeper.sweep() closed [%d] conversations, compacted [%d] stories', count, compacted)
+        return count
+    #
+    def __compact(self):
+        conversation_ids = StoryDeltaEntity.find_conversation_ids__closed(self.__channel_codes, limit=self.__compaction_limit)
+        try:
+            for conversation_id in conversation_ids:
+                persist = ConversationEntity.query.get(conversation_id)
+                ConversationEntity.update_story_by__id(conversation_id, compact_story(persist))
+                StoryDeltaEntity.delete_by__conversation(conversation_id)
+            sqldb.session.commit()
+        except Exception:
+            sqldb.session.rollback()
+            raise
+        return len(conversation_ids)
@@ -1,16 +1,30 @@
 #!/usr/bin/env python
 
+import asyncio
+import json
 import os
+import random
 import requests
 import threading
+import time
+import weakref
 
 from abc import abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from redant import errors
 from redant.engine import EngineBase
+from redant.utils.cache_util import LRUCache
 from redant.utils.dict_util import CaseInsensitiveDict
-from redant.utils.logging import getLogger, getRequestId, LogLevel as LL
+from redant.utils.logging import getLogger, getRequestId, getRemainingTime, copyRequestScope, LogLevel as LL
+from redant.utils.monitoring import counter, gauge, histogram
 from redant.utils.net_util import url_build
 from redant.utils.object_util import json_dumps
+from redant.utils.stream_util import decode_chunks, iter_json_array, iter_ndjson, limit_size
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth, HTTPDigestAuth
+from urllib.parse import urlsplit
 
 BASIC_AUTH = 'basic'
 DIGEST_AUTH = 'digest'
@@ -18,10 +32,60 @@ BEARER_AUTH = 'bearer'
 
 LOG = getLogger(__name__)
 
+CACHE_REQUESTS = counter('redant_rest_cache_requests_total',
+        'Number of REST invocations through the response cache, by result (hit, stale, revalidated, miss)',
+        labelnames=('entrypoint', 'result'))
+
+COALESCED_CALLS = counter('redant_rest_coalesced_calls_total',
+        'Number of REST invocations served by an identical call already in flight', labelnames=('entrypoint',))
+
+CIRCUIT_STATE = gauge('redant_rest_circuit_state',
+        'State of the circuit breaker of a REST entrypoint (0: closed, 1: half-open, 2: open)',
+        labelnames=('entrypoint',))
+
+CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN = 0, 1, 2
+
+# plain counters and histograms, aggregated over the workers by the multiprocess mode of
+# prometheus_client (UWsgiPrometheusMetrics), unlike the collectors reading a live state
+REQUEST_SECONDS = histogram('redant_rest_request_duration_seconds',
+        'Time spent by a REST request until its response headers (each attempt is observed)',
+        labelnames=('entrypoint', 'method'))
+
+RESPONSES = counter('redant_rest_responses_total',
+        'Number of REST requests by status code, or by exception class when no response was received',
+        labelnames=('entrypoint', 'method', 'status'))
+
+REQUEST_BYTES = counter('redant_rest_request_bytes_total',
+        'Size of the bodies sent by the REST requests', labelnames=('entrypoint',))
+
+RESPONSE_BYTES = counter('redant_rest_response_bytes_total',
+        'Size of the bodies received by the REST requests', labelnames=('entrypoint',))
+
+RETRIES = counter('redant_rest_retries_total',
+        'Number of REST requests sent again, by reason (status code, exception class or unauthorized)',
+        labelnames=('entrypoint', 'reason'))
+
+TOKEN_FETCH_SECONDS = histogram('redant_rest_token_fetch_seconds',
+        'Time spent fetching an access_token, by result (ok, empty, error)', labelnames=('auth', 'result'))
+
+# set by every process from its own pools, summed over the live workers in the uWSGI mode
+POOL_CONNECTIONS_OPENED = gauge('redant_rest_pool_connections_opened',
+        'Number of connections opened by the REST connection pools', labelnames=('host',), multiprocess_mode='livesum')
+
+POOL_REQUESTS = gauge('redant_rest_pool_requests',
+        'Number of requests sent through the REST connection pools', labelnames=('host',), multiprocess_mode='livesum')
+
+POOL_CONNECTIONS_IDLE = gauge('redant_rest_pool_connections_idle',
+        'Number of keep-alive connections waiting in the REST connection pools', labelnames=('host',), multiprocess_mode='livesum')
+
 class RestClient(EngineBase):
     #
     __guard = None
-    __invokers = dict()
+    __invokers = None
+    __sessions = None
+    __executor = None
+    __executor_options = None
+    __lock = None
     #
     #
     def __init__(self, *args, **kwargs):
@@ -38,17 +102,84 @@ class RestClient(EngineBase):
         entrypoints = mappings['entrypoints'] if 'entrypoints' in mappings else []
         assert isinstance(entrypoints, list), "mappings['entrypoints'] must be a list"
         #
+        session_options = commons['session'] if 'session' in commons else {}
+        assert isinstance(session_options, dict), "mappings['commons']['session'] must be a dict"
+        self.__sessions = RestSessions(**session_options)
+        #
+        # the thread pool of invoke_async()/invoke_many(), e.g. 'executor': {'max_workers': 8}
+        self.__executor_options = commons['executor'] if 'executor' in commons else {}
+        assert isinstance(self.__executor_options, dict), "mappings['commons']['executor'] must be a dict"
+        self.__lock = threading.Lock()
+        #
+        self.__invokers = dict()
         for entrypoint in entrypoints:
-            self.__invokers[entrypoint["name"]] = RestInvoker(entrypoint=entrypoint, commons=commons, guard=self.__guard)
+            self.__invokers[entrypoint["name"]] = RestInvoker(entrypoint=entrypoint, commons=commons, guard=self.__guard,
+                    sessions=self.__sessions)
         #
         super(RestClient, self).__init__(*args, **kwargs)
     #
     #
     def invoke(self, entrypoint_name, input=None):
+        return self.__invoker(entrypoint_name).invoke(input)
+    #
+    #
+    async def invoke_async(self, entrypoint_name, input=None):
+        invoker = self.__invoker(entrypoint_name)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__pool(), self.__bind(invoker.invoke, input))
+    #
+    #
+    def invoke_many(self, calls, return_exceptions=False):
+        # calls: a list of (entrypoint_name, input), invoked concurrently, the results are in the same order
+        invocations = [(self.__invoker(entrypoint_name), input) for entrypoint_name, input in calls]
+        #
+        pool = self.__pool()
+        futures = [pool.submit(self.__bind(invoker.invoke, input)) for invoker, input in invocations]
+        #
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exception:
+                if not return_exceptions:
+                    for other in futures:
+                        other.cancel()
+                    raise
+                results.append(exception)
+        return results
+    #
+    #
+    def close(self):
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.__sessions.close()
+    #
+    #
+    @property
+    def sessions(self):
+        return self.__sessions
+    #
+    #
+    def __invoker(self, entrypoint_name):
         if entrypoint_name not in self.__invokers:
             raise Exception('Rest entrypoint not found')
-        #
-        return self.__invokers[entrypoint_name].invoke(input)
+        return self.__invokers[entrypoint_name]
+    #
+    #
+    def __pool(self):
+        if self.__executor is None:
+            with self.__lock:
+                if self.__executor is None:
+                    self.__executor = ThreadPoolExecutor(thread_name_prefix='rest-client', **self.__executor_options)
+        return self.__executor
+    #
+    #
+    @staticmethod
+    def __bind(func, *args):
+        # the request id and the deadline follow the call into the pool threads
+        return partial(copyRequestScope(func), *args)
     #
     #
     @property
@@ -79,6 +210,10 @@ class BearerAuth(requests.auth.AuthBase):
         if LOG.isEnabledFor(LL.VERBOSE):
             LOG.log(LL.VERBOSE, 'Create a BearerAuth object from the token [%s]' % self.__token)
     #
+    @property
+    def token(self):
+        return self.__token
+    #
     def __call__(self, r):
         bearer_token = r.headers["authorization"] = "Bearer " + self.__token
         if LOG.isEnabledFor(LL.DEBUG):
@@ -97,7 +232,7 @@ class AuthBuilder(object):
     #
     ## Oauth2/Bearer Authentication
     __authenticator = None
-    __access_token = None
+    __tokens = None
     __credentials = None
     #
     #
@@ -118,6 +253,9 @@ class AuthBuilder(object):
             self.__basic_auth = HTTPDigestAuth(auth_args['username'], auth_args['password'])
         if auth_type in [BEARER_AUTH, 'oauth2']:
             self.__authenticator = RestInvoker(entrypoint=auth_args, guard=None)
+            self.__tokens = _TokenCache(self.__fetch_token,
+                    refresh_ahead=auth_args.get('refresh_ahead', 60),
+                    default_expires_in=auth_args.get('default_expires_in', None))
             self.__credentials = None
         pass
     #
@@ -150,23 +288,141 @@ class AuthBuilder(object):
             if LOG.isEnabledFor(LL.DEBUG):
                 LOG.log(LL.DEBUG, 'Inject value from the environment variable to the Bearer-Access-Token')
             return injected_token
-        if self.__access_token is None:
+        if self.__tokens is None:
+            return None
+        return self.__tokens.get()
+    #
+    def invalidate(self, access_token):
+        # the token has been rejected (401), the next access_token fetches another one
+        if self.__tokens is not None:
+            self.__tokens.invalidate(access_token)
+    #
+    def __fetch_token(self):
+        if LOG.isEnabledFor(LL.DEBUG):
+            LOG.log(LL.DEBUG, 'Request a new access_token of [%s]' % self.__name)
+        started = time.monotonic()
+        try:
+            result = self.__authenticator.invoke()
+        except Exception:
+            TOKEN_FETCH_SECONDS.labels(self.__name, 'error').observe(time.monotonic() - started)
+            raise
+        if isinstance(result, dict) and 'access_token' in result:
+            TOKEN_FETCH_SECONDS.labels(self.__name, 'ok').observe(time.monotonic() - started)
+            return result['access_token'], result.get('expires_in', None)
+        TOKEN_FETCH_SECONDS.labels(self.__name, 'empty').observe(time.monotonic() - started)
+        return None, None
+
+
+class _TokenCache(object):
+    #
+    # keeps an access_token until [expires_in] seconds have elapsed; a background thread fetches
+    # the next one [refresh_ahead] seconds before, so that the callers never wait once the first
+    # token has been fetched, and the concurrent fetches of an expired token are coalesced in one.
+    # A token living less than twice [refresh_ahead] is refreshed at half of its lifetime, none is
+    # refreshed in the background sooner than [min_refresh_delay] seconds after it has been fetched
+    #
+    def __init__(self, fetch, refresh_ahead=60, default_expires_in=None, min_refresh_delay=5):
+        self.__fetch = fetch
+        self.__refresh_ahead = refresh_ahead
+        self.__default_expires_in = default_expires_in
+        self.__min_refresh_delay = min_refresh_delay
+        self.__token = None
+        self.__expires_at = None
+        self.__fetching = None
+        self.__timer = None
+        self.__lock = threading.Lock()
+    #
+    def get(self):
+        token = self.__valid_token()
+        if token is not None:
+            return token
+        return self.__refresh(wait=True)
+    #
+    def invalidate(self, token):
+        with self.__lock:
+            if token is not None and token == self.__token:
+                self.__token, self.__expires_at = None, None
+    #
+    def __valid_token(self):
+        token, expires_at = self.__token, self.__expires_at
+        if token is None:
+            return None
+        if expires_at is not None and expires_at <= time.monotonic():
+            return None
+        return token
+    #
+    def __refresh(self, wait):
+        with self.__lock:
+            fetching = self.__fetching
+            owner = fetching is None
+            if owner:
+                fetching = self.__fetching = _Flight()
+        #
+        if not owner:
+            # another thread is fetching it
+            if not wait:
+                return None
+            fetching.done.wait()
+            if fetching.error is not None:
+                raise fetching.error
+            return fetching.result
+        #
+        try:
+            token, expires_in = self.__fetch()
+            if token is not None:
+                self.__store(token, expires_in)
+            fetching.result = token
+            return token
+        except Exception as err:
+            fetching.error = err
+            raise
+        finally:
+            with self.__lock:
+                self.__fetching = None
+            fetching.done.set()
+    #
+    def __store(self, token, expires_in):
+        if expires_in is None:
+            expires_in = self.__default_expires_in
+        with self.__lock:
+            self.__token = token
+            self.__expires_at = None if expires_in is None else time.monotonic() + float(expires_in)
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            delay = self.__refresh_delay(expires_in)
+            if delay is not None:
+                self.__timer = threading.Timer(delay, self.__refresh_in_background)
+                self.__timer.daemon = True
+                self.__timer.start()
+    #
+    def __refresh_delay(self, expires_in):
+        # None: the token is only fetched again by the callers once it has expired
+        if expires_in is None:
+            return None
+        expires_in = float(expires_in)
+        delay = max(expires_in - self.__refresh_ahead, expires_in / 2)
+        if delay < self.__min_refresh_delay:
+            return None
+        return delay
+    #
+    def __refresh_in_background(self):
+        try:
+            self.__refresh(wait=False)
+        except Exception as err:
+            # the token is fetched again by the callers once it has expired
             if LOG.isEnabledFor(LL.DEBUG):
-                LOG.log(LL.DEBUG, 'The access_token not found, request a new credentials')
-            if self.__authenticator is not None:
-                result = self.__authenticator.invoke()
-                if isinstance(result, dict):
-                    if 'access_token' in result:
-                        self.__access_token = result['access_token']
-        return self.__access_token
+                LOG.log(LL.DEBUG, 'The access_token could not be refreshed: %s' % str(err))
 
 
 class RestGuard(object):
     #
-    __auths = dict()
+    __auths = None
     __auth_default = None
     #
     def __init__(self, entrypoints=dict(), default=None, **kwargs):
+        #
+        self.__auths = dict()
         #
         assert isinstance(entrypoints, dict), "entrypoints must be a dict"
         assert default is None or (isinstance(default, str) and default in entrypoints),\
@@ -184,19 +440,489 @@ class RestGuard(object):
         pass
     #
     def getAuth(self, auth_name):
+        builder = self.getAuthBuilder(auth_name)
+        if builder is None:
+            return None
+        return builder.auth
+    #
+    def getAuthBuilder(self, auth_name):
         if auth_name is None:
             auth_name = self.__auth_default
         if auth_name not in self.__auths:
             return None
-        return self.__auths[auth_name].auth
+        return self.__auths[auth_name]
+
+
+class RestSessions(object):
+    #
+    # the keep-alive requests.Session objects of a RestClient, one per host (scope='host') or
+    # one per entrypoint (scope='entrypoint'), configured in mappings['commons']['session']:
+    #
+    #   'session': {
+    #       'scope': 'host',
+    #       'pool_connections': 10,     # number of hosts cached by a session
+    #       'pool_maxsize': 10,         # max connections kept alive per host
+    #       'pool_block': False,        # wait for a free connection instead of opening one more
+    #       'max_retries': 0,
+    #       'keep_alive': True          # False sends "Connection: close"
+    #   }
+    #
+    def __init__(self, scope='host', pool_connections=10, pool_maxsize=10, pool_block=False,
+            max_retries=0, keep_alive=True, **kwargs):
+        assert scope in ['host', 'entrypoint'], "[scope] must be 'host' or 'entrypoint'"
+        self.__scope = scope
+        self.__adapter_args = dict(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                pool_block=pool_block, max_retries=max_retries)
+        self.__keep_alive = keep_alive
+        self.__sessions = dict()
+        self.__lock = threading.Lock()
+        _rest_pools.add(self)
+    #
+    #
+    def session(self, url, entrypoint_name=None):
+        if self.__scope == 'entrypoint' and entrypoint_name is not None:
+            key = entrypoint_name
+        else:
+            parts = urlsplit(url)
+            key = parts.scheme + '://' + parts.netloc
+        #
+        session = self.__sessions.get(key)
+        if session is None:
+            with self.__lock:
+                session = self.__sessions.get(key)
+                if session is None:
+                    session = self.__sessions[key] = self.__create_session()
+                    if LOG.isEnabledFor(LL.DEBUG):
+                        LOG.log(LL.DEBUG, 'Create a pooled session for [%s]: %s', key, str(self.__adapter_args))
+        return session
+    #
+    #
+    def close(self):
+        with self.__lock:
+            sessions, self.__sessions = self.__sessions, dict()
+        for session in sessions.values():
+            session.close()
+        _rest_pools.refresh()
+    #
+    #
+    def stats(self):
+        # (host, opened connections, requests, idle connections) of every connection pool
+        for session in list(self.__sessions.values()):
+            for adapter in session.adapters.values():
+                # e.g. a stub adapter mounted by the tests
+                poolmanager = getattr(adapter, 'poolmanager', None)
+                if poolmanager is None:
+                    continue
+                pools = poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    host = '%s://%s:%s' % (pool.scheme, pool.host, pool.port)
+                    idle = pool.pool.qsize() if pool.pool is not None else 0
+                    yield host, pool.num_connections, pool.num_requests, idle
+    #
+    #
+    def environment(self, url):
+        # the proxies/verify/netrc settings requests would read from the environment on every call,
+        # resolved once per entrypoint; the pooled sessions do not read the environment themselves
+        settings = requests.Session().merge_environment_settings(url, {}, None, None, None)
+        environment = {key: settings[key] for key in ['proxies', 'verify'] if settings.get(key)}
+        netrc_auth = requests.utils.get_netrc_auth(url)
+        if netrc_auth is not None:
+            environment['auth'] = netrc_auth
+        return environment
+    #
+    #
+    def __create_session(self):
+        session = requests.Session()
+        session.trust_env = False
+        for prefix in ['http://', 'https://']:
+            session.mount(prefix, HTTPAdapter(**self.__adapter_args))
+        if not self.__keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+
+class _RestPools(object):
+    #
+    # the RestSessions of this process; the statistics of their pools are copied into the
+    # POOL_* gauges every [interval] seconds by a daemon thread of the process (restarted in
+    # the forked workers), so that the metrics server of the uWSGI master, which has no
+    # session of its own, reads them from the files of the workers
+    #
+    def __init__(self, interval=5):
+        self.__interval = interval
+        self.__all = weakref.WeakSet()
+        self.__hosts = set()
+        self.__thread = None
+        self.__lock = threading.Lock()
+    #
+    def add(self, sessions):
+        self.__all.add(sessions)
+        self.__start()
+    #
+    def after_fork(self):
+        # the thread of the parent does not exist in the child
+        self.__lock = threading.Lock()
+        self.__thread = None
+        if len(self.__all) > 0:
+            self.__start()
+    #
+    def __start(self):
+        if self.__thread is None:
+            with self.__lock:
+                if self.__thread is None:
+                    self.__thread = threading.Thread(target=self.__run, name='redant-rest-pools', daemon=True)
+                    self.__thread.start()
+    #
+    def __run(self):
+        while True:
+            time.sleep(self.__interval)
+            try:
+                self.refresh()
+            except Exception as err:
+                if LOG.isEnabledFor(LL.DEBUG):
+                    LOG.log(LL.DEBUG, 'The statistics of the REST pools could not be refreshed: %s' % str(err))
+    #
+    def refresh(self):
+        with self.__lock:
+            totals = dict()
+            for sessions in list(self.__all):
+                for host, num_connections, num_requests, num_idle in sessions.stats():
+                    total = totals.setdefault(host, [0, 0, 0])
+                    total[0] += num_connections
+                    total[1] += num_requests
+                    total[2] += num_idle
+            # the pools of a closed session are gone
+            for host in self.__hosts - set(totals.keys()):
+                totals[host] = [0, 0, 0]
+            for host, (num_connections, num_requests, num_idle) in totals.items():
+                POOL_CONNECTIONS_OPENED.labels(host).set(num_connections)
+                POOL_REQUESTS.labels(host).set(num_requests)
+                POOL_CONNECTIONS_IDLE.labels(host).set(num_idle)
+            self.__hosts = set(host for host, total in totals.items() if any(total))
+
+_rest_pools = _RestPools()
+os.register_at_fork(after_in_child=_rest_pools.after_fork)
+
+
+class _RetryPolicy(object):
+    #
+    # [attempts] calls at most, separated by a random delay in [0, min(max_backoff, backoff * 2^n)]
+    # ("full jitter"); the non-idempotent methods are not retried unless listed in [methods]
+    #
+    def __init__(self, method, attempts=3, backoff=0.1, max_backoff=2, statuses=[502, 503, 504],
+            methods=['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'], **kwargs):
+        assert isinstance(attempts, int) and attempts > 0, 'attempts must be a positive integer'
+        self.__attempts = attempts if method.upper() in [m.upper() for m in methods] else 1
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+        self.__statuses = frozenset(statuses)
+    #
+    def allows(self, attempt):
+        return attempt + 1 < self.__attempts
+    #
+    def retries_on(self, status_code):
+        return status_code in self.__statuses
+    #
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.__max_backoff, self.__backoff * (2 ** attempt)))
+
+
+class _CircuitBreaker(object):
+    #
+    # opened after [failure_threshold] consecutive failures (errors or 5xx), the calls then fail
+    # fast with RestInvocationError; after [recovery_timeout] seconds, [half_open_max_calls]
+    # trial calls are let through, their success closes the circuit, a failure opens it again
+    #
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1, **kwargs):
+        self.__name = str(name)
+        self.__failure_threshold = failure_threshold
+        self.__recovery_timeout = recovery_timeout
+        self.__half_open_max_calls = half_open_max_calls
+        self.__state = CIRCUIT_CLOSED
+        self.__failures = 0
+        self.__opened_at = None
+        self.__trials = 0
+        self.__lock = threading.Lock()
+        CIRCUIT_STATE.labels(self.__name).set(CIRCUIT_CLOSED)
+    #
+    @property
+    def state(self):
+        return self.__state
+    #
+    def acquire(self):
+        with self.__lock:
+            if self.__state == CIRCUIT_OPEN:
+                if time.monotonic() - self.__opened_at < self.__recovery_timeout:
+                    raise errors.RestInvocationError('[%s] circuit is open' % self.__name)
+                self.__switch(CIRCUIT_HALF_OPEN)
+            if self.__state == CIRCUIT_HALF_OPEN:
+                if self.__trials >= self.__half_open_max_calls:
+                    raise errors.RestInvocationError('[%s] circuit is half-open' % self.__name)
+                self.__trials += 1
+    #
+    def release(self, succeeded):
+        # succeeded=None: the call tells nothing about the backend (e.g. the deadline of the caller has run out)
+        with self.__lock:
+            if succeeded is None:
+                if self.__state == CIRCUIT_HALF_OPEN and self.__trials > 0:
+                    self.__trials -= 1
+                return
+            if succeeded:
+                self.__failures = 0
+                if self.__state != CIRCUIT_CLOSED:
+                    self.__switch(CIRCUIT_CLOSED)
+                return
+            self.__failures += 1
+            if self.__state == CIRCUIT_HALF_OPEN or self.__failures >= self.__failure_threshold:
+                self.__switch(CIRCUIT_OPEN)
+    #
+    def __switch(self, state):
+        if LOG.isEnabledFor(LL.DEBUG):
+            LOG.log(LL.DEBUG, 'The circuit of [%s] switches from [%d] to [%d]' % (self.__name, self.__state, state))
+        self.__state = state
+        self.__trials = 0
+        if state == CIRCUIT_OPEN:
+            self.__opened_at = time.monotonic()
+        CIRCUIT_STATE.labels(self.__name).set(state)
+
+
+class _StreamReader(object):
+    #
+    # hands the o_transformer an iterator over the elements of a JSON array or the lines of
+    # a NDJSON body (format: 'json_array', 'ndjson' or None to decide from the Content-Type),
+    # read by chunks of [chunk_size] bytes; the responses with an error status are buffered
+    #
+    NDJSON_TYPES = ['application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-seq']
+    #
+    def __init__(self, name, format=None, max_body_size=None, read_timeout=None, connect_timeout=None,
+            chunk_size=64*1024, **kwargs):
+        assert format in [None, 'json_array', 'ndjson'], "[format] must be 'json_array' or 'ndjson'"
+        self.__name = str(name)
+        self.__format = format
+        self.__max_body_size = max_body_size
+        self.__chunk_size = chunk_size
+        self.__timeout = None
+        if read_timeout is not None or connect_timeout is not None:
+            self.__timeout = (connect_timeout, read_timeout)
+    #
+    @property
+    def timeout(self):
+        return self.__timeout
+    #
+    def read(self, r):
+        if not r.ok:
+            try:
+                text = b''.join(self.__chunks(r)).decode(r.encoding or 'utf-8', errors='replace')
+            finally:
+                r.close()
+            try:
+                return json.loads(text)
+            except ValueError as err:
+                return text
+        return self.__iterate(r)
+    #
+    def __iterate(self, r):
+        format = self.__format
+        if format is None:
+            content_type = r.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            format = 'ndjson' if content_type in self.NDJSON_TYPES else 'json_array'
+        try:
+            texts = decode_chunks(self.__chunks(r), r.encoding or 'utf-8')
+            for element in (iter_ndjson(texts) if format == 'ndjson' else iter_json_array(texts)):
+                yield element
+        except requests.RequestException as err:
+            raise errors.RestInvocationError('[%s] the body could not be read: %s' % (self.__name, str(err)))
+        except ValueError as err:
+            raise errors.RestReturnBodyError('[%s] invalid body: %s' % (self.__name, str(err)))
+        finally:
+            r.close()
+    #
+    def __chunks(self, r):
+        return self.__counted(limit_size(r.iter_content(self.__chunk_size), self.__max_body_size, self.__too_large))
+    #
+    def __counted(self, chunks):
+        received = RESPONSE_BYTES.labels(self.__name)
+        for chunk in chunks:
+            received.inc(len(chunk))
+            yield chunk
+    #
+    def __too_large(self, message):
+        return errors.RestProcessingError('[%s] %s' % (self.__name, message))
+
+
+_CachedResponse = namedtuple('_CachedResponse', ['response', 'fetched_at', 'etag', 'last_modified'])
+
+
+class _ResponseCache(object):
+    #
+    # the successful responses of an entrypoint, keyed on the method, the URL and the normalized
+    # arguments; fresh for [ttl] seconds, then served while being revalidated in the background
+    # for [stale_while_revalidate] seconds, then revalidated with a conditional request
+    #
+    def __init__(self, name, ttl=60, stale_while_revalidate=0, max_size=1024, **kwargs):
+        self.__name = str(name)
+        self.__ttl = ttl
+        self.__stale_while_revalidate = stale_while_revalidate
+        self.__entries = LRUCache(max_size=max_size)
+        self.__revalidating = set()
+        self.__lock = threading.Lock()
+    #
+    def fetch(self, key, kwargs, exchange):
+        entry = self.__entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.__ttl:
+                CACHE_REQUESTS.labels(self.__name, 'hit').inc()
+                return entry.response
+            if age < self.__ttl + self.__stale_while_revalidate:
+                CACHE_REQUESTS.labels(self.__name, 'stale').inc()
+                self.__revalidate_in_background(key, entry, kwargs, exchange)
+                return entry.response
+        #
+        r, result = self.__revalidate(key, entry, kwargs, exchange)
+        CACHE_REQUESTS.labels(self.__name, result).inc()
+        return r
+    #
+    def clear(self):
+        self.__entries.clear()
+    #
+    def __revalidate(self, key, entry, kwargs, exchange):
+        kwargs = dict(kwargs)
+        headers = kwargs['headers'] = dict(kwargs.get('headers') or {})
+        if entry is not None:
+            if entry.etag is not None:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified is not None:
+                headers['If-Modified-Since'] = entry.last_modified
+        #
+        fetched_at = time.monotonic()
+        r = exchange(kwargs)
+        #
+        if r.status_code == 304 and entry is not None:
+            self.__entries.put(key, entry._replace(fetched_at=fetched_at))
+            return entry.response, 'revalidated'
+        #
+        if r.status_code == 200 and 'no-store' not in r.headers.get('Cache-Control', ''):
+            self.__entries.put(key, _CachedResponse(r, fetched_at, r.headers.get('ETag'), r.headers.get('Last-Modified')))
+        return r, 'miss'
+    #
+    def __revalidate_in_background(self, key, entry, kwargs, exchange):
+        with self.__lock:
+            if key in self.__revalidating:
+                return
+            self.__revalidating.add(key)
+        #
+        def run():
+            try:
+                self.__revalidate(key, entry, kwargs, exchange)
+            except Exception as err:
+                if LOG.isEnabledFor(LL.DEBUG):
+                    LOG.log(LL.DEBUG, 'The cached response of [%s] could not be revalidated: %s' % (self.__name, str(err)))
+            finally:
+                with self.__lock:
+                    self.__revalidating.discard(key)
+        #
+        # not bound by the deadline of the request, its response has already been served
+        threading.Thread(target=copyRequestScope(run, with_deadline=False), daemon=True).start()
+
+
+class _SingleFlight(object):
+    #
+    # the concurrent calls with the same key share the response of the first one
+    #
+    def __init__(self, name):
+        self.__name = str(name)
+        self.__calls = dict()
+        self.__lock = threading.Lock()
+    #
+    def run(self, key, func, *args):
+        with self.__lock:
+            call = self.__calls.get(key)
+            owner = call is None
+            if owner:
+                call = self.__calls[key] = _Flight()
+        #
+        if not owner:
+            COALESCED_CALLS.labels(self.__name).inc()
+            # bounded by the deadline of the waiter, not by the one of the owner
+            if not call.done.wait(getRemainingTime()):
+                raise errors.RestDeadlineExceededError('[%s] the deadline of the request has been exceeded' % self.__name)
+            if call.error is not None:
+                raise call.error
+            return call.result
+        #
+        try:
+            call.result = func(*args)
+            return call.result
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+
+
+class _Flight(object):
+    #
+    __slots__ = ['done', 'result', 'error']
+    #
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _body_size(body):
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    # None, or a generator / file streamed by requests
+    return 0
+
+
+def _clamp_timeout(timeout, remaining):
+    # the (connect, read) timeouts of requests, none longer than the remaining time
+    if timeout is None:
+        return (remaining, remaining)
+    if isinstance(timeout, (list, tuple)):
+        connect, read = timeout
+        return (remaining if connect is None else min(connect, remaining),
+                remaining if read is None else min(read, remaining))
+    return min(timeout, remaining)
+
+
+def _request_key(method, url, kwargs):
+    # the arguments of a call, before its auth and X-Request-Id are added
+    normalized = dict(kwargs)
+    if 'headers' in normalized and isinstance(normalized['headers'], dict):
+        normalized['headers'] = {str(k).lower(): v for k, v in normalized['headers'].items()}
+    return '%s %s %s' % (method.upper(), url, json.dumps(normalized, sort_keys=True, default=str))
+
+
+_InvocationPlan = namedtuple('_InvocationPlan', [
+    'name', 'method', 'url',
+    'headers',          # the entrypoint and commons headers, merged
+    'header_keys',      # lower-cased name -> name in [headers]
+    'body',             # the default body
+    'body_key',         # 'json' or 'data'
+    'auth',             # the AuthBuilder of the entrypoint or None
+    'session',          # the pooled requests.Session or None
+    'options'           # the static arguments of requests, e.g. stream/timeout
+])
 
 
 class RestInvoker(object):
     #
     #
-    def __init__(self, entrypoint, commons=None, guard=None, **kwargs):
+    def __init__(self, entrypoint, commons=None, guard=None, sessions=None, **kwargs):
         self.__entrypoint = entrypoint
         self.__guard = guard
+        self.__sessions = sessions
         #
         self.__auth_name = entrypoint['auth_name'] if 'auth_name' in entrypoint else None
         #
@@ -212,6 +938,9 @@ class RestInvoker(object):
         #
         self.__method = entrypoint['method'] if 'method' in entrypoint else 'GET'
         #
+        # the label of the metrics, the token endpoints of the auth_config have no name
+        self.__metric_name = entrypoint.get('name') or self.__url
+        #
         self.__headers = entrypoint['headers'] if 'headers' in entrypoint else {}
         if commons is not None and 'headers' in commons and isinstance(commons['headers'], dict):
             self.__headers = CaseInsensitiveDict(self.__headers)
@@ -222,77 +951,264 @@ class RestInvoker(object):
         #
         self.__body = entrypoint['body'] if 'body' in entrypoint else None
         #
+        # seconds, or [connect, read] seconds; shortened to the remaining time of the request deadline
+        self.__timeout = entrypoint['timeout'] if 'timeout' in entrypoint else None
+        if self.__timeout is None and commons is not None and 'timeout' in commons:
+            self.__timeout = commons['timeout']
+        #
         self.__body_as_json = not ('body_as_json' in entrypoint and entrypoint['body_as_json'] is False)
         #
         self.__i_transformer = RestInvoker.__extractCallable('i_transformer', entrypoint, commons)
         self.__o_transformer = RestInvoker.__extractCallable('o_transformer', entrypoint, commons)
+        #
+        # opt-in, e.g. 'retry': {'attempts': 3, 'backoff': 0.1, 'max_backoff': 2, 'statuses': [502, 503, 504]}
+        self.__retry = None
+        if 'retry' in entrypoint and entrypoint['retry']:
+            self.__retry = _RetryPolicy(self.__method, **entrypoint['retry'])
+        #
+        # opt-in, e.g. 'circuit_breaker': {'failure_threshold': 5, 'recovery_timeout': 30}
+        self.__breaker = None
+        if 'circuit_breaker' in entrypoint and entrypoint['circuit_breaker']:
+            self.__breaker = _CircuitBreaker(entrypoint.get('name'), **entrypoint['circuit_breaker'])
+        #
+        # opt-in, e.g. 'cache': {'ttl': 60, 'stale_while_revalidate': 30, 'max_size': 1024}
+        self.__cache = None
+        if 'cache' in entrypoint and entrypoint['cache']:
+            assert self.__method.upper() in ['GET', 'HEAD'], 'only the GET/HEAD entrypoints can be cached'
+            self.__cache = _ResponseCache(entrypoint.get('name'), **entrypoint['cache'])
+        #
+        # opt-in, 'stream': True or e.g. {'format': 'ndjson', 'max_body_size': 10485760, 'read_timeout': 30}
+        self.__stream = None
+        if 'stream' in entrypoint and entrypoint['stream']:
+            assert not entrypoint.get('cache') and not entrypoint.get('coalesce'), 'a streamed response cannot be shared'
+            stream_options = entrypoint['stream'] if isinstance(entrypoint['stream'], dict) else {}
+            self.__stream = _StreamReader(self.__metric_name, **stream_options)
+        #
+        # opt-in for the safe entrypoints, 'coalesce': True
+        self.__flights = None
+        if 'coalesce' in entrypoint and entrypoint['coalesce']:
+            assert self.__method.upper() in ['GET', 'HEAD'], 'only the GET/HEAD entrypoints can be coalesced'
+            self.__flights = _SingleFlight(entrypoint.get('name'))
+        #
+        self.__plan = self.__compile()
+    #
+    #
+    def __compile(self):
+        # everything that does not depend on the input of a call, resolved once
+        headers = {str(key): value for key, value in self.__headers.items()}
+        #
+        options = dict()
+        if self.__sessions is not None:
+            options.update(self.__sessions.environment(self.__url))
+        if self.__timeout is not None:
+            options['timeout'] = tuple(self.__timeout) if isinstance(self.__timeout, (list, tuple)) else self.__timeout
+        if self.__stream is not None:
+            options['stream'] = True
+            if self.__stream.timeout is not None:
+                options['timeout'] = self.__stream.timeout
+        #
+        return _InvocationPlan(
+            name=self.__entrypoint.get('name'),
+            method=self.__method,
+            url=self.__url,
+            headers=headers,
+            header_keys={key.lower(): key for key in headers},
+            body=self.__body,
+            body_key='json' if self.__body_as_json else 'data',
+            auth=self.__guard.getAuthBuilder(self.__auth_name) if self.__guard is not None else None,
+            session=self.__sessions.session(self.__url, self.__entrypoint.get('name')) if self.__sessions is not None else None,
+            options=options)
     #
     #
     def invoke(self, *args, **kwargs):
+        plan = self.__plan
         #
         kwargs = self.sanitize(self.__i_transformer(*args, **kwargs))
         #
-        if self.__guard is not None:
-            auth = self.__guard.getAuth(self.__auth_name)
-            if auth is not None:
-                kwargs['auth'] = auth
-        #
-        if 'body' not in kwargs and self.__body is not None:
-            kwargs['body'] = self.__body
+        # the input of the caller is left untouched, it may be shared by other calls
+        kwargs = dict(kwargs)
         #
-        if 'body' in kwargs:
-            if self.__body_as_json:
-                kwargs['json'] = kwargs['body']
-            else:
-                kwargs['data'] = kwargs['body']
-            #
-            del kwargs['body']
+        body = kwargs.pop('body', plan.body)
+        if body is not None:
+            kwargs[plan.body_key] = body
         #
-        kwargs = self.__merge_default_headers(kwargs)
+        if 'headers' not in kwargs:
+            kwargs['headers'] = dict(plan.headers)
+        elif isinstance(kwargs['headers'], dict):
+            kwargs['headers'] = self.__merge_headers(plan, kwargs['headers'])
         #
-        kwargs = self.__add_request_id(kwargs)
+        for key, value in plan.options.items():
+            kwargs.setdefault(key, value)
         #
-        if LOG.isEnabledFor(LL.VERBOSE):
-            LOG.log(LL.VERBOSE, 'REST invocation parameters: %s', str(kwargs))
+        exchange = self.__exchange
+        if self.__flights is not None:
+            exchange = self.__coalesced_exchange
+        if self.__cache is not None:
+            exchange = partial(self.__cache.fetch, _request_key(plan.method, plan.url, kwargs), exchange=exchange)
+        r = exchange(kwargs)
         #
-        r = requests.request(self.__method, self.__url, **kwargs)
-        try:
-            body = r.json()
-        except JSONDecodeError as err:
-            body = r.text
+        if self.__stream is not None:
+            body = self.__stream.read(r)
+        else:
+            try:
+                body = r.json()
+            except ValueError as err:
+                body = r.text
         #
         return self.__o_transformer(body=body, status_code=r.status_code, response=r)
     #
     #
-    def sanitize(self, opts=dict()):
-        return opts
+    @staticmethod
+    def __merge_headers(plan, headers):
+        # the headers of the call override the defaults of the plan, unless they are None
+        merged = dict(plan.headers)
+        for key, value in headers.items():
+            default_key = plan.header_keys.get(str(key).lower())
+            if value is None:
+                if default_key is None:
+                    merged[key] = value
+                continue
+            if default_key is not None:
+                del merged[default_key]
+            merged[key] = value
+        return merged
     #
     #
-    def __merge_default_headers(self, opts=None):
-        if not isinstance(opts, dict):
-            return opts
+    def __coalesced_exchange(self, kwargs):
+        # keyed on the actual arguments, the conditional requests of the cache are not mixed up with the others
+        return self.__flights.run(_request_key(self.__method, self.__url, kwargs), self.__exchange, kwargs)
+    #
+    #
+    def __exchange(self, kwargs):
+        if self.__retry is None and self.__breaker is None:
+            return self.__exchange_once(kwargs)
         #
-        if 'headers' in opts:
-            if isinstance(opts['headers'], dict):
-                headers = opts['headers'] = CaseInsensitiveDict(opts['headers'])
+        if self.__breaker is not None:
+            # a request without time left does not take the place of a trial call
+            remaining = getRemainingTime()
+            if remaining is not None and remaining <= 0:
+                raise errors.RestDeadlineExceededError('[%s] the deadline of the request has been exceeded' % self.__plan.name)
+            self.__breaker.acquire()
+        try:
+            r = self.__exchange_with_retry(kwargs)
+        except errors.RestDeadlineExceededError as err:
+            # nothing sent: the budget of the caller, not a failure of the backend
+            if self.__breaker is not None:
+                self.__breaker.release(succeeded=False if err.sent else None)
+            raise
+        except Exception:
+            if self.__breaker is not None:
+                self.__breaker.release(succeeded=False)
+            raise
+        if self.__breaker is not None:
+            self.__breaker.release(succeeded=r.status_code < 500)
+        return r
+    #
+    #
+    def __exchange_with_retry(self, kwargs):
+        attempt = 0
+        while True:
+            try:
+                r = self.__exchange_once(kwargs)
+            except errors.RestDeadlineExceededError as err:
+                # the previous attempts have reached the backend
+                err.sent = err.sent or attempt > 0
+                raise
+            except requests.RequestException as err:
+                if self.__retry is None or not self.__retry.allows(attempt):
+                    raise errors.RestInvocationError('[%s] %s %s failed: %s' %
+                            (self.__entrypoint.get('name'), self.__method, self.__url, str(err)))
+                reason = type(err).__name__
             else:
-                headers = None
-        else:
-            headers = opts['headers'] = CaseInsensitiveDict()
+                if self.__retry is None or not self.__retry.retries_on(r.status_code):
+                    return r
+                # the discarded response gives its connection back to the pool
+                r.close()
+                if not self.__retry.allows(attempt):
+                    raise errors.RestStatusCodeError('[%s] %s %s returned %d' %
+                            (self.__entrypoint.get('name'), self.__method, self.__url, r.status_code))
+                reason = str(r.status_code)
+            #
+            RETRIES.labels(self.__metric_name, reason).inc()
+            delay = self.__retry.backoff(attempt)
+            remaining = getRemainingTime()
+            if remaining is not None and delay >= remaining:
+                raise errors.RestInvocationError('[%s] the deadline of the request does not allow another attempt' %
+                        self.__entrypoint.get('name'))
+            if LOG.isEnabledFor(LL.DEBUG):
+                LOG.log(LL.DEBUG, 'Retry [%s] in %.3f seconds (attempt %d)' % (self.__entrypoint.get('name'), delay, attempt + 1))
+            time.sleep(delay)
+            attempt += 1
+    #
+    #
+    def __exchange_once(self, kwargs):
+        plan = self.__plan
         #
-        if headers is not None:
-            if isinstance(self.__headers, dict):
-                for key in self.__headers.keys():
-                    if key not in headers or headers[key] is None:
-                        headers[key] = self.__headers[key]
+        kwargs = dict(kwargs)
+        if isinstance(kwargs.get('headers'), dict):
+            kwargs['headers'] = dict(kwargs['headers'])
+            kwargs['headers']['X-Request-Id'] = getRequestId()
         #
-        return opts
+        remaining = getRemainingTime()
+        if remaining is not None:
+            if remaining <= 0:
+                raise errors.RestDeadlineExceededError('[%s] the deadline of the request has been exceeded' % plan.name)
+            kwargs['timeout'] = _clamp_timeout(kwargs.get('timeout'), remaining)
+        #
+        if plan.auth is not None:
+            auth = plan.auth.auth
+            if auth is not None:
+                kwargs['auth'] = auth
+        #
+        if LOG.isEnabledFor(LL.VERBOSE):
+            LOG.log(LL.VERBOSE, 'REST invocation parameters: %s', str(kwargs))
+        #
+        try:
+            r = self.__send(kwargs)
+        except requests.Timeout as err:
+            if remaining is not None and getRemainingTime() <= 0:
+                raise errors.RestDeadlineExceededError('[%s] the deadline of the request has been exceeded: %s' % (plan.name, str(err)),
+                        sent=True)
+            raise
+        #
+        # the bearer token may have been revoked before its expiry, retry once with a new one
+        if r.status_code == 401 and plan.auth is not None and isinstance(kwargs.get('auth'), BearerAuth):
+            plan.auth.invalidate(kwargs['auth'].token)
+            if LOG.isEnabledFor(LL.DEBUG):
+                LOG.log(LL.DEBUG, 'The access_token has been rejected, retry with a new one')
+            auth = plan.auth.auth
+            if auth is not None:
+                kwargs['auth'] = auth
+                RETRIES.labels(self.__metric_name, 'unauthorized').inc()
+                r = self.__send(kwargs)
+        #
+        return r
     #
     #
-    def __add_request_id(self, opts=None):
-        if isinstance(opts, dict):
-            if 'headers' in opts and isinstance(opts['headers'], dict):
-                opts['headers']['X-Request-Id'] = getRequestId()
+    def __send(self, kwargs):
+        plan = self.__plan
+        started = time.monotonic()
+        try:
+            if plan.session is not None:
+                r = plan.session.request(plan.method, plan.url, **kwargs)
+            else:
+                r = requests.request(plan.method, plan.url, **kwargs)
+        except requests.RequestException as err:
+            REQUEST_SECONDS.labels(self.__metric_name, plan.method).observe(time.monotonic() - started)
+            RESPONSES.labels(self.__metric_name, plan.method, type(err).__name__).inc()
+            raise
+        REQUEST_SECONDS.labels(self.__metric_name, plan.method).observe(time.monotonic() - started)
+        RESPONSES.labels(self.__metric_name, plan.method, str(r.status_code)).inc()
+        sent = _body_size(r.request.body)
+        if sent:
+            REQUEST_BYTES.labels(self.__metric_name).inc(sent)
+        # a streamed body is counted while it is read (_StreamReader)
+        if not kwargs.get('stream'):
+            RESPONSE_BYTES.labels(self.__metric_name).inc(len(r.content))
+        return r
+    #
+    #
+    def sanitize(self, opts=dict()):
         return opts
     #
     #
@@ -16,10 +16,24 @@ class InvalidTimeZoneError(RedantError):
     def __init__(self, *args, **kwargs):
         super(InvalidTimeZoneError, self).__init__(self,*args,**kwargs)
 
+class HandlerNotFoundError(RedantError):
+    def __init__(self, *args, **kwargs):
+        super(HandlerNotFoundError, self).__init__(self,*args,**kwargs)
+
+class ConversationConflictError(RedantError):
+    def __init__(self, *args, **kwargs):
+        super(ConversationConflictError, self).__init__(self,*args,**kwargs)
+
 class RestInvocationError(RedantError):
     def __init__(self, *args, **kwargs):
         super(RestInvocationError, self).__init__(self,*args,**kwargs)
 
+class RestDeadlineExceededError(RestInvocationError):
+    def __init__(self, *args, sent=False, **kwargs):
+        super(RestDeadlineExceededError, self).__init__(*args,**kwargs)
+        # the request has been sent and timed out: it tells about the backend
+        self.sent = sent
+
 class RestProcessingError(RedantError):
     def __init__(self, *args, **kwargs):
         super(RestProcessingError, self).__init__(self,*args,**kwargs)
@@ -1,18 +1,28 @@
 #!/usr/bin/env python
 
-from redant.utils.database import sqldb as db
+import json
+import pytz
+import threading
+import time
+
+from collections import namedtuple
+from redant import errors
+from redant.utils.database import sqldb as db, iter_keyset
+from redant.utils.logging import getLogger, LogLevel as LL
 from redant.utils.string_util import generate_uuid
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 from sqlalchemy import and_, or_
 
+LOG = getLogger(__name__)
+
 class ChannelEntity(db.Model):
     #
     __tablename__ = 'channels'
     #
     #
     channel_id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
-    channel_code = db.Column(db.String(64), nullable = False)
+    channel_code = db.Column(db.String(64), nullable = False, index = True)
     channel_type = db.Column(db.String(16), nullable = False)
     timezone = db.Column(db.String(36), nullable = False)
     settings = db.Column(db.JSON, nullable=True, name='settings')
@@ -29,6 +39,7 @@ class ChannelEntity(db.Model):
     def create(self):
         db.session.add(self)
         db.session.commit()
+        channel_registry.invalidate()
         return self
     #
     #
@@ -47,9 +58,131 @@ class ChannelEntity(db.Model):
     #
     #
     @classmethod
+    def iter_all(cls, channel_type=None, enabled=True, batch_size=1000, columns=None):
+        # the channels of find_all(), read by batches of [batch_size] with a keyset on channel_id;
+        # [columns]: the names of the columns to read instead of the entities (with channel_id)
+        if columns is None:
+            q = cls.query
+        else:
+            unknown = set(columns) - set(ChannelEntity.__table__.columns.keys())
+            if unknown:
+                raise errors.ModelArgumentError('unknown columns of a channel: %s' % sorted(unknown))
+            names = list(columns) + ([] if 'channel_id' in columns else ['channel_id'])
+            q = db.session.query(*[getattr(ChannelEntity, name) for name in names])
+        q = cls.__apply_enabled(q, enabled)
+        if channel_type is not None:
+            q = q.filter(ChannelEntity.channel_type == channel_type)
+        return iter_keyset(q, [ChannelEntity.channel_id], batch_size=batch_size)
+    #
+    #
+    @classmethod
     def __apply_enabled(cls, q, enabled=True):
         if enabled is True:
             return q.filter(or_(ChannelEntity.enabled == None, ChannelEntity.enabled == True))
         elif enabled is False:
-            return q.filter_by(enabled = False)
+            return q.filter(ChannelEntity.enabled == False)
         return q
+
+
+# an enabled channel as kept by the ChannelRegistry, [settings] are shared and must not be modified
+Channel = namedtuple('Channel', ['channel_id', 'channel_code', 'channel_type', 'timezone', 'tzinfo', 'settings', 'enabled'])
+
+
+class ChannelRegistry(object):
+    #
+    # the enabled channels loaded at once and kept in the process, the lookups are dict hits;
+    # reloaded on the first lookup after [refresh_interval] seconds (None: never) or after
+    # invalidate(), the other processes see a change once their own interval has elapsed
+    #
+    def __init__(self, refresh_interval=300):
+        self.__refresh_interval = refresh_interval
+        self.__channels = None
+        self.__loaded_at = None
+        self.__generation = 0
+        self.__lock = threading.Lock()
+        self.__loading = threading.Lock()
+    #
+    #
+    @property
+    def refresh_interval(self):
+        return self.__refresh_interval
+    #
+    @refresh_interval.setter
+    def refresh_interval(self, value):
+        assert value is None or value > 0, 'refresh_interval must be None or a positive number'
+        self.__refresh_interval = value
+    #
+    #
+    def get(self, channel_code):
+        return self.__snapshot().get(channel_code)
+    #
+    def find_all(self, channel_type=None):
+        channels = self.__snapshot().values()
+        if channel_type is None:
+            return list(channels)
+        return [channel for channel in channels if channel.channel_type == channel_type]
+    #
+    def invalidate(self):
+        with self.__lock:
+            self.__channels = None
+            self.__generation += 1
+    #
+    def reload(self):
+        generation = self.__generation
+        channels = dict()
+        for entity in ChannelEntity.find_all():
+            channels[entity.channel_code] = self.__parse(entity)
+        with self.__lock:
+            # not kept if invalidated meanwhile, it may have been read before the change
+            if generation == self.__generation:
+                self.__channels, self.__loaded_at = channels, time.monotonic()
+        if LOG.isEnabledFor(LL.DEBUG):
+            LOG.log(LL.DEBUG, 'ChannelRegistry loaded %d channels' % len(channels))
+        return channels
+    #
+    #
+    def __snapshot(self):
+        channels = self.__fresh()
+        if channels is not None:
+            return channels
+        # a single thread reloads, the others wait for its result
+        with self.__loading:
+            channels = self.__fresh()
+            if channels is not None:
+                return channels
+            return self.reload()
+    #
+    def __fresh(self):
+        channels, loaded_at = self.__channels, self.__loaded_at
+        if channels is None:
+            return None
+        if self.__refresh_interval is not None and time.monotonic() - loaded_at >= self.__refresh_interval:
+            return None
+        return channels
+    #
+    @staticmethod
+    def __parse(entity):
+        settings = entity.settings
+        if isinstance(settings, str):
+            try:
+                settings = json.loads(settings)
+            except ValueError as err:
+                LOG.log(LL.WARNING, 'Invalid settings of the channel[%s]: %s' % (entity.channel_code, str(err)))
+        try:
+            tzinfo = pytz.timezone(entity.timezone)
+        except pytz.UnknownTimeZoneError:
+            LOG.log(LL.WARNING, 'Unknown timezone[%s] of the channel[%s]' % (entity.timezone, entity.channel_code))
+            tzinfo = None
+        return Channel(channel_id=entity.channel_id, channel_code=entity.channel_code,
+                channel_type=entity.channel_type, timezone=entity.timezone, tzinfo=tzinfo,
+                settings=settings, enabled=entity.enabled)
+
+
+channel_registry = ChannelRegistry()
+
+def channel_registry_hook(app):
+    # loaded at the startup, REDANT_CHANNELS_REFRESH_INTERVAL: seconds between the reloads
+    if 'REDANT_CHANNELS_REFRESH_INTERVAL' in app.config:
+        channel_registry.refresh_interval = app.config['REDANT_CHANNELS_REFRESH_INTERVAL']
+    with app.app_context():
+        channel_registry.reload()
@@ -1,22 +1,27 @@
 #!/usr/bin/env python
 
-from redant.utils.database import sqldb as db
+from redant import errors
+from redant.utils.database import sqldb as db, bulk_write, group_by_columns, iter_keyset, upsert_statement
 from redant.utils.string_util import generate_uuid
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
+from sqlalchemy import bindparam, exc, insert, update
 
 class ChatterEntity(db.Model):
     __tablename__ = 'chatters'
     chatter_id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
-    chatter_code = db.Column(db.String(64), nullable = False)
+    chatter_code = db.Column(db.String(64), nullable = False, unique = True)
     notes = db.Column(db.JSON, nullable=True)
     #
-    phone_number = db.Column(db.String(16), nullable = True)
+    phone_number = db.Column(db.String(16), nullable = True, index = True)
     email = db.Column(db.String(120), unique = False, nullable = True)
     first_name = db.Column(db.String(120), unique = False, nullable = True)
     last_name = db.Column(db.String(120), unique = False, nullable = True)
     banned = db.Column(db.Boolean(), nullable = True)
     #
+    # the fields accepted by bulk_create() and bulk_upsert()
+    BULK_FIELDS = ['chatter_code', 'phone_number', 'email', 'first_name', 'last_name', 'notes']
+    #
     #
     def __init__(self, chatter_code, phone_number=None, email=None,
             first_name=None, last_name=None, notes=None, **kwargs):
@@ -45,6 +50,135 @@ class ChatterEntity(db.Model):
         return cls.query\
             .filter_by(phone_number = phone_number)\
             .first()
+    #
+    @classmethod
+    def iter_all(cls, batch_size=1000, columns=None):
+        # all the chatters, read by batches of [batch_size] with a keyset on chatter_id;
+        # [columns]: the names of the columns to read instead of the entities (with chatter_id)
+        if columns is None:
+            q = cls.query
+        else:
+            unknown = set(columns) - set(ChatterEntity.__table__.columns.keys())
+            if unknown:
+                raise errors.ModelArgumentError('unknown columns of a chatter: %s' % sorted(unknown))
+            names = list(columns) + ([] if 'chatter_id' in columns else ['chatter_id'])
+            q = db.session.query(*[getattr(ChatterEntity, name) for name in names])
+        return iter_keyset(q, [ChatterEntity.chatter_id], batch_size=batch_size)
+    #
+    @classmethod
+    def find_id_by__chatter_code(cls, chatter_code, for_update=False):
+        q = db.session.query(ChatterEntity.chatter_id)\
+            .filter_by(chatter_code = chatter_code)
+        if for_update:
+            # a locking read sees the rows committed after the snapshot of the transaction (InnoDB)
+            q = q.with_for_update(read=True)
+        return q.scalar()
+    #
+    @classmethod
+    def find_ids_by__chatter_codes(cls, chatter_codes, for_update=False):
+        # {chatter_code: chatter_id} of the existing ones
+        q = db.session.query(ChatterEntity.chatter_code, ChatterEntity.chatter_id)\
+            .filter(ChatterEntity.chatter_code.in_(list(chatter_codes)))
+        if for_update:
+            q = q.with_for_update(read=True)
+        return dict(q.all())
+    #
+    @classmethod
+    def upsert_by__chatter_code(cls, chatter_code, phone_number=None):
+        #
+        # the chatter_id of [chatter_code], inserted if missing (an existing row is left untouched);
+        # in the current transaction, not committed. The concurrent first messages of a chatter
+        # insert it once, guarded by the unique constraint on chatter_code
+        chatter_id = cls.find_id_by__chatter_code(chatter_code)
+        if chatter_id is not None:
+            return chatter_id
+        #
+        values = dict(chatter_id=generate_uuid(), chatter_code=chatter_code, phone_number=phone_number)
+        statement = upsert_statement(ChatterEntity, ['chatter_code'])
+        if statement is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(ChatterEntity).values(**values))
+                return values['chatter_id']
+            except exc.IntegrityError:
+                pass
+        # the rowcount of MySQL does not tell an insert from a duplicate (CLIENT_FOUND_ROWS)
+        elif db.session.execute(statement.values(**values)).rowcount == 1 and db.engine.dialect.name != 'mysql':
+            return values['chatter_id']
+        #
+        return cls.find_id_by__chatter_code(chatter_code, for_update=True)
+    #
+    @classmethod
+    def upsert_all_by__chatter_codes(cls, chatters):
+        #
+        # {chatter_code: chatter_id} of [chatters] ({chatter_code: phone_number}), the missing ones
+        # inserted as upsert_by__chatter_code() does, by a single statement
+        chatter_ids = cls.find_ids_by__chatter_codes(chatters.keys())
+        missing = [dict(chatter_id=generate_uuid(), chatter_code=chatter_code, phone_number=phone_number)
+                for chatter_code, phone_number in chatters.items() if chatter_code not in chatter_ids]
+        if not missing:
+            return chatter_ids
+        #
+        statement = upsert_statement(ChatterEntity, ['chatter_code'])
+        if statement is None:
+            db.session.execute(insert(ChatterEntity), missing)
+        elif db.session.execute(statement, missing).rowcount != len(missing) or db.engine.dialect.name == 'mysql':
+            # some of them have been inserted by another transaction meanwhile
+            return cls.find_ids_by__chatter_codes(chatters.keys(), for_update=True)
+        chatter_ids.update((row['chatter_code'], row['chatter_id']) for row in missing)
+        return chatter_ids
+    #
+    #
+    @classmethod
+    def bulk_create(cls, chatters, chunk_size=1000, progress=None):
+        #
+        # inserts [chatters], an iterable of dicts of BULK_FIELDS, by batches of [chunk_size] rows with
+        # a commit each; progress(count) is called after every batch. An existing chatter_code fails
+        # its batch (IntegrityError), see bulk_upsert()
+        def write_chunk(chunk):
+            rows = [cls.__bulk_row(chatter) for chatter in chunk]
+            db.session.execute(insert(ChatterEntity), [dict({field: None for field in cls.BULK_FIELDS},
+                    chatter_id=generate_uuid(), **row) for row in rows])
+        return bulk_write(chatters, write_chunk, chunk_size=chunk_size, progress=progress)
+    #
+    @classmethod
+    def bulk_upsert(cls, chatters, chunk_size=1000, progress=None):
+        #
+        # as bulk_create(), the given fields of the existing chatters are updated instead
+        def write_chunk(chunk):
+            # the last of the duplicates of a batch wins
+            rows = {row['chatter_code']: row for row in (cls.__bulk_row(chatter) for chatter in chunk)}
+            for columns, group in group_by_columns(rows.values()):
+                update_columns = [column for column in columns if column != 'chatter_code']
+                statement = upsert_statement(ChatterEntity, ['chatter_code'], update_columns)
+                if statement is None:
+                    cls.__merge(group, update_columns)
+                else:
+                    db.session.execute(statement, [dict(row, chatter_id=generate_uuid()) for row in group])
+        return bulk_write(chatters, write_chunk, chunk_size=chunk_size, progress=progress)
+    #
+    @classmethod
+    def __merge(cls, rows, update_columns):
+        # without an upsert statement: the existing ones are updated, the others inserted
+        chatter_ids = cls.find_ids_by__chatter_codes([row['chatter_code'] for row in rows], for_update=True)
+        updated = [row for row in rows if row['chatter_code'] in chatter_ids]
+        if updated and update_columns:
+            statement = update(ChatterEntity)\
+                .where(ChatterEntity.chatter_code == bindparam('b_chatter_code'))\
+                .values({column: bindparam('b_' + column) for column in update_columns})
+            db.session.execute(statement, [{'b_' + key: value for key, value in row.items()} for row in updated])
+        inserted = [dict(row, chatter_id=generate_uuid()) for row in rows if row['chatter_code'] not in chatter_ids]
+        if inserted:
+            db.session.execute(insert(ChatterEntity), inserted)
+    #
+    @classmethod
+    def __bulk_row(cls, chatter):
+        if not isinstance(chatter, dict) or not chatter.get('chatter_code'):
+            raise errors.ModelArgumentError('[chatter_code] is missing: %s' % str(chatter))
+        unknown = set(chatter.keys()) - set(cls.BULK_FIELDS)
+        if unknown:
+            raise errors.ModelArgumentError('unknown fields of a chatter: %s' % sorted(unknown))
+        return chatter
 
 class ChatterSchema(ModelSchema):
     class Meta(ModelSchema.Meta):
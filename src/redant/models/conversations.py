@@ -4,23 +4,39 @@ import pytz
 
 from datetime import datetime, timezone
 from redant import errors
-from redant.utils.database import sqldb as db
-from redant.models.channels import ChannelEntity
+from redant.utils.database import sqldb as db, bulk_write, group_by_columns, iter_keyset
+from redant.models.channels import channel_registry
 from redant.models.chatters import ChatterEntity
 from redant.utils.object_util import json_dumps
 from redant.utils.string_util import generate_uuid
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
-from sqlalchemy import desc
+from sqlalchemy import bindparam, desc, insert, inspect, or_, tuple_, update
+from sqlalchemy.orm import make_transient_to_detached
+
+# the overall_status of the conversations closed by the expiry sweeper
+OVERALL_STATUS_EXPIRED = -3
 
 class ConversationEntity(db.Model):
     __tablename__ = 'conversations'
+    __table_args__ = (
+        # find_by__channel__chatter (ordered by the index), count_by__channel__chatter (covered)
+        db.Index('ix_conversations__channel__chatter', 'channel_code', 'chatter_code', 'creation_time', 'overall_status'),
+        # find_all_by
+        db.Index('ix_conversations__state', 'state', 'overall_status'),
+        # find_all_cancellations_since
+        db.Index('ix_conversations__overall_status', 'overall_status', 'update_time'),
+        # iter_all_by (the keyset)
+        db.Index('ix_conversations__creation_time', 'creation_time', 'id'),
+    )
     #
     id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
     creation_time = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    update_time = db.Column(db.DateTime(timezone=True), nullable = True)
     timezone = db.Column(db.String(36), nullable = False)
     state = db.Column(db.String(32), nullable = False)
     overall_status = db.Column(db.Integer(), nullable = False, default=0)
+    version = db.Column(db.String(36), nullable = True)
     #
     story = db.Column(db.JSON, nullable=True)
     phone_number = db.Column(db.String(16), nullable = True)
@@ -33,13 +49,16 @@ class ConversationEntity(db.Model):
     channel_id = db.Column(db.String(36), db.ForeignKey('channels.channel_id'), nullable=True)
     channel = db.relationship('ChannelEntity', backref=db.backref('channels', lazy='dynamic'))
     #
+    # the fields accepted by bulk_create() and bulk_upsert()
+    BULK_FIELDS = ['channel_code', 'chatter_code', 'phone_number', 'state', 'story']
+    #
     #
     def create(self):
         #
         if self.channel_code is None:
             raise errors.ModelArgumentError('[channel_code] is None')
         #
-        channel = ChannelEntity.find_by__channel_code(self.channel_code)
+        channel = channel_registry.get(self.channel_code)
         if channel is None:
             raise errors.ChannelNotFoundError('channel[' + self.channel_code + '] not found')
         self.channel_id = channel.channel_id
@@ -51,24 +70,27 @@ class ConversationEntity(db.Model):
         if self.chatter_code is None:
             raise errors.ModelArgumentError('[chatter_code] is None')
         #
-        chatter = ChatterEntity.find_by__chatter_code(self.chatter_code)
-        if chatter is None:
-            chatter = ChatterEntity(chatter_code=self.chatter_code, phone_number=self.phone_number)
-            chatter.create()
-            pass
-        self.chatter_id = chatter.chatter_id
-        #
-        # creation_time in UTC
-        self.creation_time = datetime.utcnow()
-        #
-        #
-        db.session.add(self)
-        db.session.commit()
+        # the chatter (if missing) and the conversation are written in a single transaction
+        try:
+            self.chatter_id = ChatterEntity.upsert_by__chatter_code(self.chatter_code, phone_number=self.phone_number)
+            #
+            # creation_time in UTC
+            self.creation_time = datetime.utcnow()
+            #
+            self.touch()
+            #
+            db.session.add(self)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
         return self
     #
     #
     def save(self):
         try:
+            if db.session.is_modified(self):
+                self.touch()
             db.session.add(self)
             db.session.commit()
             return self, None
@@ -77,6 +99,125 @@ class ConversationEntity(db.Model):
             return None, exception
     #
     #
+    def touch(self):
+        # a new version for every write, so the copies cached by other processes are detected as stale
+        if not inspect(self).attrs.version.history.has_changes():
+            self.version = generate_uuid()
+            self.update_time = datetime.utcnow()
+        return self
+    #
+    #
+    @classmethod
+    def bulk_create(cls, conversations, chunk_size=1000, progress=None):
+        #
+        # creates [conversations], an iterable of dicts of BULK_FIELDS (state: 'begin' by default),
+        # with their missing chatters, by batches of [chunk_size] rows with a commit each;
+        # progress(count) is called after every batch
+        channels = dict()
+        def write_chunk(chunk):
+            cls.__insert_all([cls.__bulk_row(conversation) for conversation in chunk], channels)
+        return bulk_write(conversations, write_chunk, chunk_size=chunk_size, progress=progress)
+    #
+    @classmethod
+    def bulk_upsert(cls, conversations, chunk_size=1000, progress=None):
+        #
+        # as bulk_create(), but the latest conversation of a (channel_code, chatter_code), if still
+        # open, gets the given fields and a new version instead (e.g. an outbound campaign moving
+        # the chatters to its first state)
+        channels = dict()
+        def write_chunk(chunk):
+            # the last of the duplicates of a batch wins
+            rows = {(row['channel_code'], row['chatter_code']): row
+                    for row in (cls.__bulk_row(conversation) for conversation in chunk)}
+            latest = cls.__find_all_latest(rows.keys())
+            cls.__update_all([(latest[key], row) for key, row in rows.items() if key in latest])
+            cls.__insert_all([row for key, row in rows.items() if key not in latest], channels)
+        return bulk_write(conversations, write_chunk, chunk_size=chunk_size, progress=progress)
+    #
+    @classmethod
+    def __find_all_latest(cls, keys):
+        # {(channel_code, chatter_code): id} of the latest conversations of [keys] still open;
+        # the pairs are matched as such (ix_conversations__channel__chatter), not the cross product
+        # of the channels and the chatters
+        rows = db.session.query(ConversationEntity.channel_code, ConversationEntity.chatter_code,
+                    ConversationEntity.id, ConversationEntity.overall_status)\
+            .filter(tuple_(ConversationEntity.channel_code, ConversationEntity.chatter_code).in_(list(keys)))\
+            .order_by(ConversationEntity.creation_time)\
+            .all()
+        latest = dict()
+        for channel_code, chatter_code, conversation_id, overall_status in rows:
+            latest[(channel_code, chatter_code)] = (conversation_id, overall_status)
+        return {key: conversation_id for key, (conversation_id, overall_status) in latest.items() if overall_status >= 0}
+    #
+    @classmethod
+    def __update_all(cls, updates):
+        # updates: a list of (id, row)
+        now = datetime.utcnow()
+        for columns, group in group_by_columns([dict(row, id=conversation_id) for conversation_id, row in updates]):
+            update_columns = [column for column in columns if column not in ['id', 'channel_code', 'chatter_code']]
+            # the version is renewed so the cached copies become stale
+            statement = update(ConversationEntity)\
+                .where(ConversationEntity.id == bindparam('b_id'))\
+                .values({column: bindparam('b_' + column) for column in update_columns + ['version', 'update_time']})
+            db.session.execute(statement, [dict({'b_' + column: row[column] for column in update_columns},
+                    b_id=row['id'], b_version=generate_uuid(), b_update_time=now) for row in group])
+            # the pending deltas would be replayed over the new story, they go with the old one
+            if 'story' in update_columns:
+                # imported here, redant.models.stories imports this module
+                from redant.models.stories import StoryDeltaEntity
+                StoryDeltaEntity.delete_all_by__conversations([row['id'] for row in group])
+    #
+    @classmethod
+    def __insert_all(cls, rows, channels):
+        if not rows:
+            return
+        for channel_code in {row['channel_code'] for row in rows}:
+            if channel_code not in channels:
+                channel = channel_registry.get(channel_code)
+                if channel is None:
+                    raise errors.ChannelNotFoundError('channel[' + channel_code + '] not found')
+                channels[channel_code] = channel
+        #
+        chatter_ids = ChatterEntity.upsert_all_by__chatter_codes({row['chatter_code']: row.get('phone_number') for row in rows})
+        #
+        now = datetime.utcnow()
+        db.session.execute(insert(ConversationEntity), [dict(
+                id=generate_uuid(),
+                channel_code=row['channel_code'],
+                channel_id=channels[row['channel_code']].channel_id,
+                timezone=channels[row['channel_code']].timezone,
+                chatter_code=row['chatter_code'],
+                chatter_id=chatter_ids[row['chatter_code']],
+                phone_number=row.get('phone_number'),
+                state=row.get('state') or 'begin',
+                overall_status=0,
+                story=row.get('story'),
+                creation_time=now,
+                update_time=now,
+                version=generate_uuid()) for row in rows])
+    #
+    @classmethod
+    def __bulk_row(cls, conversation):
+        if not isinstance(conversation, dict) or not conversation.get('channel_code') or not conversation.get('chatter_code'):
+            raise errors.ModelArgumentError('[channel_code] or [chatter_code] is missing: %s' % str(conversation))
+        unknown = set(conversation.keys()) - set(cls.BULK_FIELDS)
+        if unknown:
+            raise errors.ModelArgumentError('unknown fields of a conversation: %s' % sorted(unknown))
+        return conversation
+    #
+    #
+    def snapshot(self):
+        return {column.key: getattr(self, column.key) for column in ConversationEntity.__table__.columns}
+    #
+    @classmethod
+    def restore(cls, values):
+        entity = cls(channel_code=values['channel_code'], chatter_code=values['chatter_code'])
+        for name, value in values.items():
+            setattr(entity, name, value)
+        make_transient_to_detached(entity)
+        return db.session.merge(entity, load=False)
+    #
+    #
     def __init__(self, channel_code, chatter_code, phone_number=None, state='begin', **kwargs):
         self.channel_code = channel_code
         self.chatter_code = chatter_code
@@ -111,23 +252,139 @@ class ConversationEntity(db.Model):
             .first()
     #
     @classmethod
+    def find_version_by__channel__chatter(cls, channel_code, chatter_code):
+        return db.session.query(ConversationEntity.id, ConversationEntity.version)\
+            .filter_by(channel_code = channel_code)\
+            .filter_by(chatter_code = chatter_code)\
+            .order_by(desc(ConversationEntity.creation_time))\
+            .first()
+    #
+    @classmethod
     def find_all_by(cls, channel_code=None, state=None):
         #
-        q = cls.query
+        q = cls.__filter_all_by(cls.query, channel_code, state)\
+            .order_by(desc(ConversationEntity.creation_time), desc(ConversationEntity.id))
+        #
+        return q.all()
+    #
+    @classmethod
+    def iter_all_by(cls, channel_code=None, state=None, batch_size=1000, columns=None):
+        #
+        # the conversations of find_all_by() (latest first), read by batches of [batch_size] with
+        # a keyset on (creation_time, id); [columns]: the names of the columns to read instead of
+        # the entities, the rows also have creation_time and id
+        q = cls.query if columns is None else db.session.query(*cls.__columns_of(columns))
+        q = cls.__filter_all_by(q, channel_code, state)
+        return iter_keyset(q, [ConversationEntity.creation_time, ConversationEntity.id],
+                batch_size=batch_size, descending=True)
+    #
+    @classmethod
+    def __filter_all_by(cls, q, channel_code=None, state=None):
         #
         if isinstance(channel_code, str):
-            q = q.filter_by(channel_code = channel_code)
+            q = q.filter(ConversationEntity.channel_code == channel_code)
         #
         if isinstance(state, str):
-            q = q.filter_by(state = state)
+            q = q.filter(ConversationEntity.state == state)
         #
         if isinstance(state, list):
             q = q.filter(ConversationEntity.state.in_(state))
         #
-        q = q.filter(ConversationEntity.overall_status >= 0)\
-            .order_by(desc(ConversationEntity.creation_time))
+        return q.filter(ConversationEntity.overall_status >= 0)
+    #
+    @classmethod
+    def __columns_of(cls, names):
+        unknown = set(names) - set(ConversationEntity.__table__.columns.keys())
+        if unknown:
+            raise errors.ModelArgumentError('unknown columns of a conversation: %s' % sorted(unknown))
+        names = list(names) + [name for name in ['creation_time', 'id'] if name not in names]
+        return [getattr(ConversationEntity, name) for name in names]
+    #
+    @classmethod
+    def update_story_by__id(cls, conversation_id, story):
+        # the version and the update_time are left untouched, in the current transaction
+        return cls.query\
+            .filter_by(id = conversation_id)\
+            .update({ConversationEntity.story: story}, synchronize_session=False)
+    #
+    @classmethod
+    def expire_all_by(cls, states=None, excluded_states=None, idle_before=None, channel_codes=None):
+        #
+        # a single UPDATE closing the open conversations in one of [states], in none of [excluded_states],
+        # or not written since [idle_before]; the version is renewed so the cached copies become stale.
+        # The states belong to a flow, they are only applied to its [channel_codes]
+        if (states or excluded_states) and channel_codes is None:
+            raise errors.ModelArgumentError('[channel_codes] is required to expire the conversations by state')
         #
-        return q.all()
+        conditions = []
+        #
+        if states:
+            conditions.append(ConversationEntity.state.in_(states))
+        #
+        if excluded_states:
+            conditions.append(ConversationEntity.state.notin_(excluded_states))
+        #
+        if idle_before is not None:
+            # the rows without update_time are backfilled by backfill_update_time() first
+            conditions.append(ConversationEntity.update_time < idle_before)
+        #
+        if not conditions:
+            return 0
+        #
+        q = cls.query\
+            .filter(ConversationEntity.overall_status > -2)\
+            .filter(or_(*conditions))
+        #
+        if channel_codes is not None:
+            q = q.filter(ConversationEntity.channel_code.in_(channel_codes))
+        #
+        count = q.update({
+            ConversationEntity.overall_status: OVERALL_STATUS_EXPIRED,
+            ConversationEntity.version: generate_uuid(),
+            ConversationEntity.update_time: datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        return count
+    #
+    @classmethod
+    def backfill_update_time(cls, channel_codes):
+        #
+        # the open conversations written before update_time existed (or by a process not setting it yet)
+        # get the current time, i.e. they are idle only [idle_timeout] after it; their last activity
+        # is unknown and creation_time would expire all the long-running ones at once
+        count = cls.query\
+            .filter(ConversationEntity.overall_status > -2)\
+            .filter(ConversationEntity.update_time.is_(None))\
+            .filter(ConversationEntity.channel_code.in_(channel_codes))\
+            .update({
+                ConversationEntity.update_time: datetime.utcnow()
+            }, synchronize_session=False)
+        db.session.commit()
+        return count
+    #
+    @classmethod
+    def find_all_cancellations_since(cls, since):
+        # (channel_code, chatter_code, time of the cancellation) of the conversations cancelled since [since]
+        cancellation_time = cls.__cancellation_time()
+        return db.session.query(ConversationEntity.channel_code, ConversationEntity.chatter_code, cancellation_time)\
+            .filter(ConversationEntity.overall_status == -2)\
+            .filter(cancellation_time >= since)\
+            .all()
+    #
+    @classmethod
+    def count_cancellations_by__channel__chatter(cls, channel_code, chatter_code, since):
+        # the conversations of a chatter cancelled since [since], as find_all_cancellations_since() sees them
+        return cls.query\
+            .filter_by(channel_code = channel_code)\
+            .filter_by(chatter_code = chatter_code)\
+            .filter_by(overall_status = -2)\
+            .filter(cls.__cancellation_time() >= since)\
+            .count()
+    #
+    @classmethod
+    def __cancellation_time(cls):
+        # the status is switched by the last update of a cancelled conversation (see touch())
+        return ConversationEntity.update_time
     #
     @classmethod
     def count_by__channel__chatter(cls, channel_code, chatter_code, overall_status=None, latest_creation_time=None):
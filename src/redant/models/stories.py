@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+from redant.models.conversations import ConversationEntity
+from redant.utils.database import sqldb as db
+from redant.utils.string_util import generate_uuid
+
+class StoryDeltaEntity(db.Model):
+    __tablename__ = 'story_deltas'
+    __table_args__ = (
+        # find_all_by__conversation (ordered by the index), delete_by__conversation; two processes
+        # appending to the same story cannot both write the same seq
+        db.UniqueConstraint('conversation_id', 'seq', name='uq_story_deltas__conversation_seq'),
+    )
+    #
+    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
+    conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.id'), nullable=False)
+    seq = db.Column(db.Integer(), nullable = False)
+    creation_time = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    patch = db.Column(db.JSON, nullable=False)
+    #
+    #
+    def __init__(self, conversation_id, seq, patch, **kwargs):
+        self.conversation_id = conversation_id
+        self.seq = seq
+        self.patch = patch
+        self.creation_time = datetime.utcnow()
+    #
+    #
+    def stage(self):
+        db.session.add(self)
+        return self
+    #
+    #
+    @classmethod
+    def find_all_by__conversation(cls, conversation_id):
+        return cls.query\
+            .filter_by(conversation_id = conversation_id)\
+            .order_by(StoryDeltaEntity.seq)\
+            .all()
+    #
+    @classmethod
+    def find_conversation_ids__closed(cls, channel_codes, limit=500):
+        # the conversations of [channel_codes] closed (cancelled or expired) with deltas left behind;
+        # scans the story_deltas, which only hold the deltas not compacted yet
+        return [conversation_id for conversation_id, in db.session.query(StoryDeltaEntity.conversation_id)\
+            .join(ConversationEntity, ConversationEntity.id == StoryDeltaEntity.conversation_id)\
+            .filter(ConversationEntity.overall_status <= -2)\
+            .filter(ConversationEntity.channel_code.in_(list(channel_codes)))\
+            .distinct()\
+            .limit(limit)\
+            .all()]
+    #
+    @classmethod
+    def delete_by__conversation(cls, conversation_id):
+        return cls.query\
+            .filter_by(conversation_id = conversation_id)\
+            .delete(synchronize_session=False)
+    #
+    @classmethod
+    def delete_all_by__conversations(cls, conversation_ids):
+        return cls.query\
+            .filter(StoryDeltaEntity.conversation_id.in_(conversation_ids))\
+            .delete(synchronize_session=False)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import threading
+import time
+
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache(object):
+    #
+    def __init__(self, max_size=1024, ttl=None):
+        assert isinstance(max_size, int) and max_size > 0, 'max_size must be a positive integer'
+        assert ttl is None or ttl > 0, 'ttl must be None or a positive number'
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+    #
+    def __len__(self):
+        return len(self.__entries)
+    #
+    def get(self, key, default=None):
+        with self.__lock:
+            value = self.__lookup(key)
+            if value is _MISSING:
+                return default
+            self.__entries.move_to_end(key)
+            return value
+    #
+    def pop(self, key, default=None):
+        with self.__lock:
+            value = self.__lookup(key)
+            if value is _MISSING:
+                return default
+            del self.__entries[key]
+            return value
+    #
+    def put(self, key, value):
+        expires_at = None if self.__ttl is None else time.monotonic() + self.__ttl
+        with self.__lock:
+            self.__entries[key] = (value, expires_at)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+        return value
+    #
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+    #
+    def __lookup(self, key):
+        entry = self.__entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.__entries[key]
+            return _MISSING
+        return value
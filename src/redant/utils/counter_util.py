@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import math
+import threading
+import time
+
+from collections import OrderedDict
+
+class SlidingWindowCounter(object):
+    #
+    # counts the events of every key over the last [window] seconds in buckets of [resolution]
+    # seconds; only the buckets holding events are kept (oldest first) with their running total,
+    # so that a key costs a few hundred bytes and counting the whole window is O(1) (a shorter
+    # range walks the buckets it covers); at most [max_keys] keys are kept, the least recently
+    # updated are evicted and reported as unknown (None) until the window has passed
+    #
+    def __init__(self, window=3600*24, resolution=60, max_keys=100000):
+        assert window > 0 and resolution > 0, 'window and resolution must be positive numbers'
+        assert isinstance(max_keys, int) and max_keys > 0, 'max_keys must be a positive integer'
+        self.__window = window
+        self.__resolution = resolution
+        self.__size = int(math.ceil(window / resolution))
+        self.__max_keys = max_keys
+        self.__rings = OrderedDict()
+        self.__evicted_at = None
+        self.__lock = threading.Lock()
+    #
+    def __len__(self):
+        return len(self.__rings)
+    #
+    @property
+    def window(self):
+        return self.__window
+    #
+    def add(self, key, amount=1, when=None):
+        slot = self.__slot_of(when)
+        oldest = self.__slot_of(None) - self.__size + 1
+        if slot < oldest:
+            return
+        with self.__lock:
+            ring = self.__rings.get(key)
+            if ring is None:
+                ring = self.__rings[key] = _Ring()
+            self.__rings.move_to_end(key)
+            ring.expire(oldest)
+            ring.add(slot, amount)
+            while len(self.__rings) > self.__max_keys:
+                self.__rings.popitem(last=False)
+                self.__evicted_at = time.time()
+    #
+    def count(self, key, seconds=None):
+        if seconds is None or seconds > self.__window:
+            seconds = self.__window
+        now = time.time()
+        last = self.__slot_of(now)
+        first = last - int(math.ceil(seconds / self.__resolution)) + 1
+        with self.__lock:
+            ring = self.__rings.get(key)
+            if ring is None:
+                if self.__evicted_at is not None and self.__evicted_at > now - self.__window:
+                    return None
+                return 0
+            ring.expire(last - self.__size + 1)
+            return ring.count(first, last)
+    #
+    def clear(self):
+        with self.__lock:
+            self.__rings.clear()
+            self.__evicted_at = None
+    #
+    def rebuild(self, events):
+        # events: iterable of (key, when) pairs, e.g. loaded from the database at startup
+        self.clear()
+        oldest = time.time() - self.__window
+        for key, when in events:
+            if when is not None and when > oldest:
+                self.add(key, when=when)
+        return self
+    #
+    def __slot_of(self, when):
+        return int((time.time() if when is None else when) // self.__resolution)
+
+
+class _Ring(object):
+    #
+    # the [slot, amount] buckets of a key ordered by slot, and the sum of their amounts
+    #
+    __slots__ = ['buckets', 'total']
+    #
+    def __init__(self):
+        self.buckets = []
+        self.total = 0
+    #
+    def add(self, slot, amount):
+        buckets = self.buckets
+        i = len(buckets)
+        # the events come in order but for a few late ones
+        while i > 0 and buckets[i - 1][0] > slot:
+            i -= 1
+        if i > 0 and buckets[i - 1][0] == slot:
+            buckets[i - 1][1] += amount
+        else:
+            buckets.insert(i, [slot, amount])
+        self.total += amount
+    #
+    def expire(self, oldest):
+        buckets = self.buckets
+        i = 0
+        while i < len(buckets) and buckets[i][0] < oldest:
+            self.total -= buckets[i][1]
+            i += 1
+        if i > 0:
+            del buckets[:i]
+    #
+    def count(self, first, last):
+        if not self.buckets or (self.buckets[0][0] >= first and self.buckets[-1][0] <= last):
+            return self.total
+        return sum(amount for slot, amount in self.buckets if first <= slot <= last)
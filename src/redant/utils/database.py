@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import desc, literal, tuple_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 sqldb = SQLAlchemy()
 
 def sqldb_hook(app):
@@ -8,3 +10,77 @@ def sqldb_hook(app):
     sqldb.app = app
     with app.app_context():
         sqldb.create_all()
+
+def upsert_statement(model, index_elements, update_columns=()):
+    # INSERT ... ON CONFLICT (SQLite, PostgreSQL) or ON DUPLICATE KEY UPDATE (MySQL) of [model],
+    # updating [update_columns] of the existing row (none: left untouched); None on the other dialects
+    dialect = sqldb.engine.dialect.name
+    if dialect in ['sqlite', 'postgresql']:
+        statement = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(model)
+        if not update_columns:
+            return statement.on_conflict_do_nothing(index_elements=index_elements)
+        return statement.on_conflict_do_update(index_elements=index_elements,
+                set_={column: statement.excluded[column] for column in update_columns})
+    if dialect == 'mysql':
+        statement = mysql.insert(model)
+        # assigning a key to itself is a no-op update
+        columns = update_columns or index_elements[:1]
+        return statement.on_duplicate_key_update({column: statement.inserted[column] for column in columns})
+    return None
+
+def iter_chunks(items, chunk_size):
+    # lists of at most [chunk_size] items, [items] is consumed lazily
+    assert isinstance(chunk_size, int) and chunk_size > 0, 'chunk_size must be a positive integer'
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def group_by_columns(rows):
+    # the dicts of [rows] grouped by their keys, a statement is executed once for each group
+    groups = dict()
+    for row in rows:
+        groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+    return list(groups.items())
+
+def bulk_write(items, write_chunk, chunk_size=1000, progress=None):
+    # calls write_chunk(chunk) and commits every [chunk_size] items, a failed chunk is rolled back
+    # (the previous ones stay committed); progress(count) gets the number of items written so far
+    count = 0
+    for chunk in iter_chunks(items, chunk_size):
+        try:
+            write_chunk(chunk)
+            sqldb.session.commit()
+        except Exception:
+            sqldb.session.rollback()
+            raise
+        count += len(chunk)
+        if progress is not None:
+            progress(count)
+    return count
+
+def iter_keyset(q, keys, batch_size=1000, descending=False):
+    #
+    # the rows of [q] ordered by [keys] (unique together, e.g. (creation_time, id)), read by batches
+    # of [batch_size] starting after the keys of the last row read ("keyset pagination", no OFFSET);
+    # only one batch is in memory and no cursor is kept open while the rows are consumed
+    assert isinstance(batch_size, int) and batch_size > 0, 'batch_size must be a positive integer'
+    order_by = [desc(key) if descending else key for key in keys]
+    last = None
+    while True:
+        page = q
+        if last is not None:
+            position = tuple_(*[literal(value, key.type) for key, value in zip(keys, last)])
+            page = page.filter(tuple_(*keys) < position if descending else tuple_(*keys) > position)
+        rows = page.order_by(*order_by).limit(batch_size).all()
+        for row in rows:
+            yield row
+        if len(rows) < batch_size:
+            return
+        last = [getattr(rows[-1], key.key) for key in keys]
+        # released before the next batch is read
+        rows = None
@@ -2,7 +2,9 @@
 
 import logging
 import os
-from flask import has_request_context, request
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, request
 from flask.logging import default_handler
 from flask_log_request_id import RequestID, RequestIDLogFilter, current_request_id
 
@@ -23,8 +25,51 @@ def getLogger(name):
     return logger
 
 def getRequestId():
+    # an app without reqid_hook has no request id (current_request_id() would raise a KeyError)
+    if has_app_context() and 'LOG_REQUEST_ID_G_OBJECT_ATTRIBUTE' not in current_app.config:
+        return None
     return current_request_id()
 
+def deadline_hook(app, timeout=None):
+    # every request gets [timeout] seconds (or app.config['REDANT_REQUEST_DEADLINE']) to complete,
+    # the outbound calls derive their timeouts from the remaining time
+    @app.before_request
+    def startDeadline():
+        setDeadline(timeout if timeout is not None else app.config.get('REDANT_REQUEST_DEADLINE'))
+
+def setDeadline(seconds):
+    if has_app_context():
+        g.redant_deadline = None if seconds is None else time.monotonic() + seconds
+
+def getDeadline():
+    if not has_app_context():
+        return None
+    return g.get('redant_deadline', None)
+
+def getRemainingTime():
+    deadline = getDeadline()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def copyRequestScope(func, with_deadline=True):
+    # the request id and the deadline follow [func] into another thread
+    if not has_app_context():
+        return func
+    app = current_app._get_current_object()
+    # the attribute of g set by the RequestID extension (reqid_hook)
+    request_id_attr = app.config.get('LOG_REQUEST_ID_G_OBJECT_ATTRIBUTE')
+    request_id = getRequestId() if request_id_attr is not None else None
+    deadline = getDeadline() if with_deadline else None
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            if request_id_attr is not None:
+                setattr(g, request_id_attr, request_id)
+            g.redant_deadline = deadline
+            return func(*args, **kwargs)
+    return wrapper
+
 def disableFlaskLog(app):
     logger = logging.getLogger('werkzeug')
     logger.disabled = True
@@ -2,7 +2,9 @@
 
 import logging
 import os
+import threading
 
+from prometheus_client import Counter, Gauge, Histogram
 from prometheus_flask_exporter import PrometheusMetrics
 from prometheus_flask_exporter.multiprocess import UWsgiPrometheusMetrics
 
@@ -32,3 +34,23 @@ def metrics_hook(app):
     metrics.init_app(app)
     with app.app_context():
         start_metrics_server()
+
+
+_collectors = dict()
+_collectors_lock = threading.Lock()
+
+def _register(collector_type, name, documentation, labelnames=(), **kwargs):
+    with _collectors_lock:
+        if name not in _collectors:
+            _collectors[name] = collector_type(name, documentation, labelnames=labelnames,
+                    registry=metrics.registry, **kwargs)
+        return _collectors[name]
+
+def counter(name, documentation, labelnames=(), **kwargs):
+    return _register(Counter, name, documentation, labelnames, **kwargs)
+
+def gauge(name, documentation, labelnames=(), **kwargs):
+    return _register(Gauge, name, documentation, labelnames, **kwargs)
+
+def histogram(name, documentation, labelnames=(), **kwargs):
+    return _register(Histogram, name, documentation, labelnames, **kwargs)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import codecs
+import json
+
+_WHITESPACES = ' \t\n\r'
+
+def limit_size(chunks, max_size, error_class=ValueError):
+    # passes the byte chunks through, raises [error_class] once more than [max_size] bytes have been read
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        if max_size is not None and total > max_size:
+            raise error_class('the body exceeds %d bytes' % max_size)
+        yield chunk
+
+
+def decode_chunks(chunks, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def iter_ndjson(texts):
+    # one JSON document per line, the blank lines are skipped
+    pending = ''
+    for text in texts:
+        pending += text
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if pending.strip():
+        yield json.loads(pending)
+
+
+def iter_json_array(texts):
+    # the elements of a top-level JSON array, decoded one by one while the text arrives
+    decoder = json.JSONDecoder()
+    texts = iter(texts)
+    buffer, pos, ended = '', 0, False
+    #
+    def more():
+        nonlocal buffer, pos, ended
+        for text in texts:
+            buffer, pos = buffer[pos:] + text, 0
+            return True
+        ended = True
+        return False
+    #
+    def skip_whitespaces():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACES:
+                pos += 1
+            if pos < len(buffer) or not more():
+                return
+    #
+    skip_whitespaces()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise ValueError('the body is not a JSON array')
+    pos += 1
+    #
+    skip_whitespaces()
+    if pos < len(buffer) and buffer[pos] == ']':
+        return
+    #
+    while True:
+        skip_whitespaces()
+        # an element is complete once the next separator has arrived (a number may have been cut)
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                element, end = None, None
+            if end is not None:
+                following = end
+                while following < len(buffer) and buffer[following] in _WHITESPACES:
+                    following += 1
+                if (following < len(buffer) and buffer[following] in ',]') or ended:
+                    break
+            if not more():
+                if end is None:
+                    raise ValueError('the JSON array is truncated')
+                break
+        pos = following
+        yield element
+        #
+        skip_whitespaces()
+        if pos >= len(buffer):
+            raise ValueError('the JSON array is truncated')
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] != ',':
+            raise ValueError('unexpected [%s] in the JSON array' % buffer[pos])
+        pos += 1
@@ -0,0 +1,11 @@
+import importlib, os, sys
+
+start_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(start_dir))
+
+for root, dirs, files in sorted(os.walk(start_dir)):
+    for file in sorted(files):
+        if file.endswith('_bench.py'):
+            rel = os.path.relpath(os.path.join(root, file[:-3]), os.path.dirname(start_dir))
+            module = importlib.import_module(rel.replace(os.sep, '.'))
+            module.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import json, statistics, sys, time, tracemalloc
+
+from sqlalchemy import event
+
+
+class StatementCounter(object):
+    #
+    def __init__(self, engine):
+        self.engine = engine
+        self.total = 0
+    #
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self.on_execute)
+        return self
+    #
+    def __exit__(self, *args):
+        event.remove(self.engine, 'before_cursor_execute', self.on_execute)
+    #
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.total += 1
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def measure_turns(turn, total, engine=None, traced=None):
+    # msgs/sec and latencies are measured without tracemalloc, the allocations
+    # on a separate (shorter) pass, it slows every allocation down
+    latencies = []
+    counter = StatementCounter(engine) if engine is not None else None
+    if counter is not None:
+        counter.__enter__()
+    try:
+        start = time.perf_counter()
+        for i in range(total):
+            t = time.perf_counter()
+            turn(i)
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+    finally:
+        if counter is not None:
+            counter.__exit__()
+    #
+    traced = traced or max(1, total // 10)
+    allocated = []
+    tracemalloc.start()
+    try:
+        for i in range(total, total + traced):
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            turn(i)
+            allocated.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    #
+    result = dict(
+        turns=total,
+        msgs_per_sec=round(total / elapsed, 1),
+        p50_ms=round(percentile(latencies, 50) * 1000, 3),
+        p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        peak_alloc_kib_per_turn=round(statistics.mean(allocated) / 1024, 1),
+    )
+    if counter is not None:
+        result['sql_statements_per_turn'] = round(counter.total / total, 2)
+    return result
+
+
+def report(benchmark, case, result, out=sys.stdout):
+    # one JSON document per line, to be collected and compared across the revisions
+    out.write(json.dumps(dict(benchmark=benchmark, case=case, **result), sort_keys=True) + '\n')
+    out.flush()
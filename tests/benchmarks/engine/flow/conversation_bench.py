@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import logging, os, sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../../..', 'src'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../..'))
+
+from flask import Flask
+from redant.engine.flow import Conversation, Descriptor
+from redant.models.channels import ChannelEntity
+from redant.utils.database import sqldb, sqldb_hook
+from benchmarks.bench_util import measure_turns, report
+
+CHATTERS_TOTAL = 20
+TURNS_TOTAL = 1000
+CALLBACKS_TOTAL = 10
+
+
+class SmallDescriptor(Descriptor):
+    #
+    states = ['welcome', 'asking', 'answering', 'quit']
+    initial_state = 'welcome'
+    quit_state = 'quit'
+    internal_states = []
+    final_states = []
+    #
+    @property
+    def transitions(self):
+        return [
+            dict(source='welcome', target='asking'),
+            dict(source='asking', target='answering'),
+            dict(source='answering', target='asking')
+        ]
+
+
+class LargeDescriptor(Descriptor):
+    #
+    states = ['state_%d' % i for i in range(50)]
+    initial_state = 'state_0'
+    quit_state = 'state_49'
+    internal_states = []
+    final_states = []
+    #
+    @property
+    def transitions(self):
+        rules = [dict(source='state_%d' % i, target='state_%d' % (i + 1)) for i in range(48)]
+        return rules + [dict(source='state_48', target='state_1')]
+
+
+class HeavyDescriptor(SmallDescriptor):
+    #
+    @property
+    def transitions(self):
+        callbacks = ['callback_%d' % i for i in range(CALLBACKS_TOTAL)]
+        return [dict(rule, before=list(callbacks), after=list(callbacks)) for rule in super(HeavyDescriptor, self).transitions]
+
+
+class SampleConversation(Conversation):
+    #
+    def __init__(self, *args, text=None, **kwargs):
+        self.text = text
+        super(SampleConversation, self).__init__(*args, **kwargs)
+    #
+    def reply__asking(self, from_state):
+        self._context['question'] = self.text
+        return 'question', None
+    #
+    def reply__answering(self, from_state):
+        self._context['answers'] = self._context.get('answers', [])[-9:] + [self.text]
+        return 'answer', None
+
+
+class LargeConversation(Conversation):
+    #
+    def __init__(self, *args, text=None, **kwargs):
+        self.text = text
+        super(LargeConversation, self).__init__(*args, **kwargs)
+
+
+class HeavyConversation(SampleConversation):
+    pass
+
+
+def _reply(self, from_state):
+    self._context[from_state] = self.text
+    return self.text, None
+
+for i in range(1, 49):
+    setattr(LargeConversation, 'reply__state_%d' % i, _reply)
+
+
+def _callback(self):
+    self._context['calls'] = self._context.get('calls', 0) + 1
+
+for i in range(CALLBACKS_TOTAL):
+    setattr(HeavyConversation, 'callback_%d' % i, _callback)
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    sqldb_hook(app)
+    return app
+
+
+def run_case(case, descriptor, conversation_class):
+    app = create_app()
+    with app.app_context():
+        ChannelEntity(channel_code='sms', channel_type='sms').create()
+        #
+        def turn(i):
+            sqldb.session.remove()
+            conversation = conversation_class('sms', 'chatter-%d' % (i % CHATTERS_TOTAL), '+10000000',
+                    descriptor=descriptor, text='text-%d' % i)
+            conversation.next_action()
+        #
+        # the first contacts create the conversations, they are not measured
+        for i in range(CHATTERS_TOTAL):
+            turn(i)
+        report('engine.flow.conversation', case, measure_turns(turn, TURNS_TOTAL, engine=sqldb.engine))
+        #
+        sqldb.session.remove()
+        sqldb.drop_all()
+
+
+def main():
+    logging.disable(logging.INFO)
+    run_case('small', SmallDescriptor(), SampleConversation)
+    run_case('50-states', LargeDescriptor(), LargeConversation)
+    run_case('heavy-callbacks', HeavyDescriptor(), HeavyConversation)
+
+
+if __name__ == '__main__':
+    main()
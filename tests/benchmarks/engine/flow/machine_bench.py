@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import logging, os, sys, time
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../../..', 'src'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../..'))
+
+from redant.engine.flow import Descriptor
+from transitions import Machine
+from benchmarks.bench_util import report
+
+STATES_TOTAL = 50
+MESSAGES_TOTAL = 2000
+
+
+class SampleDescriptor(Descriptor):
+    #
+    states = ['state_%d' % i for i in range(STATES_TOTAL)]
+    initial_state = 'state_0'
+    quit_state = 'state_%d' % (STATES_TOTAL - 1)
+    internal_states = []
+    final_states = []
+    #
+    @property
+    def transitions(self):
+        return [dict(source='state_%d' % i, target='state_%d' % (i + 1)) for i in range(STATES_TOTAL - 1)]
+
+
+class SampleModel(object):
+    def transition_before(self):
+        pass
+    def save_dialog(self):
+        pass
+    def transition_after(self):
+        pass
+
+
+def run_machine_per_message(descriptor, total):
+    for i in range(total):
+        model = SampleModel()
+        Machine(model=model, states=descriptor.states, transitions=descriptor.rules,
+                initial=descriptor.states[i % (STATES_TOTAL - 1)])
+        model._next()
+
+
+def run_compiled_machine(descriptor, total):
+    machine = descriptor.machine
+    for i in range(total):
+        model = machine.bind(SampleModel(), descriptor.states[i % (STATES_TOTAL - 1)])
+        machine.resolve(model, '_next')()
+
+
+def measure(func, descriptor, total):
+    start = time.perf_counter()
+    func(descriptor, total)
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    logging.disable(logging.INFO)
+    descriptor = SampleDescriptor()
+    before = measure(run_machine_per_message, descriptor, MESSAGES_TOTAL // 10)
+    after = measure(run_compiled_machine, descriptor, MESSAGES_TOTAL)
+    report('engine.flow.machine', 'machine-per-message', dict(msgs_per_sec=round(before, 1)))
+    report('engine.flow.machine', 'compiled-machine', dict(msgs_per_sec=round(after, 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+#!/usr/bin/env python3
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../../..', 'src'))
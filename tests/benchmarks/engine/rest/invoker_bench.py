@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import json, logging, os, sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../../..', 'src'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../..'))
+
+from redant.engine.rest import RestClient
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from benchmarks.bench_util import measure_turns, report
+
+CALLS_TOTAL = 20000
+BASE_URL = 'http://backend.local'
+
+
+class StubAdapter(BaseAdapter):
+    #
+    # answers without any I/O, only the per-call work of redant and requests is measured
+    #
+    CONTENT = json.dumps(dict(id=1, name='item-1')).encode('utf-8')
+    #
+    def send(self, request, **kwargs):
+        r = Response()
+        r.status_code = 200
+        r.headers['Content-Type'] = 'application/json'
+        r._content = self.CONTENT
+        r.encoding = 'utf-8'
+        r.request = request
+        r.url = request.url
+        return r
+    #
+    def close(self):
+        pass
+
+
+class SampleRestClient(RestClient):
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'commons': {
+                'headers': {
+                    'Accept': 'application/json',
+                    'User-Agent': 'redant',
+                    'X-Tenant': 'sample'
+                }
+            },
+            'entrypoints': [
+                {
+                    'name': 'lookup',
+                    'url': BASE_URL + '/items',
+                    'headers': {
+                        'X-Api-Version': '2'
+                    }
+                },
+                {
+                    'name': 'update',
+                    'url': BASE_URL + '/items',
+                    'method': 'POST',
+                    'i_transformer': lambda data=None: dict(body=data, headers={'X-Trace': 'bench', 'accept': None})
+                },
+                {
+                    'name': 'cached',
+                    'url': BASE_URL + '/items',
+                    'cache': {
+                        'ttl': 3600
+                    }
+                }
+            ]
+        }
+
+
+def main():
+    logging.disable(logging.INFO)
+    client = SampleRestClient()
+    client.sessions.session(BASE_URL).mount('http://', StubAdapter())
+    #
+    report('engine.rest.invoker', 'get', measure_turns(lambda i: client.invoke('lookup'), CALLS_TOTAL))
+    report('engine.rest.invoker', 'post-with-headers', measure_turns(lambda i: client.invoke('update', dict(id=i)), CALLS_TOTAL))
+    report('engine.rest.invoker', 'cache-hit', measure_turns(lambda i: client.invoke('cached'), CALLS_TOTAL))
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import logging, os, sys, time
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../..', 'src'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../..'))
+
+from flask import Flask
+from redant.models.channels import ChannelEntity
+from redant.models.chatters import ChatterEntity
+from redant.models.conversations import ConversationEntity
+from redant.utils.database import sqldb, sqldb_hook
+from benchmarks.bench_util import StatementCounter, report
+
+ROWS_TOTAL = 20000
+ONE_BY_ONE_TOTAL = 1000
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    sqldb_hook(app)
+    return app
+
+
+def chatters(total, offset=0):
+    return (dict(chatter_code='chatter-%d' % i, phone_number='+1%09d' % i) for i in range(offset, offset + total))
+
+
+def conversations(total, state):
+    return (dict(channel_code='sms', chatter_code='chatter-%d' % i, state=state) for i in range(total))
+
+
+def run_case(case, write, total, prepare=None):
+    app = create_app()
+    with app.app_context():
+        ChannelEntity(channel_code='sms', channel_type='sms').create()
+        if prepare is not None:
+            prepare()
+        sqldb.session.remove()
+        #
+        with StatementCounter(sqldb.engine) as counter:
+            start = time.perf_counter()
+            write()
+            elapsed = time.perf_counter() - start
+        report('models.bulk', case, dict(rows=total, rows_per_sec=round(total / elapsed, 1),
+                sql_statements_per_row=round(counter.total / total, 3)))
+        #
+        sqldb.session.remove()
+        sqldb.drop_all()
+
+
+def create_one_by_one():
+    for chatter in chatters(ONE_BY_ONE_TOTAL):
+        ChatterEntity(**chatter).create()
+
+
+def main():
+    logging.disable(logging.INFO)
+    run_case('chatters-one-by-one', create_one_by_one, ONE_BY_ONE_TOTAL)
+    run_case('chatters-bulk-create', lambda: ChatterEntity.bulk_create(chatters(ROWS_TOTAL)), ROWS_TOTAL)
+    # half of them exist
+    run_case('chatters-bulk-upsert', lambda: ChatterEntity.bulk_upsert(chatters(ROWS_TOTAL)), ROWS_TOTAL,
+            prepare=lambda: ChatterEntity.bulk_create(chatters(ROWS_TOTAL // 2)))
+    run_case('conversations-bulk-create', lambda: ConversationEntity.bulk_create(conversations(ROWS_TOTAL, 'invited')), ROWS_TOTAL)
+    run_case('conversations-bulk-upsert', lambda: ConversationEntity.bulk_upsert(conversations(ROWS_TOTAL, 'reminded')), ROWS_TOTAL,
+            prepare=lambda: ConversationEntity.bulk_create(conversations(ROWS_TOTAL // 2, 'invited')))
+
+
+if __name__ == '__main__':
+    main()
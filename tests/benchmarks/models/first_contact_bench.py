@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import logging, os, sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../..', 'src'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../..'))
+
+from flask import Flask
+from redant.engine.flow import Conversation, Descriptor
+from redant.models.channels import ChannelEntity
+from redant.models.chatters import ChatterEntity
+from redant.utils.database import sqldb, sqldb_hook
+from benchmarks.bench_util import measure_turns, report
+
+TURNS_TOTAL = 1000
+
+
+class WelcomeDescriptor(Descriptor):
+    #
+    states = ['welcome', 'asking', 'quit']
+    initial_state = 'welcome'
+    quit_state = 'quit'
+    internal_states = []
+    final_states = []
+    #
+    @property
+    def transitions(self):
+        return [dict(source='welcome', target='asking')]
+
+
+class WelcomeConversation(Conversation):
+    #
+    def reply__asking(self, from_state):
+        return 'welcome', None
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    sqldb_hook(app)
+    return app
+
+
+def run_case(case, known_chatters):
+    # the first message of a chatter: the chatter (unless known) and its conversation are created
+    app = create_app()
+    descriptor = WelcomeDescriptor()
+    with app.app_context():
+        ChannelEntity(channel_code='sms', channel_type='sms').create()
+        if known_chatters:
+            for i in range(TURNS_TOTAL + TURNS_TOTAL // 10):
+                sqldb.session.add(ChatterEntity(chatter_code='chatter-%d' % i))
+            sqldb.session.commit()
+        #
+        def turn(i):
+            sqldb.session.remove()
+            conversation = WelcomeConversation('sms', 'chatter-%d' % i, '+10000000', descriptor=descriptor)
+            conversation.next_action()
+        #
+        report('models.first_contact', case, measure_turns(turn, TURNS_TOTAL, engine=sqldb.engine))
+        #
+        sqldb.session.remove()
+        sqldb.drop_all()
+
+
+def main():
+    logging.disable(logging.INFO)
+    run_case('new-chatter', known_chatters=False)
+    run_case('known-chatter', known_chatters=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import logging, os, sys, time, tracemalloc
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../..', 'src'))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../..'))
+
+from flask import Flask
+from redant.models.channels import ChannelEntity
+from redant.models.conversations import ConversationEntity
+from redant.utils.database import sqldb, sqldb_hook
+from benchmarks.bench_util import report
+
+ROWS_TOTAL = 50000
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    sqldb_hook(app)
+    return app
+
+
+def run_case(case, read):
+    sqldb.session.remove()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        total = 0
+        for row in read():
+            total += 1
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    report('models.stream', case, dict(rows=total, rows_per_sec=round(total / elapsed, 1),
+            peak_kib=round(peak / 1024.0, 1)))
+
+
+def main():
+    logging.disable(logging.INFO)
+    app = create_app()
+    with app.app_context():
+        ChannelEntity(channel_code='sms', channel_type='sms').create()
+        ConversationEntity.bulk_create(dict(channel_code='sms', chatter_code='chatter-%d' % i, state='invited')
+                for i in range(ROWS_TOTAL))
+        #
+        run_case('find-all-by', lambda: ConversationEntity.find_all_by(state='invited'))
+        run_case('iter-all-by', lambda: ConversationEntity.iter_all_by(state='invited'))
+        run_case('iter-all-by-columns', lambda: ConversationEntity.iter_all_by(state='invited', columns=['chatter_code']))
+        #
+        sqldb.session.remove()
+        sqldb.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+import unittest
+
+from flask import Flask, g
+from redant.engine.executors import ShardedExecutor
+from redant.utils.logging import getRemainingTime, getRequestId, setDeadline
+
+class ShardedExecutor_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.executor = ShardedExecutor(max_workers=4, name='test')
+    #
+    def tearDown(self):
+        self.executor.shutdown()
+    #
+    def test_ordered_per_key(self):
+        results = dict()
+        def run(key, i):
+            time.sleep(0.001)
+            results.setdefault(key, []).append(i)
+        #
+        keys = [ShardedExecutor.conversation_key('sms', 'chatter-%d' % c) for c in range(6)]
+        futures = [self.executor.submit(key, run, key, i) for i in range(20) for key in keys]
+        for f in futures:
+            f.result()
+        for key in keys:
+            self.assertEqual(results[key], list(range(20)))
+    #
+    def test_parallel_across_shards(self):
+        k1 = 'sms:chatter-1'
+        k2 = next(k for k in ('sms:chatter-%d' % i for i in range(2, 100))
+                if self.executor.shard_of(k) != self.executor.shard_of(k1))
+        started = threading.Event()
+        release = threading.Event()
+        def block():
+            started.set()
+            return release.wait(5)
+        #
+        blocked = self.executor.submit(k1, block)
+        started.wait(5)
+        self.assertEqual(self.executor.submit(k2, lambda: 'done').result(timeout=5), 'done')
+        self.assertFalse(blocked.done())
+        release.set()
+        self.assertTrue(blocked.result(timeout=5))
+    #
+    def test_exception(self):
+        future = self.executor.submit('sms:chatter-1', lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result(timeout=5)
+        self.assertEqual(self.executor.submit('sms:chatter-1', lambda: 1).result(timeout=5), 1)
+    #
+    def test_request_scope(self):
+        app = Flask(__name__)
+        app.config['LOG_REQUEST_ID_G_OBJECT_ATTRIBUTE'] = 'log_request_id'
+        with app.app_context():
+            g.log_request_id = 'request-1'
+            setDeadline(10)
+            request_id, remaining = self.executor.submit('sms:chatter-1',
+                    lambda: (getRequestId(), getRemainingTime())).result(timeout=5)
+        self.assertEqual(request_id, 'request-1')
+        self.assertTrue(0 < remaining <= 10)
+    #
+    def test_shutdown(self):
+        self.executor.shutdown()
+        with self.assertRaises(RuntimeError):
+            self.executor.submit('sms:chatter-1', lambda: 1)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from redant.engine.async_flow import AsyncConversation
+from redant.models.conversations import ConversationEntity
+from redant.utils.database import sqldb
+
+from .conversation_test import ConversationTestCase, ExampleDescriptor
+
+class AsyncConversation_next_action_test(ConversationTestCase):
+    #
+    descriptor_class = ExampleDescriptor
+    conversation_class = None
+    #
+    def setUp(self):
+        super(AsyncConversation_next_action_test, self).setUp()
+        self.descriptor.validate(ExampleAsyncConversation)
+        # a single connection is shared by the threads with the in-memory SQLite
+        self.executor = ThreadPoolExecutor(1)
+    #
+    def tearDown(self):
+        self.executor.shutdown()
+        super(AsyncConversation_next_action_test, self).tearDown()
+    #
+    def converse_async(self, chatter_code, text=None):
+        conversation = ExampleAsyncConversation('sms', chatter_code, '+10000000', descriptor=self.descriptor,
+                executor=self.executor, text=text)
+        return conversation.next_action()
+    #
+    def test_ok(self):
+        async def run():
+            replies = await asyncio.gather(*[self.converse_async('chatter-%d' % i) for i in range(5)])
+            self.assertEqual(replies, [('What is your name?', None)] * 5)
+            replies = await asyncio.gather(*[self.converse_async('chatter-%d' % i, 'name-%d' % i) for i in range(5)])
+            self.assertEqual(replies, [('How old are you?', None)] * 5)
+            self.assertEqual(await self.converse_async('chatter-0', 'help'), ('Please enter your age', None))
+        #
+        asyncio.run(run())
+        #
+        sqldb.session.remove()
+        for i in range(5):
+            persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-%d' % i)
+            self.assertEqual(persist.state, 'waiting_for_age')
+            self.assertIn('name-%d' % i, persist.story)
+    #
+    def test_cancellation(self):
+        async def run():
+            await self.converse_async('chatter-0')
+            self.assertEqual(await self.converse_async('chatter-0', 'cancel'), ('Are you sure?', None))
+            conversation = ExampleAsyncConversation('sms', 'chatter-0', '+10000000', descriptor=self.descriptor,
+                    executor=self.executor, text='yes')
+            self.assertEqual(await conversation.next_action(), ('Cancelled', None))
+            self.assertEqual(await conversation._count_cancellations(), 1)
+        #
+        asyncio.run(run())
+
+
+class ExampleAsyncConversation(AsyncConversation):
+    #
+    def __init__(self, *args, text=None, **kwargs):
+        self.text = text
+        super(ExampleAsyncConversation, self).__init__(*args, **kwargs)
+    #
+    async def reply__waiting_for_name(self, from_state):
+        await asyncio.sleep(0.01)
+        return 'What is your name?', None
+    #
+    async def reply__waiting_for_age(self, from_state):
+        await asyncio.sleep(0.01)
+        self._context['name'] = self.text
+        return 'How old are you?', None
+    #
+    def help__waiting_for_age(self):
+        return 'Please enter your age', None
+    #
+    @property
+    def _help(self):
+        return self.text == 'help', None
+    #
+    @property
+    async def _cancellation_requested(self):
+        return self.text == 'cancel', ('Are you sure?', None)
+    #
+    @property
+    def _cancellation_accepted(self):
+        return self.text == 'yes', ('Cancelled', None)
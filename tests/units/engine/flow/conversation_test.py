@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+import logging
+import time
+import unittest
+
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import event
+from redant import errors
+from redant.engine.flow import Conversation, Descriptor
+from redant.models.channels import ChannelEntity
+from redant.models.conversations import ConversationEntity
+from redant.models.stories import StoryDeltaEntity
+from redant.utils.database import sqldb, sqldb_hook
+from redant.utils.object_util import json_dumps
+
+class ConversationTestCase(unittest.TestCase):
+    #
+    descriptor_class = None
+    conversation_class = None
+    #
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        sqldb_hook(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ChannelEntity(channel_code='sms', channel_type='sms').create()
+        #
+        self.commits = 0
+        self.updates = 0
+        self.selects = 0
+        event.listen(sqldb.engine, 'commit', self.on_commit)
+        event.listen(sqldb.engine, 'before_cursor_execute', self.on_execute)
+        #
+        self.descriptor = self.descriptor_class()
+        if self.conversation_class is not None:
+            self.descriptor.validate(self.conversation_class)
+    #
+    def tearDown(self):
+        event.remove(sqldb.engine, 'commit', self.on_commit)
+        event.remove(sqldb.engine, 'before_cursor_execute', self.on_execute)
+        sqldb.session.remove()
+        sqldb.drop_all()
+        self.ctx.pop()
+        logging.disable(logging.NOTSET)
+    #
+    def on_commit(self, conn):
+        self.commits += 1
+    #
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE'):
+            self.updates += 1
+        if statement.startswith('SELECT'):
+            self.selects += 1
+    #
+    def converse(self, text=None):
+        sqldb.session.remove()
+        self.selects = 0
+        conversation = self.conversation_class('sms', 'chatter-1', '+10000000', descriptor=self.descriptor, text=text)
+        self.commits = 0
+        self.updates = 0
+        return conversation, conversation.next_action()
+
+
+class ExampleConversation(Conversation):
+    #
+    def __init__(self, *args, text=None, **kwargs):
+        self.text = text
+        super(ExampleConversation, self).__init__(*args, **kwargs)
+    #
+    def reply__waiting_for_name(self, from_state):
+        return 'What is your name?', None
+    #
+    def reply__waiting_for_age(self, from_state):
+        self._context['name'] = self.text
+        return 'How old are you?', None
+    #
+    def help__waiting_for_name(self):
+        return 'Please enter your name', None
+    #
+    @property
+    def _help(self):
+        return self.text == 'help', None
+    #
+    @property
+    def _cancellation_requested(self):
+        return self.text == 'cancel', ('Are you sure?', None)
+    #
+    @property
+    def _cancellation_accepted(self):
+        return self.text == 'yes', ('Cancelled', None)
+
+
+class FailingConversation(ExampleConversation):
+    #
+    def reply__waiting_for_age(self, from_state):
+        self._context['name'] = self.text
+        raise ValueError('failed')
+
+
+class ChattingConversation(Conversation):
+    #
+    def __init__(self, *args, text=None, **kwargs):
+        self.text = text
+        super(ChattingConversation, self).__init__(*args, **kwargs)
+    #
+    def reply__chatting(self, from_state):
+        if self.text is not None:
+            self._context['last'] = self.text
+            self._context['texts'] = self._context.get('texts', []) + [self.text]
+        return self.text, None
+
+
+class ExampleDescriptor(Descriptor):
+    #
+    states = ['welcome', 'waiting_for_name', 'waiting_for_age', 'done', 'quit']
+    initial_state = 'welcome'
+    quit_state = 'quit'
+    internal_states = []
+    final_states = ['done']
+    #
+    @property
+    def transitions(self):
+        return [
+            {
+                'source': 'welcome',
+                'target': 'waiting_for_name'
+            },
+            {
+                'source': 'waiting_for_name',
+                'target': 'waiting_for_age'
+            },
+            {
+                'source': 'waiting_for_age',
+                'target': 'done'
+            }
+        ]
+
+
+class ChattingDescriptor(Descriptor):
+    #
+    states = ['welcome', 'chatting', 'quit']
+    initial_state = 'welcome'
+    quit_state = 'quit'
+    internal_states = []
+    final_states = []
+    story_compaction_interval = 3
+    #
+    @property
+    def transitions(self):
+        return [
+            {
+                'source': 'welcome',
+                'target': 'chatting'
+            },
+            {
+                'source': 'chatting',
+                'target': 'chatting'
+            }
+        ]
+
+
+class CachedDescriptor(ExampleDescriptor):
+    #
+    conversation_cache_options = dict(max_size=10, ttl=60)
+
+
+class Conversation_next_action_test(ConversationTestCase):
+    #
+    descriptor_class = ExampleDescriptor
+    conversation_class = ExampleConversation
+    #
+    def test_one_commit_per_turn(self):
+        conversation, reply = self.converse()
+        self.assertEqual(reply, ('What is your name?', None))
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(self.updates, 1)
+        #
+        conversation, reply = self.converse('Alice')
+        self.assertEqual(reply, ('How old are you?', None))
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(self.updates, 1)
+        #
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        self.assertEqual(persist.state, 'waiting_for_age')
+        self.assertIn('Alice', persist.story)
+    #
+    def test_nothing_written_on_error(self):
+        self.converse()
+        self.conversation_class = FailingConversation
+        with self.assertRaises(ValueError):
+            self.converse('Alice')
+        self.assertEqual(self.commits, 0)
+        self.assertEqual(self.updates, 0)
+        #
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        self.assertEqual(persist.state, 'waiting_for_name')
+        self.assertNotIn('Alice', persist.story or '')
+    #
+    def test_nothing_written_without_changes(self):
+        self.converse()
+        conversation, reply = self.converse('help')
+        self.assertEqual(reply, ('Please enter your name', None))
+        self.assertEqual(self.commits, 0)
+        self.assertEqual(self.updates, 0)
+    #
+    def test_cancellation(self):
+        self.converse()
+        conversation, reply = self.converse('cancel')
+        self.assertEqual(reply, ('Are you sure?', None))
+        self.assertEqual(self.commits, 1)
+        #
+        conversation, reply = self.converse('yes')
+        self.assertEqual(reply, ('Cancelled', None))
+        self.assertEqual(self.commits, 1)
+        #
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        self.assertEqual(persist.overall_status, -2)
+
+
+class Conversation_expiry_test(ConversationTestCase):
+    #
+    descriptor_class = ExampleDescriptor
+    conversation_class = ExampleConversation
+    #
+    def expire(self, **values):
+        ConversationEntity.query.filter_by(chatter_code='chatter-1').update(values)
+        sqldb.session.commit()
+    #
+    def test_idle(self):
+        self.converse()
+        first = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1').id
+        self.converse('Alice')
+        self.assertEqual(ConversationEntity.find_by__channel__chatter('sms', 'chatter-1').id, first)
+        #
+        self.expire(update_time=datetime.utcnow() - timedelta(hours=11))
+        conversation, reply = self.converse()
+        self.assertEqual(reply, ('What is your name?', None))
+        self.assertNotEqual(ConversationEntity.find_by__channel__chatter('sms', 'chatter-1').id, first)
+    #
+    def test_not_backfilled(self):
+        # a conversation written before update_time existed is not idle until the sweeper backfills it
+        self.converse()
+        first = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1').id
+        self.expire(update_time=None, creation_time=datetime.utcnow() - timedelta(hours=11))
+        conversation, reply = self.converse('Alice')
+        self.assertEqual(ConversationEntity.find_by__channel__chatter('sms', 'chatter-1').id, first)
+    #
+    def test_swept(self):
+        self.converse()
+        self.expire(overall_status=-3)
+        conversation, reply = self.converse('Alice')
+        self.assertEqual(reply, ('What is your name?', None))
+
+
+class CountedDescriptor(ExampleDescriptor):
+    #
+    cancellation_counter_options = dict(window=3600*24, resolution=60, sync_interval=0.2)
+
+
+class Conversation_cancellation_counter_test(ConversationTestCase):
+    #
+    descriptor_class = CountedDescriptor
+    conversation_class = ExampleConversation
+    #
+    def cancel(self):
+        self.converse()
+        self.converse('cancel')
+        conversation, reply = self.converse('yes')
+        self.assertEqual(reply, ('Cancelled', None))
+    #
+    def test_counted_in_memory(self):
+        self.cancel()
+        self.cancel()
+        conversation, reply = self.converse()
+        self.selects = 0
+        self.assertEqual(conversation._count_cancellations(range_size=1, range_unit='hours'), 2)
+        self.assertEqual(conversation._count_cancellations(range_size=30, range_unit='minutes'), 2)
+        self.assertEqual(self.selects, 0)
+        # out of the window
+        self.assertEqual(conversation._count_cancellations(range_size=2, range_unit='days'), 2)
+        self.assertEqual(self.selects, 1)
+    #
+    def test_rebuilt_from_database(self):
+        self.cancel()
+        self.descriptor = self.descriptor_class()
+        conversation, reply = self.converse()
+        self.assertEqual(conversation._count_cancellations(), 1)
+    #
+    def test_cancellation_time(self):
+        # a conversation created long ago and cancelled now is counted by the counter and the database alike
+        self.cancel()
+        ConversationEntity.query.update(dict(creation_time=datetime.utcnow() - timedelta(hours=3)))
+        sqldb.session.commit()
+        conversation, reply = self.converse()
+        self.assertEqual(conversation._count_cancellations(range_size=1, range_unit='hours'), 1)
+        self.descriptor = self.descriptor_class()
+        conversation, reply = self.converse()
+        self.assertEqual(conversation._count_cancellations(range_size=1, range_unit='hours'), 1)
+        # the fallback beyond the window of the counter
+        self.assertEqual(conversation._count_cancellations(range_size=2, range_unit='days'), 1)
+        self.assertEqual(ConversationEntity.count_cancellations_by__channel__chatter('sms', 'chatter-1',
+                datetime.utcnow() - timedelta(hours=1)), 1)
+    #
+    def test_synced_across_workers(self):
+        # another worker cancels, this one sees it at its next sync
+        conversation, reply = self.converse()
+        self.assertEqual(conversation._count_cancellations(), 0)
+        current = self.descriptor
+        self.descriptor = self.descriptor_class()
+        self.cancel()
+        self.descriptor = current
+        conversation, reply = self.converse()
+        self.assertEqual(conversation._count_cancellations(), 0)
+        time.sleep(0.3)
+        self.assertEqual(conversation._count_cancellations(), 1)
+
+
+class Conversation_story_deltas_test(ConversationTestCase):
+    #
+    descriptor_class = ChattingDescriptor
+    conversation_class = ChattingConversation
+    #
+    def test_deltas_and_compaction(self):
+        self.converse()
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        #
+        for i in range(5):
+            conversation, reply = self.converse('text-%d' % i)
+            self.assertEqual(conversation._context['last'], 'text-%d' % i)
+            self.assertEqual(len(conversation._context['texts']), i + 1)
+        #
+        # compacted at the 3rd turn with changes, 2 deltas appended afterwards
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        deltas = StoryDeltaEntity.find_all_by__conversation(persist.id)
+        self.assertEqual([delta.seq for delta in deltas], [1, 2])
+        self.assertIn('text-4', deltas[1].patch)
+        self.assertIn('text-2', persist.story)
+        self.assertNotIn('text-3', persist.story)
+        #
+        conversation, reply = self.converse('text-5')
+        self.assertEqual(conversation._context['texts'], ['text-%d' % i for i in range(6)])
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        self.assertEqual(StoryDeltaEntity.find_all_by__conversation(persist.id), [])
+        self.assertIn('text-5', persist.story)
+    #
+    def test_concurrent_delta(self):
+        self.converse()
+        self.converse('text-0')
+        sqldb.session.remove()
+        conversation = self.conversation_class('sms', 'chatter-1', '+10000000', descriptor=self.descriptor, text='text-1')
+        # another process appends the next delta meanwhile
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        StoryDeltaEntity(persist.id, 2, json_dumps(dict(set=dict(last='text-x')))).stage()
+        sqldb.session.commit()
+        with self.assertRaises(errors.ConversationConflictError):
+            conversation.next_action()
+        #
+        conversation, reply = self.converse('text-2')
+        self.assertEqual(conversation._context['texts'], ['text-0', 'text-2'])
+
+
+class Conversation_cache_test(ConversationTestCase):
+    #
+    descriptor_class = CachedDescriptor
+    conversation_class = ExampleConversation
+    #
+    def test_hit(self):
+        self.converse()
+        #
+        conversation, reply = self.converse('Alice')
+        self.assertEqual(reply, ('How old are you?', None))
+        self.assertEqual(self.selects, 1)
+        self.assertEqual(self.commits, 1)
+        #
+        conversation, reply = self.converse('help')
+        self.assertIsNone(reply)
+        self.assertEqual(conversation._context['name'], 'Alice')
+        self.assertEqual(self.selects, 1)
+        #
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        self.assertEqual(persist.state, 'waiting_for_age')
+    #
+    def test_stale(self):
+        self.converse()
+        #
+        # written by another process
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        persist.story = '{"name": "Bob"}'
+        persist.save()
+        #
+        conversation, reply = self.converse('help')
+        self.assertEqual(conversation._context['name'], 'Bob')
+        self.assertEqual(self.selects, 2)
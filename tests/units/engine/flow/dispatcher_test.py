@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from flask import Flask
+from redant import errors
+from redant.engine.flow import Conversation, Descriptor, flow_hook
+
+class Descriptor_dispatcher_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.descriptor = ExampleDescriptor()
+    #
+    def test_ok(self):
+        dispatcher = self.descriptor.dispatcher(ExampleConversation)
+        self.assertIs(self.descriptor.dispatcher(ExampleConversation), dispatcher)
+        #
+        conversation = object.__new__(ExampleConversation)
+        #
+        handler = dispatcher.reply_of('welcome', 'waiting_for_name')
+        self.assertEqual(dispatcher.call(handler, conversation, from_state='welcome'), 'reply_on_welcome')
+        #
+        handler = dispatcher.reply_of('waiting_for_name', 'waiting_for_age')
+        self.assertEqual(dispatcher.call(handler, conversation, from_state='waiting_for_name'), 'name -> age')
+        #
+        handler = dispatcher.reply_of('waiting_for_age', 'done')
+        self.assertEqual(dispatcher.call(handler, conversation, from_state='waiting_for_age'), 'done')
+        #
+        handler = dispatcher.reply_of('welcome', 'done')
+        self.assertEqual(dispatcher.call(handler, conversation, from_state='welcome'), 'done')
+        #
+        self.assertIsNone(dispatcher.reply_of('done', 'welcome'))
+        #
+        handler = dispatcher.help_of('waiting_for_name')
+        self.assertEqual(dispatcher.call(handler, conversation), 'help on name')
+        self.assertIsNone(dispatcher.help_of('welcome'))
+    #
+    def test_invalid_handlers(self):
+        with self.assertRaises(errors.HandlerNotFoundError):
+            self.descriptor.dispatcher(InvalidConversation)
+        with self.assertRaises(errors.HandlerNotFoundError):
+            self.descriptor.dispatcher(Conversation)
+    #
+    def test_validate(self):
+        self.assertIs(self.descriptor.validate(ExampleConversation), self.descriptor)
+        with self.assertRaises(errors.HandlerNotFoundError):
+            self.descriptor.validate(ExampleConversation, InvalidConversation)
+    #
+    def test_hook(self):
+        app = Flask(__name__)
+        flow_hook(app, self.descriptor, ExampleConversation)
+        self.assertEqual(app.extensions['redant_flows'], [self.descriptor])
+        with self.assertRaises(errors.HandlerNotFoundError):
+            flow_hook(Flask(__name__), ExampleDescriptor(), InvalidConversation)
+
+
+class ExampleConversation(Conversation):
+    def reply_on_welcome(self, from_state):
+        return 'reply_on_welcome'
+    def reply__waiting_for_name__waiting_for_age(self, from_state):
+        return 'name -> age'
+    def reply__done(self, from_state):
+        return 'done'
+    def help__waiting_for_name(self):
+        return 'help on name'
+
+
+class InvalidConversation(ExampleConversation):
+    def reply__waiting_for_nam(self, from_state):
+        return None
+
+
+class ExampleDescriptor(Descriptor):
+    #
+    states = ['welcome', 'waiting_for_name', 'waiting_for_age', 'done', 'quit']
+    initial_state = 'welcome'
+    quit_state = 'quit'
+    internal_states = []
+    final_states = ['done']
+    #
+    @property
+    def transitions(self):
+        return [
+            {
+                'source': 'welcome',
+                'target': 'waiting_for_name',
+                'reply': 'reply_on_welcome'
+            },
+            {
+                'source': 'waiting_for_name',
+                'target': 'waiting_for_age'
+            },
+            {
+                'source': 'waiting_for_age',
+                'target': 'done'
+            }
+        ]
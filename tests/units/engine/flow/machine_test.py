@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+
+from redant.engine.flow import Descriptor
+
+class CompiledMachine_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.descriptor = ExampleDescriptor()
+    #
+    def test_machine_is_built_once(self):
+        machine = self.descriptor.machine
+        m1 = machine.bind(ExampleModel(), 'welcome')
+        m2 = machine.bind(ExampleModel(), 'waiting_for_name')
+        self.assertIs(self.descriptor.machine, machine)
+        self.assertEqual(len(machine.machine.models), 0)
+        self.assertEqual(m1.state, 'welcome')
+        self.assertEqual(m2.state, 'waiting_for_name')
+    #
+    def test_bound_models_are_independent(self):
+        machine = self.descriptor.machine
+        m1 = machine.bind(ExampleModel(), 'welcome')
+        m2 = machine.bind(ExampleModel(), 'welcome')
+        #
+        machine.resolve(m1, '_next')()
+        self.assertEqual(m1.state, 'waiting_for_name')
+        self.assertEqual(m2.state, 'welcome')
+        self.assertEqual(m1.calls, ['transition_before', 'save_dialog', 'transition_after'])
+        self.assertEqual(m2.calls, [])
+        #
+        self.assertTrue(machine.resolve(m1, 'is_waiting_for_name')())
+        self.assertFalse(machine.resolve(m2, 'is_waiting_for_name')())
+        self.assertIsNone(machine.resolve(m1, 'unknown_method'))
+    #
+    def test_invalid_state(self):
+        with self.assertRaises(ValueError):
+            self.descriptor.machine.bind(ExampleModel(), 'not_a_state')
+    #
+    def test_dynamic_callbacks(self):
+        # the callbacks of a model class are not called on the models of another class
+        machine = self.descriptor.machine
+        m1 = machine.bind(EnteringModel(), 'welcome')
+        m2 = machine.bind(ExampleModel(), 'welcome')
+        machine.resolve(m1, '_next')()
+        machine.resolve(m2, '_next')()
+        self.assertEqual(m1.calls, ['transition_before', 'on_enter_waiting_for_name', 'save_dialog', 'transition_after'])
+        self.assertEqual(m2.calls, ['transition_before', 'save_dialog', 'transition_after'])
+        self.assertIs(machine.machine_of(ExampleModel), machine.machine)
+        self.assertIsNot(machine.machine_of(EnteringModel), machine.machine)
+        self.assertIs(machine.machine_of(EnteringModel), machine.machine_of(EnteringModel))
+    #
+    def test_threads(self):
+        machine = self.descriptor.machine
+        models = [ExampleModel() for i in range(50)]
+        #
+        def run(model):
+            machine.bind(model, 'welcome')
+            machine.resolve(model, '_next')()
+            machine.resolve(model, '_next')()
+        #
+        threads = [threading.Thread(target=run, args=(m,)) for m in models]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        #
+        for model in models:
+            self.assertEqual(model.state, 'waiting_for_age')
+            self.assertEqual(model.calls.count('save_dialog'), 2)
+
+
+class ExampleModel(object):
+    def __init__(self):
+        self.calls = []
+    def transition_before(self):
+        self.calls.append('transition_before')
+    def save_dialog(self):
+        self.calls.append('save_dialog')
+    def transition_after(self):
+        self.calls.append('transition_after')
+
+
+class EnteringModel(ExampleModel):
+    def on_enter_waiting_for_name(self):
+        self.calls.append('on_enter_waiting_for_name')
+
+
+class ExampleDescriptor(Descriptor):
+    #
+    states = ['welcome', 'waiting_for_name', 'waiting_for_age', 'quit']
+    initial_state = 'welcome'
+    quit_state = 'quit'
+    internal_states = []
+    final_states = ['waiting_for_age']
+    #
+    @property
+    def transitions(self):
+        return [
+            {
+                'source': 'welcome',
+                'target': 'waiting_for_name'
+            },
+            {
+                'source': 'waiting_for_name',
+                'target': 'waiting_for_age'
+            }
+        ]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import logging
+import unittest
+
+from datetime import datetime, timedelta
+from flask import Flask
+from redant import errors
+from redant.engine.flow import Descriptor
+from redant.engine.jobs import ConversationSweeper
+from redant.models.channels import ChannelEntity
+from redant.models.conversations import ConversationEntity, OVERALL_STATUS_EXPIRED
+from redant.models.stories import StoryDeltaEntity
+from redant.utils.object_util import json_dumps, json_loads
+from redant.utils.database import sqldb, sqldb_hook
+
+class ConversationSweeper_test(unittest.TestCase):
+    #
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        sqldb_hook(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ChannelEntity(channel_code='sms', channel_type='sms').create()
+        ChannelEntity(channel_code='zalo', channel_type='zalo').create()
+        self.sweeper = ConversationSweeper(ExampleDescriptor(), ['sms'], app=self.app)
+    #
+    def tearDown(self):
+        sqldb.session.remove()
+        sqldb.drop_all()
+        self.ctx.pop()
+        logging.disable(logging.NOTSET)
+    #
+    def create(self, chatter_code, state, overall_status=0, idle=None, channel_code='sms'):
+        persist = ConversationEntity(channel_code, chatter_code, state=state).create()
+        persist.overall_status = overall_status
+        persist.save()
+        if idle is not None:
+            ConversationEntity.query.filter_by(id=persist.id)\
+                .update(dict(update_time=datetime.utcnow() - timedelta(seconds=idle)))
+            sqldb.session.commit()
+        return persist.id
+    #
+    def status_of(self, conversation_id):
+        return sqldb.session.query(ConversationEntity.overall_status).filter_by(id=conversation_id).scalar()
+    #
+    def test_sweep(self):
+        active = self.create('chatter-1', 'waiting_for_name')
+        confirming = self.create('chatter-2', 'waiting_for_name', overall_status=-1)
+        done = self.create('chatter-3', 'done')
+        quit = self.create('chatter-4', 'quit')
+        invalid = self.create('chatter-5', 'removed_state')
+        idle = self.create('chatter-6', 'waiting_for_name', idle=7200)
+        cancelled = self.create('chatter-7', 'waiting_for_name', overall_status=-2)
+        # the conversations of another flow
+        other_flow = self.create('chatter-8', 'waiting_for_order', channel_code='zalo')
+        other_done = self.create('chatter-9', 'done', channel_code='zalo')
+        versions = dict(sqldb.session.query(ConversationEntity.id, ConversationEntity.version).all())
+        #
+        sqldb.session.remove()
+        self.assertEqual(self.sweeper.sweep(), 4)
+        #
+        self.assertEqual(self.status_of(active), 0)
+        self.assertEqual(self.status_of(confirming), -1)
+        self.assertEqual(self.status_of(cancelled), -2)
+        self.assertEqual(self.status_of(other_flow), 0)
+        self.assertEqual(self.status_of(other_done), 0)
+        for conversation_id in [done, quit, invalid, idle]:
+            self.assertEqual(self.status_of(conversation_id), OVERALL_STATUS_EXPIRED)
+            persist = ConversationEntity.query.get(conversation_id)
+            self.assertNotEqual(persist.version, versions[conversation_id])
+        #
+        self.assertEqual(self.sweeper.sweep(), 0)
+    #
+    def test_backfill_update_time(self):
+        # the conversations written before update_time existed are idle one idle_timeout after the first sweep
+        legacy = self.create('chatter-1', 'waiting_for_name')
+        cancelled = self.create('chatter-2', 'waiting_for_name', overall_status=-2)
+        other_flow = self.create('chatter-3', 'waiting_for_order', channel_code='zalo')
+        ConversationEntity.query.update(dict(update_time=None, creation_time=datetime.utcnow() - timedelta(days=3)))
+        sqldb.session.commit()
+        #
+        sqldb.session.remove()
+        self.assertEqual(self.sweeper.sweep(), 0)
+        self.assertEqual(self.status_of(legacy), 0)
+        self.assertIsNotNone(ConversationEntity.query.get(legacy).update_time)
+        self.assertIsNone(ConversationEntity.query.get(cancelled).update_time)
+        self.assertIsNone(ConversationEntity.query.get(other_flow).update_time)
+        #
+        ConversationEntity.query.filter_by(id=legacy)\
+            .update(dict(update_time=datetime.utcnow() - timedelta(seconds=7200)))
+        sqldb.session.commit()
+        self.assertEqual(self.sweeper.sweep(), 1)
+        self.assertEqual(self.status_of(legacy), OVERALL_STATUS_EXPIRED)
+    #
+    def test_story_deltas(self):
+        # the deltas left by the conversations closed before their compaction are folded into their story
+        def journal(conversation_id, story, *patches):
+            ConversationEntity.query.filter_by(id=conversation_id).update(dict(story=json_dumps(story)))
+            for seq, patch in enumerate(patches):
+                StoryDeltaEntity(conversation_id, seq + 1, json_dumps(patch)).stage()
+            sqldb.session.commit()
+        #
+        cancelled = self.create('chatter-1', 'waiting_for_name', overall_status=-2)
+        done = self.create('chatter-2', 'done')
+        active = self.create('chatter-3', 'waiting_for_name')
+        other_flow = self.create('chatter-4', 'done', overall_status=-2, channel_code='zalo')
+        for conversation_id in [cancelled, done, active, other_flow]:
+            journal(conversation_id, dict(name='Alice', age=30), dict(set=dict(name='Bob')), dict(unset=['age']))
+        update_time = ConversationEntity.query.get(cancelled).update_time
+        #
+        sqldb.session.remove()
+        self.sweeper.sweep()
+        #
+        for conversation_id in [cancelled, done]:
+            self.assertEqual(StoryDeltaEntity.find_all_by__conversation(conversation_id), [])
+            self.assertEqual(json_loads(ConversationEntity.query.get(conversation_id).story)[0], dict(name='Bob'))
+        self.assertEqual(ConversationEntity.query.get(cancelled).update_time, update_time)
+        for conversation_id in [active, other_flow]:
+            self.assertEqual(len(StoryDeltaEntity.find_all_by__conversation(conversation_id)), 2)
+            self.assertEqual(json_loads(ConversationEntity.query.get(conversation_id).story)[0], dict(name='Alice', age=30))
+    #
+    def test_channel_codes_required(self):
+        with self.assertRaises(AssertionError):
+            ConversationSweeper(ExampleDescriptor(), None)
+        with self.assertRaises(AssertionError):
+            ConversationSweeper(ExampleDescriptor(), [])
+        with self.assertRaises(errors.ModelArgumentError):
+            ConversationEntity.expire_all_by(states=['done'], excluded_states=['welcome'])
+
+
+class ExampleDescriptor(Descriptor):
+    #
+    states = ['welcome', 'waiting_for_name', 'done', 'quit']
+    initial_state = 'welcome'
+    quit_state = 'quit'
+    internal_states = []
+    final_states = ['done']
+    idle_timeout = 3600
+    #
+    @property
+    def transitions(self):
+        return [
+            {
+                'source': 'welcome',
+                'target': 'waiting_for_name'
+            },
+            {
+                'source': 'waiting_for_name',
+                'target': 'done'
+            }
+        ]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from redant.engine.rest import RestClient
+from redant.utils.monitoring import metrics
+
+class CatalogueHandler(BaseHTTPRequestHandler):
+    #
+    protocol_version = 'HTTP/1.1'
+    #
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps(dict(path=self.path, etag=self.server.etag)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    #
+    def log_message(self, *args):
+        pass
+
+
+class RestInvoker_cache_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), CatalogueHandler)
+        self.server.requests = []
+        self.server.etag = '"v1"'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = CachedRestClient('http://127.0.0.1:%d' % self.server.server_port)
+    #
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+    #
+    def count(self, entrypoint, result):
+        return metrics.registry.get_sample_value('redant_rest_cache_requests_total',
+                dict(entrypoint=entrypoint, result=result)) or 0
+    #
+    def test_hit_and_revalidated(self):
+        hits = self.count('fresh', 'hit')
+        self.assertEqual(self.client.invoke('fresh', dict(params=dict(q='a'))), dict(path='/fresh?q=a', etag='"v1"'))
+        self.assertEqual(self.client.invoke('fresh', dict(params=dict(q='a'))), dict(path='/fresh?q=a', etag='"v1"'))
+        self.assertEqual(self.client.invoke('fresh', dict(params=dict(q='b'))), dict(path='/fresh?q=b', etag='"v1"'))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.count('fresh', 'hit'), hits + 1)
+        #
+        time.sleep(0.25)
+        self.assertEqual(self.client.invoke('fresh', dict(params=dict(q='a'))), dict(path='/fresh?q=a', etag='"v1"'))
+        self.assertEqual(self.server.requests[-1], ('/fresh?q=a', '"v1"'))
+    #
+    def test_stale_while_revalidate(self):
+        self.client.invoke('stale')
+        self.server.etag = '"v2"'
+        time.sleep(0.25)
+        # served from the cache, revalidated in the background
+        self.assertEqual(self.client.invoke('stale'), dict(path='/stale', etag='"v1"'))
+        time.sleep(0.1)
+        self.assertEqual(self.client.invoke('stale'), dict(path='/stale', etag='"v2"'))
+        self.assertEqual(len(self.server.requests), 2)
+
+
+class CachedRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(CachedRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'entrypoints': [
+                {
+                    'name': 'fresh',
+                    'url': self.__base_url + '/fresh',
+                    'i_transformer': lambda data=None: data or dict(),
+                    'cache': {
+                        'ttl': 0.2
+                    }
+                },
+                {
+                    'name': 'stale',
+                    'url': self.__base_url + '/stale',
+                    'cache': {
+                        'ttl': 0.2,
+                        'stale_while_revalidate': 10
+                    }
+                }
+            ]
+        }
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
+import asyncio
+import time
 import unittest
 
 from redant.engine.rest import RestClient
+from .rest_sessions_test import RestServerTestCase
 
 class RestClient_constructor_test(unittest.TestCase):
     #
@@ -14,5 +17,111 @@ class RestClient_constructor_test(unittest.TestCase):
             er = ExampleRestClient()
 
 
+class RestClient_invoke_many_test(RestServerTestCase):
+    #
+    def setUp(self):
+        super(RestClient_invoke_many_test, self).setUp()
+        self.server.delay = 0.2
+        self.client = SlowRestClient(self.base_url)
+    #
+    def tearDown(self):
+        self.client.close()
+        super(RestClient_invoke_many_test, self).tearDown()
+    #
+    def test_invoke_many(self):
+        start = time.perf_counter()
+        results = self.client.invoke_many([('first', None), ('second', None), ('third', None)])
+        elapsed = time.perf_counter() - start
+        self.assertEqual(results, [dict(path='/first'), dict(path='/second'), dict(path='/third')])
+        self.assertLess(elapsed, 0.5)
+    #
+    def test_invoke_many_exceptions(self):
+        with self.assertRaises(Exception):
+            self.client.invoke_many([('first', None), ('unknown', None)])
+        results = self.client.invoke_many([('first', None), ('failing', None)], return_exceptions=True)
+        self.assertEqual(results[0], dict(path='/first'))
+        self.assertIsInstance(results[1], Exception)
+    #
+    def test_invoke_async(self):
+        async def run():
+            return await asyncio.gather(self.client.invoke_async('first'), self.client.invoke_async('second'))
+        self.assertEqual(asyncio.run(run()), [dict(path='/first'), dict(path='/second')])
+
+
+class RestInvoker_plan_test(RestServerTestCase):
+    #
+    def test_headers(self):
+        client = HeadersRestClient(self.base_url)
+        headers = client.invoke('headers')
+        self.assertEqual(headers['accept'], 'application/json')
+        self.assertEqual(headers['x-tenant'], 'example')
+        self.assertEqual(headers['x-version'], '2')
+        #
+        # overridden case-insensitively, kept when None
+        headers = client.invoke('headers', dict(headers={'ACCEPT': 'text/plain', 'X-Version': None, 'X-Extra': '1'}))
+        self.assertEqual(headers['accept'], 'text/plain')
+        self.assertEqual(headers['x-version'], '2')
+        self.assertEqual(headers['x-extra'], '1')
+        client.close()
+
+
 class ExampleRestClient(RestClient):
     pass
+
+
+class HeadersRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(HeadersRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'commons': {
+                'headers': {
+                    'Accept': 'application/json',
+                    'X-Tenant': 'example'
+                }
+            },
+            'entrypoints': [
+                {
+                    'name': 'headers',
+                    'url': self.__base_url + '/headers',
+                    'headers': {
+                        'X-Version': '2'
+                    },
+                    'i_transformer': lambda data=None: data or dict()
+                }
+            ]
+        }
+
+
+class SlowRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(SlowRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'commons': {
+                'executor': {
+                    'max_workers': 4
+                }
+            },
+            'entrypoints': [
+                dict(name=name, url=self.__base_url + '/' + name) for name in ['first', 'second', 'third']
+            ] + [
+                dict(name='failing', url='http://127.0.0.1:1/failing')
+            ]
+        }
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import threading
+
+from redant.engine.rest import RestClient, RestInvoker
+from redant.utils.monitoring import metrics
+from .rest_sessions_test import RestServerTestCase
+
+class RestInvoker_coalescing_test(RestServerTestCase):
+    #
+    def setUp(self):
+        super(RestInvoker_coalescing_test, self).setUp()
+        self.server.delay = 0.2
+        self.server.paths = []
+        self.client = CoalescingRestClient(self.base_url)
+    #
+    def tearDown(self):
+        self.client.close()
+        super(RestInvoker_coalescing_test, self).tearDown()
+    #
+    def coalesced(self):
+        return metrics.registry.get_sample_value('redant_rest_coalesced_calls_total', dict(entrypoint='lookup')) or 0
+    #
+    def run_concurrently(self, inputs):
+        results = [None] * len(inputs)
+        def run(i):
+            results[i] = self.client.invoke('lookup', inputs[i])
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(inputs))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+    #
+    def test_coalesced(self):
+        before = self.coalesced()
+        results = self.run_concurrently([dict(params=dict(q='a'))] * 8 + [dict(params=dict(q='b'))] * 2)
+        self.assertEqual(results, [dict(path='/lookup?q=a')] * 8 + [dict(path='/lookup?q=b')] * 2)
+        self.assertEqual(sorted(self.server.paths), ['/lookup?q=a', '/lookup?q=b'])
+        self.assertEqual(self.coalesced(), before + 8)
+        #
+        # not cached once completed
+        self.run_concurrently([dict(params=dict(q='a'))])
+        self.assertEqual(len(self.server.paths), 3)
+    #
+    def test_unsafe_method(self):
+        with self.assertRaises(AssertionError):
+            RestInvoker(entrypoint=dict(name='create', url=self.base_url + '/create', method='POST', coalesce=True), guard=None)
+
+
+class CoalescingRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(CoalescingRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'entrypoints': [
+                {
+                    'name': 'lookup',
+                    'url': self.__base_url + '/lookup',
+                    'i_transformer': lambda data=None: data or dict(),
+                    'coalesce': True
+                }
+            ]
+        }
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+from flask import Flask
+from redant import errors
+from redant.engine.rest import RestClient
+from redant.utils.logging import copyRequestScope, deadline_hook, getRemainingTime, reqid_hook, setDeadline
+from .rest_sessions_test import ExampleRestClient, RestServerTestCase
+
+class RestInvoker_deadline_test(RestServerTestCase):
+    #
+    def setUp(self):
+        super(RestInvoker_deadline_test, self).setUp()
+        self.app = Flask(__name__)
+        reqid_hook(self.app)
+        self.client = ExampleRestClient(self.base_url)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+    #
+    def tearDown(self):
+        self.ctx.pop()
+        self.client.close()
+        super(RestInvoker_deadline_test, self).tearDown()
+    #
+    def test_without_deadline(self):
+        self.server.delay = 0.2
+        self.assertEqual(self.client.invoke('hello'), dict(path='/hello'))
+    #
+    def test_timeouts_shortened(self):
+        self.server.delay = 1
+        setDeadline(0.2)
+        started = time.monotonic()
+        with self.assertRaises(errors.RestInvocationError):
+            self.client.invoke('hello')
+        self.assertLess(time.monotonic() - started, 0.8)
+    #
+    def test_exhausted(self):
+        setDeadline(0)
+        with self.assertRaises(errors.RestInvocationError):
+            self.client.invoke('hello')
+        self.assertEqual(self.server.paths, [])
+    #
+    def test_invoke_many(self):
+        setDeadline(5)
+        self.assertEqual(self.client.invoke_many([('hello', {}), ('world', {})]),
+                [dict(path='/hello'), dict(path='/world')])
+        #
+        setDeadline(0)
+        with self.assertRaises(errors.RestInvocationError):
+            self.client.invoke_many([('hello', {}), ('world', {})])
+    #
+    def test_circuit_not_opened(self):
+        # running out of time before sending is not a failure of the backend
+        client = BudgetedRestClient(self.base_url)
+        for i in range(3):
+            setDeadline(0)
+            with self.assertRaises(errors.RestDeadlineExceededError):
+                client.invoke('guarded')
+        setDeadline(5)
+        self.assertEqual(client.invoke('guarded'), dict(path='/guarded'))
+        self.assertEqual(self.server.paths, ['/guarded'])
+        client.close()
+    #
+    def test_circuit_opened_by_timeouts(self):
+        # the timeouts of the requests sent to a hung backend are failures
+        client = BudgetedRestClient(self.base_url)
+        self.server.delay = 0.5
+        for i in range(2):
+            setDeadline(0.1)
+            with self.assertRaises(errors.RestDeadlineExceededError):
+                client.invoke('guarded')
+        self.server.delay = 0
+        setDeadline(5)
+        with self.assertRaises(errors.RestInvocationError) as ctx:
+            client.invoke('guarded')
+        self.assertNotIsInstance(ctx.exception, errors.RestDeadlineExceededError)
+        self.assertEqual(len(self.server.paths), 2)
+        client.close()
+    #
+    def test_coalesced_waiter(self):
+        # a waiter gives up at its own deadline, the owner of the call goes on
+        client = BudgetedRestClient(self.base_url)
+        self.server.delay = 0.5
+        results = []
+        owner = threading.Thread(target=copyRequestScope(lambda: results.append(client.invoke('lookup'))))
+        owner.start()
+        time.sleep(0.1)
+        setDeadline(0.1)
+        started = time.monotonic()
+        with self.assertRaises(errors.RestDeadlineExceededError):
+            client.invoke('lookup')
+        self.assertLess(time.monotonic() - started, 0.3)
+        owner.join()
+        self.assertEqual(results, [dict(path='/lookup')])
+        self.assertEqual(self.server.paths, ['/lookup'])
+        client.close()
+    #
+    def test_copied_scope(self):
+        setDeadline(5)
+        remaining = copyRequestScope(getRemainingTime)()
+        self.assertTrue(0 < remaining <= 5)
+        self.assertIsNone(copyRequestScope(getRemainingTime, with_deadline=False)())
+    #
+    def test_hook(self):
+        self.app.config['REDANT_REQUEST_DEADLINE'] = 3
+        deadline_hook(self.app)
+        @self.app.route('/remaining')
+        def remaining():
+            return dict(remaining=getRemainingTime())
+        #
+        response = self.app.test_client().get('/remaining')
+        self.assertTrue(0 < response.get_json()['remaining'] <= 3)
+
+
+class BudgetedRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(BudgetedRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'entrypoints': [
+                {
+                    'name': 'guarded',
+                    'url': self.__base_url + '/guarded',
+                    'circuit_breaker': {
+                        'failure_threshold': 2,
+                        'recovery_timeout': 30
+                    }
+                },
+                {
+                    'name': 'lookup',
+                    'url': self.__base_url + '/lookup',
+                    'coalesce': True
+                }
+            ]
+        }
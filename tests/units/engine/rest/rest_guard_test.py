@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from redant.engine.rest import RestClient, _TokenCache
+from redant.utils.monitoring import metrics
+
+class TokenCache_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.fetched = 0
+    #
+    def fetch(self, expires_in=None, delay=0):
+        def run():
+            time.sleep(delay)
+            self.fetched += 1
+            return 'token-%d' % self.fetched, expires_in
+        return run
+    #
+    def test_single_flight(self):
+        tokens = _TokenCache(self.fetch(delay=0.1))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(tokens.get())) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.fetched, 1)
+        self.assertEqual(results, ['token-1'] * 10)
+    #
+    def test_refreshed_ahead_of_expiry(self):
+        tokens = _TokenCache(self.fetch(expires_in=0.3), refresh_ahead=0.2, min_refresh_delay=0.05)
+        self.assertEqual(tokens.get(), 'token-1')
+        time.sleep(0.25)
+        self.assertEqual(self.fetched, 2)
+        self.assertEqual(tokens.get(), 'token-2')
+        self.assertEqual(self.fetched, 2)
+    #
+    def test_short_lived(self):
+        # refreshed at half of a lifetime shorter than refresh_ahead, not again and again
+        tokens = _TokenCache(self.fetch(expires_in=60))
+        self.assertEqual(tokens.get(), 'token-1')
+        self.assertEqual(tokens._TokenCache__timer.interval, 30)
+        # below min_refresh_delay: fetched again by the callers once expired
+        self.fetched = 0
+        tokens = _TokenCache(self.fetch(expires_in=0.2))
+        self.assertEqual(tokens.get(), 'token-1')
+        time.sleep(0.3)
+        self.assertEqual(self.fetched, 1)
+        self.assertEqual(tokens.get(), 'token-2')
+        #
+        tokens = _TokenCache(self.fetch(expires_in=0.2), min_refresh_delay=0.05)
+        tokens.get()
+        self.assertEqual(tokens._TokenCache__timer.interval, 0.1)
+        tokens._TokenCache__timer.cancel()
+    #
+    def test_failed_fetch(self):
+        # the waiters get the error of the fetch they have waited for
+        def fetch():
+            time.sleep(0.1)
+            raise ValueError('unauthorized')
+        tokens = _TokenCache(fetch)
+        errors = []
+        def get():
+            try:
+                errors.append(tokens.get())
+            except ValueError as err:
+                errors.append(err)
+        threads = [threading.Thread(target=get) for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(errors), 5)
+        self.assertTrue(all(isinstance(err, ValueError) for err in errors))
+    #
+    def test_invalidate(self):
+        tokens = _TokenCache(self.fetch())
+        self.assertEqual(tokens.get(), 'token-1')
+        tokens.invalidate('token-0')
+        self.assertEqual(tokens.get(), 'token-1')
+        tokens.invalidate('token-1')
+        self.assertEqual(tokens.get(), 'token-2')
+
+
+class OAuthHandler(BaseHTTPRequestHandler):
+    #
+    protocol_version = 'HTTP/1.1'
+    #
+    def do_POST(self):
+        self.server.issued += 1
+        self.server.valid_token = 'token-%d' % self.server.issued
+        self.reply(200, dict(access_token=self.server.valid_token, expires_in=3600))
+    #
+    def do_GET(self):
+        if self.headers.get('Authorization') != 'Bearer ' + str(self.server.valid_token):
+            return self.reply(401, dict(error='unauthorized'))
+        self.reply(200, dict(ok=True))
+    #
+    def reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    #
+    def log_message(self, *args):
+        pass
+
+
+class RestGuard_retry_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), OAuthHandler)
+        self.server.issued = 0
+        self.server.valid_token = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = ExampleRestClient('http://127.0.0.1:%d' % self.server.server_port)
+    #
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+    #
+    def test_retry_on_401(self):
+        fetches = metrics.registry.get_sample_value('redant_rest_token_fetch_seconds_count', dict(auth='example', result='ok')) or 0
+        retries = metrics.registry.get_sample_value('redant_rest_retries_total', dict(entrypoint='hello', reason='unauthorized')) or 0
+        #
+        self.assertEqual(self.client.invoke('hello'), dict(ok=True))
+        self.assertEqual(self.server.issued, 1)
+        #
+        # revoked by the server
+        self.server.valid_token = 'another'
+        self.assertEqual(self.client.invoke('hello'), dict(ok=True))
+        self.assertEqual(self.server.issued, 2)
+        self.assertEqual(self.client.invoke('hello'), dict(ok=True))
+        self.assertEqual(self.server.issued, 2)
+        #
+        self.assertEqual(metrics.registry.get_sample_value('redant_rest_token_fetch_seconds_count',
+                dict(auth='example', result='ok')), fetches + 2)
+        self.assertEqual(metrics.registry.get_sample_value('redant_rest_retries_total',
+                dict(entrypoint='hello', reason='unauthorized')), retries + 1)
+
+
+class ExampleRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(ExampleRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return {
+            'entrypoints': {
+                'example': {
+                    'auth_type': 'oauth2',
+                    'url': self.__base_url + '/token',
+                    'method': 'POST'
+                }
+            }
+        }
+    #
+    @property
+    def mappings(self):
+        return {
+            'entrypoints': [
+                {
+                    'name': 'hello',
+                    'url': self.__base_url + '/hello'
+                }
+            ]
+        }
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import os
+import requests
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prometheus_client import CollectorRegistry
+from prometheus_client.multiprocess import MultiProcessCollector
+from redant.engine.rest import RestClient
+from redant.utils.monitoring import metrics
+
+class EchoHandler(BaseHTTPRequestHandler):
+    #
+    protocol_version = 'HTTP/1.1'
+    #
+    def do_POST(self):
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    #
+    def log_message(self, *args):
+        pass
+
+
+def sample(name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+
+class RestInvoker_metrics_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.client = MeasuredRestClient(self.base_url)
+    #
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+    #
+    def test_recorded(self):
+        before = dict(
+            requests=sample('redant_rest_request_duration_seconds_count', entrypoint='echo', method='POST'),
+            ok=sample('redant_rest_responses_total', entrypoint='echo', method='POST', status='200'),
+            unavailable=sample('redant_rest_responses_total', entrypoint='echo', method='POST', status='503'),
+            sent=sample('redant_rest_request_bytes_total', entrypoint='echo'),
+            received=sample('redant_rest_response_bytes_total', entrypoint='echo'),
+            retries=sample('redant_rest_retries_total', entrypoint='echo', reason='503'))
+        #
+        # both attempts are measured
+        self.server.statuses = [503]
+        self.assertEqual(self.client.invoke('echo', dict(hello='world')), dict(hello='world'))
+        #
+        self.assertEqual(sample('redant_rest_request_duration_seconds_count', entrypoint='echo', method='POST'), before['requests'] + 2)
+        self.assertEqual(sample('redant_rest_responses_total', entrypoint='echo', method='POST', status='200'), before['ok'] + 1)
+        self.assertEqual(sample('redant_rest_responses_total', entrypoint='echo', method='POST', status='503'), before['unavailable'] + 1)
+        self.assertEqual(sample('redant_rest_request_bytes_total', entrypoint='echo'), before['sent'] + 36)
+        self.assertEqual(sample('redant_rest_response_bytes_total', entrypoint='echo'), before['received'] + 36)
+        self.assertEqual(sample('redant_rest_retries_total', entrypoint='echo', reason='503'), before['retries'] + 1)
+    #
+    def test_unreachable(self):
+        before = sample('redant_rest_responses_total', entrypoint='unreachable', method='POST', status='ConnectionError')
+        with self.assertRaises(requests.ConnectionError):
+            self.client.invoke('unreachable')
+        self.assertEqual(sample('redant_rest_responses_total', entrypoint='unreachable', method='POST', status='ConnectionError'), before + 1)
+    #
+    def test_multiprocess(self):
+        # the values written by a worker process are collected from the files of PROMETHEUS_MULTIPROC_DIR
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory,
+                    PYTHONPATH=os.pathsep.join(sys.path))
+            subprocess.run([sys.executable, '-c', WORKER, self.base_url], env=env, check=True,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            #
+            registry = CollectorRegistry()
+            MultiProcessCollector(registry, path=directory)
+            self.assertEqual(registry.get_sample_value('redant_rest_responses_total',
+                    dict(entrypoint='echo', method='POST', status='200')), 2)
+            self.assertEqual(registry.get_sample_value('redant_rest_request_duration_seconds_count',
+                    dict(entrypoint='echo', method='POST')), 2)
+            # the pools of the worker, read by a process which has none (the uWSGI master)
+            host = 'http://127.0.0.1:%d' % self.server.server_port
+            self.assertEqual(registry.get_sample_value('redant_rest_pool_requests', dict(host=host)), 2)
+            self.assertEqual(registry.get_sample_value('redant_rest_pool_connections_opened', dict(host=host)), 1)
+
+
+WORKER = '''
+import sys
+from rest_metrics_test import MeasuredRestClient
+client = MeasuredRestClient(sys.argv[1])
+client.invoke('echo', dict())
+client.invoke('echo', dict())
+from redant.engine.rest import _rest_pools
+_rest_pools.refresh()
+'''.replace('rest_metrics_test', __name__)
+
+
+class MeasuredRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(MeasuredRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'entrypoints': [
+                {
+                    'name': 'echo',
+                    'url': self.__base_url + '/echo',
+                    'method': 'POST',
+                    'retry': {
+                        'attempts': 2,
+                        'backoff': 0.01,
+                        'methods': ['POST']
+                    }
+                },
+                {
+                    'name': 'unreachable',
+                    'url': 'http://127.0.0.1:1/unreachable',
+                    'method': 'POST'
+                }
+            ]
+        }
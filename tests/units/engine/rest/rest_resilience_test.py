@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import json
+import requests
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from redant import errors
+from redant.engine.rest import RestClient
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    #
+    protocol_version = 'HTTP/1.1'
+    #
+    def do_GET(self):
+        self.server.calls += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps(dict(status=status)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    #
+    def log_message(self, *args):
+        pass
+
+
+class RestInvoker_resilience_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        self.server.calls = 0
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = ResilientRestClient('http://127.0.0.1:%d' % self.server.server_port)
+    #
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+    #
+    def test_retry(self):
+        self.server.statuses = [503, 502]
+        self.assertEqual(self.client.invoke('retried'), dict(status=200))
+        self.assertEqual(self.server.calls, 3)
+        #
+        self.server.statuses = [503, 503, 503]
+        with self.assertRaises(errors.RestStatusCodeError):
+            self.client.invoke('retried')
+        #
+        self.server.statuses = [404]
+        self.assertEqual(self.client.invoke('retried'), dict(status=404))
+    #
+    def test_retried_responses_closed(self):
+        self.server.statuses = [503, 502]
+        with patch.object(requests.Response, 'close', autospec=True, side_effect=requests.Response.close) as close:
+            self.assertEqual(self.client.invoke('retried'), dict(status=200))
+        self.assertEqual([call.args[0].status_code for call in close.call_args_list], [503, 502])
+    #
+    def test_unreachable(self):
+        with self.assertRaises(errors.RestInvocationError):
+            self.client.invoke('unreachable')
+    #
+    def test_circuit_breaker(self):
+        self.server.statuses = [500, 500]
+        self.assertEqual(self.client.invoke('guarded'), dict(status=500))
+        self.assertEqual(self.client.invoke('guarded'), dict(status=500))
+        # open: failing fast
+        with self.assertRaises(errors.RestInvocationError):
+            self.client.invoke('guarded')
+        self.assertEqual(self.server.calls, 2)
+        #
+        # half-open: a trial call closes it
+        time.sleep(0.25)
+        self.assertEqual(self.client.invoke('guarded'), dict(status=200))
+        self.assertEqual(self.client.invoke('guarded'), dict(status=200))
+        self.assertEqual(self.server.calls, 4)
+    #
+    def test_circuit_reopened(self):
+        self.server.statuses = [500, 500, 500]
+        self.client.invoke('guarded')
+        self.client.invoke('guarded')
+        time.sleep(0.25)
+        self.assertEqual(self.client.invoke('guarded'), dict(status=500))
+        with self.assertRaises(errors.RestInvocationError):
+            self.client.invoke('guarded')
+        self.assertEqual(self.server.calls, 3)
+
+
+class ResilientRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(ResilientRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'entrypoints': [
+                {
+                    'name': 'retried',
+                    'url': self.__base_url + '/retried',
+                    'retry': {
+                        'attempts': 3,
+                        'backoff': 0.01
+                    }
+                },
+                {
+                    'name': 'unreachable',
+                    'url': 'http://127.0.0.1:1/unreachable',
+                    'retry': {
+                        'attempts': 2,
+                        'backoff': 0.01
+                    }
+                },
+                {
+                    'name': 'guarded',
+                    'url': self.__base_url + '/guarded',
+                    'circuit_breaker': {
+                        'failure_threshold': 2,
+                        'recovery_timeout': 0.2
+                    }
+                }
+            ]
+        }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from redant.engine.rest import RestClient, RestSessions, _rest_pools
+from requests.adapters import BaseAdapter
+from redant.utils.monitoring import metrics
+
+class ExampleHandler(BaseHTTPRequestHandler):
+    #
+    protocol_version = 'HTTP/1.1'
+    #
+    def setup(self):
+        # once per accepted connection (the ephemeral ports of the closed ones may be reused)
+        self.server.connections += 1
+        super(ExampleHandler, self).setup()
+    #
+    def do_GET(self):
+        # a body left unread would prefix the next request of the connection
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.paths.append(self.path)
+        time.sleep(self.server.delay)
+        data = dict(path=self.path)
+        if self.path.startswith('/headers'):
+            data = {k.lower(): v for k, v in self.headers.items() if k.lower().startswith('x-') or k.lower() == 'accept'}
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    #
+    def log_message(self, *args):
+        pass
+
+
+class RestServerTestCase(unittest.TestCase):
+    #
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ExampleHandler)
+        self.server.connections = 0
+        self.server.paths = []
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_port
+    #
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RestSessions_test(RestServerTestCase):
+    #
+    def test_keep_alive(self):
+        client = ExampleRestClient(self.base_url)
+        for i in range(5):
+            self.assertEqual(client.invoke('hello'), dict(path='/hello'))
+            self.assertEqual(client.invoke('world'), dict(path='/world'))
+        self.assertEqual(self.server.connections, 1)
+        #
+        host = '127.0.0.1:%d' % self.server.server_port
+        # copied periodically by the thread of the pools
+        _rest_pools.refresh()
+        self.assertEqual(metrics.registry.get_sample_value('redant_rest_pool_requests', dict(host='http://' + host)), 10)
+        self.assertEqual(metrics.registry.get_sample_value('redant_rest_pool_connections_opened', dict(host='http://' + host)), 1)
+        client.close()
+    #
+    def test_without_keep_alive(self):
+        client = ExampleRestClient(self.base_url, session=dict(keep_alive=False))
+        for i in range(3):
+            self.assertEqual(client.invoke('hello'), dict(path='/hello'))
+        self.assertEqual(self.server.connections, 3)
+        client.close()
+    #
+    def test_stats_without_pools(self):
+        sessions = RestSessions()
+        sessions.session(self.base_url).mount('http://', StubAdapter())
+        self.assertEqual(list(sessions.stats()), [])
+        _rest_pools.refresh()
+        sessions.close()
+    #
+    def test_scope(self):
+        sessions = RestSessions(scope='entrypoint')
+        self.assertIsNot(sessions.session(self.base_url + '/a', 'a'), sessions.session(self.base_url + '/b', 'b'))
+        self.assertIs(sessions.session(self.base_url + '/a', 'a'), sessions.session(self.base_url + '/c', 'a'))
+        sessions = RestSessions(scope='host')
+        self.assertIs(sessions.session(self.base_url + '/a', 'a'), sessions.session(self.base_url + '/b', 'b'))
+        self.assertIsNot(sessions.session(self.base_url, 'a'), sessions.session('http://localhost:1', 'a'))
+
+
+class StubAdapter(BaseAdapter):
+    # an adapter without a connection pool
+    def close(self):
+        pass
+
+
+class ExampleRestClient(RestClient):
+    #
+    def __init__(self, base_url, session=None):
+        self.__base_url = base_url
+        self.__session = session or dict()
+        super(ExampleRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'commons': {
+                'session': self.__session
+            },
+            'entrypoints': [
+                {
+                    'name': 'hello',
+                    'url': self.__base_url + '/hello'
+                },
+                {
+                    'name': 'world',
+                    'url': self.__base_url + '/world'
+                }
+            ]
+        }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from redant import errors
+from redant.engine.rest import RestClient
+
+ROWS = [dict(id=i, name='row-%d' % i) for i in range(1000)]
+
+class ReportHandler(BaseHTTPRequestHandler):
+    #
+    def do_GET(self):
+        if self.path == '/ndjson':
+            return self.reply('application/x-ndjson', [json.dumps(row) + '\n' for row in ROWS])
+        if self.path == '/slow':
+            return self.reply('application/json', ['[1, ', 2], delay=0.5)
+        if self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{"error": "not found"}')
+            return
+        self.reply('application/json', ['['] + [', '.join(json.dumps(row) for row in ROWS)] + [']'])
+    #
+    def reply(self, content_type, parts, delay=0):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.end_headers()
+        for part in parts:
+            self.wfile.write(str(part).encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(delay)
+    #
+    def log_message(self, *args):
+        pass
+
+
+class RestInvoker_stream_test(unittest.TestCase):
+    #
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ReportHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = StreamingRestClient('http://127.0.0.1:%d' % self.server.server_port)
+    #
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+    #
+    def test_json_array(self):
+        rows = self.client.invoke('array')
+        self.assertFalse(isinstance(rows, list))
+        self.assertEqual(list(rows), ROWS)
+    #
+    def test_ndjson(self):
+        self.assertEqual(list(self.client.invoke('ndjson')), ROWS)
+    #
+    def test_error_status(self):
+        self.assertEqual(self.client.invoke('missing'), dict(error='not found'))
+    #
+    def test_max_body_size(self):
+        with self.assertRaises(errors.RestProcessingError):
+            list(self.client.invoke('limited'))
+    #
+    def test_read_timeout(self):
+        with self.assertRaises(errors.RestInvocationError):
+            list(self.client.invoke('slow'))
+
+
+class StreamingRestClient(RestClient):
+    #
+    def __init__(self, base_url):
+        self.__base_url = base_url
+        super(StreamingRestClient, self).__init__()
+    #
+    @property
+    def auth_config(self):
+        return None
+    #
+    @property
+    def mappings(self):
+        return {
+            'entrypoints': [
+                dict(name='array', url=self.__base_url + '/array', stream=True),
+                dict(name='ndjson', url=self.__base_url + '/ndjson', stream=True),
+                dict(name='missing', url=self.__base_url + '/missing', stream=True),
+                dict(name='limited', url=self.__base_url + '/array', stream=dict(max_body_size=1024)),
+                dict(name='slow', url=self.__base_url + '/slow', stream=dict(read_timeout=0.1))
+            ]
+        }
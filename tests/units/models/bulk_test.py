@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import logging
+import unittest
+
+from flask import Flask
+from sqlalchemy import event, exc
+from redant import errors
+from redant.models.channels import ChannelEntity
+from redant.models.chatters import ChatterEntity
+from redant.models.conversations import ConversationEntity
+from redant.models.stories import StoryDeltaEntity
+from redant.utils.database import sqldb, sqldb_hook
+
+class BulkTestCase(unittest.TestCase):
+    #
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        sqldb_hook(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ChannelEntity(channel_code='sms', channel_type='sms', timezone='Asia/Ho_Chi_Minh').create()
+        #
+        self.commits = 0
+        self.statements = 0
+        event.listen(sqldb.engine, 'commit', self.on_commit)
+        event.listen(sqldb.engine, 'before_cursor_execute', self.on_execute)
+    #
+    def tearDown(self):
+        event.remove(sqldb.engine, 'commit', self.on_commit)
+        event.remove(sqldb.engine, 'before_cursor_execute', self.on_execute)
+        sqldb.session.remove()
+        sqldb.drop_all()
+        self.ctx.pop()
+        logging.disable(logging.NOTSET)
+    #
+    def on_commit(self, conn):
+        self.commits += 1
+    #
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+
+class ChatterEntity_bulk_test(BulkTestCase):
+    #
+    def test_bulk_create(self):
+        progress = []
+        chatters = (dict(chatter_code='chatter-%d' % i, phone_number='+1%09d' % i) for i in range(25))
+        self.assertEqual(ChatterEntity.bulk_create(chatters, chunk_size=10, progress=progress.append), 25)
+        self.assertEqual(progress, [10, 20, 25])
+        self.assertEqual(self.commits, 3)
+        self.assertEqual(self.statements, 3)
+        self.assertEqual(ChatterEntity.find_by__chatter_code('chatter-7').phone_number, '+1000000007')
+    #
+    def test_bulk_create_existing(self):
+        ChatterEntity(chatter_code='chatter-3').create()
+        with self.assertRaises(exc.IntegrityError):
+            ChatterEntity.bulk_create(dict(chatter_code='chatter-%d' % i) for i in range(10))
+        self.assertEqual(ChatterEntity.query.count(), 1)
+    #
+    def test_bulk_upsert(self):
+        ChatterEntity(chatter_code='chatter-1', phone_number='+10000000', email='one@example.com').create()
+        chatter_id = ChatterEntity.find_by__chatter_code('chatter-1').chatter_id
+        chatters = [
+            dict(chatter_code='chatter-1', first_name='One'),
+            dict(chatter_code='chatter-2', phone_number='+20000000'),
+            dict(chatter_code='chatter-2', phone_number='+30000000'),
+        ]
+        self.assertEqual(ChatterEntity.bulk_upsert(chatters), 3)
+        #
+        chatter = ChatterEntity.find_by__chatter_code('chatter-1')
+        self.assertEqual((chatter.chatter_id, chatter.first_name, chatter.email), (chatter_id, 'One', 'one@example.com'))
+        self.assertEqual(ChatterEntity.find_by__chatter_code('chatter-2').phone_number, '+30000000')
+        self.assertEqual(ChatterEntity.query.count(), 2)
+    #
+    def test_invalid(self):
+        with self.assertRaises(errors.ModelArgumentError):
+            ChatterEntity.bulk_create([dict(phone_number='+10000000')])
+        with self.assertRaises(errors.ModelArgumentError):
+            ChatterEntity.bulk_upsert([dict(chatter_code='chatter-1', banned=True)])
+
+
+class ConversationEntity_bulk_test(BulkTestCase):
+    #
+    def test_bulk_create(self):
+        ChatterEntity(chatter_code='chatter-0').create()
+        self.statements = 0
+        conversations = (dict(channel_code='sms', chatter_code='chatter-%d' % i, state='invited') for i in range(25))
+        self.assertEqual(ConversationEntity.bulk_create(conversations, chunk_size=10), 25)
+        # the load of the channels, then per batch: the lookup and the insert of the chatters, the insert of the conversations
+        self.assertEqual(self.statements, 1 + 3 * 3)
+        self.assertEqual(ChatterEntity.query.count(), 25)
+        #
+        conversation = ConversationEntity.find_by__channel__chatter('sms', 'chatter-0')
+        self.assertEqual(conversation.state, 'invited')
+        self.assertEqual(conversation.timezone, 'Asia/Ho_Chi_Minh')
+        self.assertEqual(conversation.chatter_id, ChatterEntity.find_by__chatter_code('chatter-0').chatter_id)
+        self.assertIsNotNone(conversation.version)
+    #
+    def test_unknown_channel(self):
+        with self.assertRaises(errors.ChannelNotFoundError):
+            ConversationEntity.bulk_create([dict(channel_code='zalo', chatter_code='chatter-1')])
+        self.assertEqual(ChatterEntity.query.count(), 0)
+    #
+    def test_bulk_upsert(self):
+        ConversationEntity('sms', 'chatter-1', state='chatting').create()
+        ConversationEntity('sms', 'chatter-2', state='chatting').create()
+        ConversationEntity.query.filter_by(chatter_code='chatter-2').update(dict(overall_status=-3))
+        sqldb.session.commit()
+        open_one = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        open_id, open_version = open_one.id, open_one.version
+        #
+        conversations = [dict(channel_code='sms', chatter_code='chatter-%d' % i, state='invited') for i in range(1, 4)]
+        self.assertEqual(ConversationEntity.bulk_upsert(conversations), 3)
+        #
+        updated = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        self.assertEqual((updated.id, updated.state), (open_id, 'invited'))
+        self.assertNotEqual(updated.version, open_version)
+        # the latest one is closed: another is created
+        self.assertEqual(ConversationEntity.count_by__channel__chatter('sms', 'chatter-2'), 2)
+        self.assertEqual(ConversationEntity.find_by__channel__chatter('sms', 'chatter-2').state, 'invited')
+        self.assertEqual(ConversationEntity.find_by__channel__chatter('sms', 'chatter-3').state, 'invited')
+    #
+    def test_bulk_upsert_story(self):
+        ConversationEntity('sms', 'chatter-1', state='chatting').create()
+        ConversationEntity('sms', 'chatter-2', state='chatting').create()
+        ids = [ConversationEntity.find_by__channel__chatter('sms', 'chatter-%d' % i).id for i in (1, 2)]
+        for conversation_id in ids:
+            StoryDeltaEntity(conversation_id, 1, '{"set": {"name": "Bob"}}').stage()
+        sqldb.session.commit()
+        #
+        conversations = [
+            dict(channel_code='sms', chatter_code='chatter-1', story='{"name": "Alice"}'),
+            dict(channel_code='sms', chatter_code='chatter-2', state='invited'),
+        ]
+        self.assertEqual(ConversationEntity.bulk_upsert(conversations), 2)
+        # the deltas of the replaced story are deleted, the others are kept
+        self.assertEqual(StoryDeltaEntity.find_all_by__conversation(ids[0]), [])
+        self.assertEqual(len(StoryDeltaEntity.find_all_by__conversation(ids[1])), 1)
+        self.assertEqual(ConversationEntity.find_by__channel__chatter('sms', 'chatter-1').story, '{"name": "Alice"}')
+    #
+    def test_bulk_upsert_pairs(self):
+        # the chatters of a channel are not matched with the conversations of another one
+        ChannelEntity(channel_code='zalo', channel_type='zalo').create()
+        ConversationEntity('sms', 'chatter-2', state='chatting').create()
+        ConversationEntity('zalo', 'chatter-1', state='chatting').create()
+        conversations = [dict(channel_code='sms', chatter_code='chatter-1', state='invited'),
+                dict(channel_code='zalo', chatter_code='chatter-2', state='invited')]
+        self.assertEqual(ConversationEntity.bulk_upsert(conversations), 2)
+        self.assertEqual(ConversationEntity.query.count(), 4)
+        self.assertEqual(ConversationEntity.find_by__channel__chatter('sms', 'chatter-2').state, 'chatting')
+        self.assertEqual(ConversationEntity.find_by__channel__chatter('zalo', 'chatter-1').state, 'chatting')
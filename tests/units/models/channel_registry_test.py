@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import logging
+import time
+import unittest
+
+from flask import Flask
+from sqlalchemy import event
+from redant.engine.adapters import MessagePublisher
+from redant.models.channels import ChannelEntity, ChannelRegistry, channel_registry, channel_registry_hook
+from redant.models.conversations import ConversationEntity
+from redant.utils.database import sqldb, sqldb_hook
+
+class ChannelRegistry_test(unittest.TestCase):
+    #
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        sqldb_hook(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ChannelEntity(channel_code='sms', channel_type='sms', timezone='Asia/Ho_Chi_Minh',
+                settings='{"sender": "RedAnt"}').create()
+        ChannelEntity(channel_code='zalo', channel_type='zalo').create()
+        disabled = ChannelEntity(channel_code='old', channel_type='sms')
+        disabled.enabled = False
+        disabled.create()
+        #
+        self.selects = 0
+        event.listen(sqldb.engine, 'before_cursor_execute', self.on_execute)
+    #
+    def tearDown(self):
+        event.remove(sqldb.engine, 'before_cursor_execute', self.on_execute)
+        sqldb.session.remove()
+        sqldb.drop_all()
+        self.ctx.pop()
+        logging.disable(logging.NOTSET)
+    #
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and 'FROM channels' in statement:
+            self.selects += 1
+    #
+    def test_lookups(self):
+        registry = ChannelRegistry()
+        channel = registry.get('sms')
+        self.assertEqual(channel.channel_type, 'sms')
+        self.assertEqual(channel.settings, dict(sender='RedAnt'))
+        self.assertEqual(channel.tzinfo.zone, 'Asia/Ho_Chi_Minh')
+        self.assertIsNone(registry.get('old'))
+        self.assertEqual([c.channel_code for c in registry.find_all(channel_type='sms')], ['sms'])
+        self.assertEqual(sorted(c.channel_code for c in registry.find_all()), ['sms', 'zalo'])
+        self.assertEqual(self.selects, 1)
+    #
+    def test_invalidate(self):
+        registry = ChannelRegistry(refresh_interval=None)
+        self.assertIsNone(registry.get('messenger'))
+        ChannelEntity(channel_code='messenger', channel_type='messenger').create()
+        self.assertIsNone(registry.get('messenger'))
+        registry.invalidate()
+        self.assertEqual(registry.get('messenger').channel_type, 'messenger')
+        self.assertEqual(self.selects, 2)
+    #
+    def test_refresh_interval(self):
+        registry = ChannelRegistry(refresh_interval=0.1)
+        registry.get('sms')
+        registry.get('sms')
+        self.assertEqual(self.selects, 1)
+        time.sleep(0.15)
+        registry.get('sms')
+        self.assertEqual(self.selects, 2)
+    #
+    def test_shared_registry(self):
+        self.addCleanup(setattr, channel_registry, 'refresh_interval', channel_registry.refresh_interval)
+        self.app.config['REDANT_CHANNELS_REFRESH_INTERVAL'] = 60
+        channel_registry_hook(self.app)
+        self.selects = 0
+        #
+        ConversationEntity('sms', 'chatter-1').create()
+        persist = ConversationEntity.find_by__channel__chatter('sms', 'chatter-1')
+        self.assertEqual(persist.timezone, 'Asia/Ho_Chi_Minh')
+        self.assertEqual(persist.channel_id, channel_registry.get('sms').channel_id)
+        self.assertEqual([c.channel_code for c in ExamplePublisher()._load_channels('zalo')], ['zalo'])
+        self.assertEqual(self.selects, 0)
+
+
+class ExamplePublisher(MessagePublisher):
+    #
+    channel_type = 'zalo'
+    #
+    def push(self, message, to_, from_, options=dict()):
+        pass
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+from flask import Flask
+from sqlalchemy import event, exc
+from redant.models.channels import ChannelEntity
+from redant.models.chatters import ChatterEntity
+from redant.models.conversations import ConversationEntity
+from redant.utils.database import sqldb, sqldb_hook
+
+class ChatterEntity_upsert_test(unittest.TestCase):
+    #
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        # a file, shared by the connections of the threads
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory.name, 'redant.db')
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        sqldb_hook(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        ChannelEntity(channel_code='sms', channel_type='sms').create()
+        #
+        self.commits = 0
+        event.listen(sqldb.engine, 'commit', self.on_commit)
+    #
+    def tearDown(self):
+        event.remove(sqldb.engine, 'commit', self.on_commit)
+        sqldb.session.remove()
+        sqldb.drop_all()
+        self.ctx.pop()
+        sqldb.get_engine(self.app).dispose()
+        self.directory.cleanup()
+        logging.disable(logging.NOTSET)
+    #
+    def on_commit(self, conn):
+        self.commits += 1
+    #
+    def test_upsert(self):
+        chatter_id = ChatterEntity.upsert_by__chatter_code('chatter-1', phone_number='+10000000')
+        self.assertEqual(ChatterEntity.upsert_by__chatter_code('chatter-1', phone_number='+20000000'), chatter_id)
+        sqldb.session.commit()
+        chatter = ChatterEntity.find_by__chatter_code('chatter-1')
+        self.assertEqual(chatter.chatter_id, chatter_id)
+        self.assertEqual(chatter.phone_number, '+10000000')
+    #
+    def test_unique_chatter_code(self):
+        ChatterEntity(chatter_code='chatter-1').create()
+        with self.assertRaises(exc.IntegrityError):
+            ChatterEntity(chatter_code='chatter-1').create()
+        sqldb.session.rollback()
+    #
+    def test_create_in_one_transaction(self):
+        self.commits = 0
+        conversation = ConversationEntity('sms', 'chatter-1', phone_number='+10000000').create()
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(conversation.chatter_id, ChatterEntity.find_by__chatter_code('chatter-1').chatter_id)
+    #
+    def test_rolled_back(self):
+        with self.assertRaises(Exception):
+            # state is not nullable
+            ConversationEntity('sms', 'chatter-1', state=None).create()
+        self.assertIsNone(ChatterEntity.find_by__chatter_code('chatter-1'))
+    #
+    def test_concurrent_first_messages(self):
+        # both threads look the chatter up before any of them inserts it
+        barrier = threading.Barrier(2, timeout=5)
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO chatters'):
+                barrier.wait()
+        event.listen(sqldb.engine, 'before_cursor_execute', on_execute)
+        self.addCleanup(event.remove, sqldb.engine, 'before_cursor_execute', on_execute)
+        #
+        chatter_ids, failures = [], []
+        def first_message():
+            with self.app.app_context():
+                try:
+                    chatter_ids.append(ConversationEntity('sms', 'chatter-1').create().chatter_id)
+                except Exception as exception:
+                    failures.append(exception)
+                finally:
+                    sqldb.session.remove()
+        threads = [threading.Thread(target=first_message) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        #
+        self.assertEqual(failures, [])
+        self.assertEqual(len(set(chatter_ids)), 1)
+        self.assertEqual(ChatterEntity.query.filter_by(chatter_code='chatter-1').count(), 1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import logging
+import unittest
+
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import event
+from redant import errors
+from redant.models.channels import ChannelEntity
+from redant.models.chatters import ChatterEntity
+from redant.models.conversations import ConversationEntity
+from redant.utils.database import sqldb, sqldb_hook
+
+STATES = ['welcome', 'waiting_for_name', 'done']
+
+class KeysetTestCase(unittest.TestCase):
+    #
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        sqldb_hook(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.seed()
+        #
+        self.selects = 0
+        event.listen(sqldb.engine, 'before_cursor_execute', self.on_execute)
+    #
+    def tearDown(self):
+        event.remove(sqldb.engine, 'before_cursor_execute', self.on_execute)
+        sqldb.session.remove()
+        sqldb.drop_all()
+        self.ctx.pop()
+        logging.disable(logging.NOTSET)
+    #
+    def seed(self, chatters=30):
+        now = datetime.utcnow()
+        for code in ['sms', 'zalo']:
+            sqldb.session.add(ChannelEntity(channel_code=code, channel_type=code))
+        messenger = ChannelEntity(channel_code='messenger', channel_type='messenger')
+        messenger.enabled = False
+        sqldb.session.add(messenger)
+        for i in range(chatters):
+            sqldb.session.add(ChatterEntity(chatter_code='chatter-%d' % i))
+            for j, channel_code in enumerate(['sms', 'zalo']):
+                conversation = ConversationEntity(channel_code, 'chatter-%d' % i, state=STATES[(i + j) % len(STATES)])
+                conversation.id = 'conversation-%02d-%d' % (i, j)
+                conversation.timezone = 'UTC'
+                # the same creation_time for a few of them, told apart by the id
+                conversation.creation_time = now - timedelta(minutes=i // 4)
+                sqldb.session.add(conversation)
+        sqldb.session.commit()
+    #
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT'):
+            self.selects += 1
+
+
+class ConversationEntity_iter_all_by_test(KeysetTestCase):
+    #
+    def assertSameAs(self, **kwargs):
+        expected = [conversation.id for conversation in ConversationEntity.find_all_by(**kwargs)]
+        self.selects = 0
+        ids = [conversation.id for conversation in ConversationEntity.iter_all_by(batch_size=7, **kwargs)]
+        self.assertEqual(ids, expected)
+        # a last batch that is not full ends the iteration
+        self.assertEqual(self.selects, len(ids) // 7 + 1)
+        return ids
+    #
+    def test_ok(self):
+        self.assertEqual(len(self.assertSameAs()), 60)
+        self.assertEqual(len(self.assertSameAs(state='done')), 20)
+        self.assertEqual(len(self.assertSameAs(channel_code='sms', state=['welcome', 'done'])), 20)
+    #
+    def test_closed(self):
+        ConversationEntity.query.filter_by(channel_code='zalo').update(dict(overall_status=-3))
+        sqldb.session.commit()
+        self.assertEqual(len(self.assertSameAs()), 30)
+    #
+    def test_lazy(self):
+        rows = ConversationEntity.iter_all_by(batch_size=7)
+        self.assertEqual(self.selects, 0)
+        next(rows)
+        self.assertEqual(self.selects, 1)
+    #
+    def test_columns(self):
+        rows = list(ConversationEntity.iter_all_by(state='done', batch_size=7, columns=['state', 'chatter_code']))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(set(row.state for row in rows), {'done'})
+        self.assertEqual(rows[0]._fields, ('state', 'chatter_code', 'creation_time', 'id'))
+        self.assertEqual([row.id for row in rows], [conversation.id for conversation in ConversationEntity.find_all_by(state='done')])
+    #
+    def test_invalid(self):
+        with self.assertRaises(errors.ModelArgumentError):
+            ConversationEntity.iter_all_by(columns=['state', 'password'])
+
+
+class ChannelEntity_iter_all_test(KeysetTestCase):
+    #
+    def test_ok(self):
+        self.assertEqual(sorted(channel.channel_code for channel in ChannelEntity.iter_all(batch_size=1)), ['sms', 'zalo'])
+        self.assertEqual([channel.channel_code for channel in ChannelEntity.iter_all(enabled=False)], ['messenger'])
+        self.assertEqual(len(list(ChannelEntity.iter_all(enabled=None))), 3)
+        self.assertEqual([channel.channel_code for channel in ChannelEntity.iter_all(channel_type='zalo')], ['zalo'])
+    #
+    def test_columns(self):
+        rows = list(ChannelEntity.iter_all(columns=['channel_code']))
+        self.assertEqual(rows[0]._fields, ('channel_code', 'channel_id'))
+        with self.assertRaises(errors.ModelArgumentError):
+            ChannelEntity.iter_all(columns=['secret'])
+
+
+class ChatterEntity_iter_all_test(KeysetTestCase):
+    #
+    def test_ok(self):
+        self.selects = 0
+        chatter_ids = [chatter.chatter_id for chatter in ChatterEntity.iter_all(batch_size=4)]
+        self.assertEqual(chatter_ids, sorted(chatter_ids))
+        self.assertEqual(len(set(chatter_ids)), 30)
+        self.assertEqual(self.selects, 30 // 4 + 1)
+    #
+    def test_columns(self):
+        rows = list(ChatterEntity.iter_all(batch_size=4, columns=['chatter_code']))
+        self.assertEqual(sorted(row.chatter_code for row in rows), sorted('chatter-%d' % i for i in range(30)))
+        self.assertEqual(rows[0]._fields, ('chatter_code', 'chatter_id'))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+
+from redant.utils.cache_util import LRUCache
+
+class LRUCache_test(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_lru(self):
+        c = LRUCache(max_size=2)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(c.get('a'), 1)
+        c.put('c', 3)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.get('a'), 1)
+        self.assertEqual(c.pop('c'), 3)
+        self.assertIsNone(c.get('c'))
+        self.assertEqual(len(c), 1)
+
+    @patch('redant.utils.cache_util.time.monotonic')
+    def test_ttl(self, monotonic):
+        c = LRUCache(max_size=2, ttl=10)
+        monotonic.return_value = 100
+        c.put('a', 1)
+        monotonic.return_value = 109
+        self.assertEqual(c.get('a'), 1)
+        monotonic.return_value = 110
+        self.assertEqual(c.get('a', 'expired'), 'expired')
+        self.assertEqual(len(c), 0)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+
+from redant.utils.counter_util import SlidingWindowCounter
+
+class SlidingWindowCounter_test(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    @patch('redant.utils.counter_util.time.time')
+    def test_window(self, now):
+        c = SlidingWindowCounter(window=3600, resolution=60)
+        now.return_value = 10000
+        c.add('a')
+        now.return_value = 10000 + 1800
+        c.add('a')
+        c.add('b', amount=2)
+        self.assertEqual(c.count('a'), 2)
+        self.assertEqual(c.count('a', 600), 1)
+        self.assertEqual(c.count('b'), 2)
+        self.assertEqual(c.count('c'), 0)
+        #
+        now.return_value = 10000 + 3700
+        self.assertEqual(c.count('a'), 1)
+        now.return_value = 10000 + 1800 + 3700
+        self.assertEqual(c.count('a'), 0)
+        #
+        # the slot of an old bucket is reused
+        c.add('a')
+        self.assertEqual(c.count('a'), 1)
+
+    @patch('redant.utils.counter_util.time.time')
+    def test_max_keys(self, now):
+        now.return_value = 10000
+        c = SlidingWindowCounter(window=3600, resolution=60, max_keys=2)
+        c.add('a')
+        c.add('b')
+        c.add('c')
+        self.assertEqual(len(c), 2)
+        self.assertIsNone(c.count('a'))
+        self.assertEqual(c.count('c'), 1)
+        now.return_value = 10000 + 3601
+        self.assertEqual(c.count('a'), 0)
+
+    @patch('redant.utils.counter_util.time.time')
+    def test_rebuild(self, now):
+        now.return_value = 10000
+        c = SlidingWindowCounter(window=3600, resolution=60)
+        c.add('z')
+        c.rebuild([('a', 9000), ('a', 9500), ('b', 5000)])
+        self.assertEqual(c.count('a'), 2)
+        self.assertEqual(c.count('b'), 0)
+        self.assertEqual(c.count('z'), 0)
+
+    @patch('redant.utils.counter_util.time.time')
+    def test_sparse(self, now):
+        now.return_value = 100000
+        c = SlidingWindowCounter(window=3600*24, resolution=60)
+        c.add('a')
+        # only the buckets holding events are kept
+        self.assertEqual(len(c._SlidingWindowCounter__rings['a'].buckets), 1)
+        # a late event is put in its place, one out of the window is dropped
+        c.add('a', when=100000 - 600)
+        c.add('a', when=100000 - 3600*24 - 60)
+        self.assertEqual([slot for slot, amount in c._SlidingWindowCounter__rings['a'].buckets],
+                [(100000 - 600) // 60, 100000 // 60])
+        self.assertEqual(c.count('a'), 2)
+        self.assertEqual(c.count('a', 300), 1)
+        now.return_value = 100000 + 3600*24 - 300
+        self.assertEqual(c.count('a'), 1)
+        self.assertEqual(len(c._SlidingWindowCounter__rings['a'].buckets), 1)
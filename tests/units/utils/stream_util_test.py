@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import json
+import unittest
+
+from redant.utils.stream_util import decode_chunks, iter_json_array, iter_ndjson, limit_size
+
+def split(text, size):
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class iter_json_array_test(unittest.TestCase):
+
+    def setUp(self):
+        self.elements = [1, 23, -4.5e3, 'a, b]', {'k': [1, {'x': 'é'}]}, None, True, [], {}]
+
+    def test_chunked(self):
+        text = ' [ ' + ' , '.join(json.dumps(e, ensure_ascii=False) for e in self.elements) + ' ]\n'
+        for size in [1, 2, 3, 7, 1000]:
+            self.assertEqual(list(iter_json_array(decode_chunks(split(text, size)))), self.elements)
+
+    def test_empty(self):
+        self.assertEqual(list(iter_json_array(decode_chunks(split(' [ ] ', 1)))), [])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['{"a": 1}']))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['[1, 2', ', 3']))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['[1 2]']))
+
+
+class iter_ndjson_test(unittest.TestCase):
+
+    def test_chunked(self):
+        text = '{"a": 1}\n\n{"b": "é"}\n3'
+        for size in [1, 4, 100]:
+            self.assertEqual(list(iter_ndjson(decode_chunks(split(text, size)))), [{'a': 1}, {'b': 'é'}, 3])
+
+
+class limit_size_test(unittest.TestCase):
+
+    def test_limit(self):
+        self.assertEqual(list(limit_size([b'ab', b'cd'], 4)), [b'ab', b'cd'])
+        with self.assertRaises(OverflowError):
+            list(limit_size([b'ab', b'cd', b'e'], 4, OverflowError))